@@ -1,7 +1,16 @@
-from rest_framework.serializers import ModelSerializer
-from base.models import Room
+from rest_framework.serializers import CharField, ModelSerializer
+from base.models import Message, Room
 
 class RoomSerializer(ModelSerializer):
     class Meta:
         model = Room
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class ActivitySerializer(ModelSerializer):
+    username = CharField(source='user.username')
+    room_name = CharField(source='room.name')
+
+    class Meta:
+        model = Message
+        fields = ['id', 'body', 'created', 'user', 'username', 'room', 'room_name']
@@ -5,4 +5,5 @@ urlpatterns = [
     path('', views.getRoutes),
     path('rooms/', views.getRooms),    
     path('rooms/<str:pk>', views.getRoom),
+    path('activity/', views.getActivity),
 ]
\ No newline at end of file
@@ -1,7 +1,12 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from base.models import Room
-from .serializers import RoomSerializer
+from base.models import Message, Room
+from base.pagination import page_before
+from base.search import search_messages
+from .serializers import ActivitySerializer, RoomSerializer
+
+ACTIVITY_PAGE_SIZE = 30
+ACTIVITY_MAX_PAGE_SIZE = 100
 
 
 @api_view(['GET'])
@@ -9,7 +14,8 @@ def getRoutes(request):
     routes = [
         'GET /api',
         'GET /api/rooms',
-        'GET /api/rooms/:id'
+        'GET /api/rooms/:id',
+        'GET /api/activity?before=:cursor&limit=:n&q=:query'
     ]
     return Response(routes)
 
@@ -24,4 +30,19 @@ def getRooms(request):
 def getRoom(request, pk):
     room = Room.objects.get(id=pk)
     serializer = RoomSerializer(room, many=False)
-    return Response(serializer.data)
\ No newline at end of file
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+def getActivity(request):
+    try:
+        limit = min(int(request.GET.get('limit', ACTIVITY_PAGE_SIZE)), ACTIVITY_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = ACTIVITY_PAGE_SIZE
+    messages, next_cursor = page_before(
+        search_messages(Message.objects.for_activity(), request.GET.get('q', '')),
+        cursor=request.GET.get('before'),
+        limit=max(limit, 1),
+    )
+    serializer = ActivitySerializer(messages, many=True)
+    return Response({'results': serializer.data, 'next_cursor': next_cursor})
@@ -0,0 +1,350 @@
+"""
+A channel layer shared by every worker process on one host.
+
+InMemoryChannelLayer only reaches consumers of its own process, so with more
+than one daphne worker a group_send from one never arrives at the sockets
+held by another. SQLiteChannelLayer keeps queued messages and group
+memberships in one SQLite database (WAL mode) that all workers open, and
+rings the receiving process through a Unix datagram socket, so delivery does
+not wait for a poll.
+
+Each layer instance (one per process) has a process id, and the channels it
+hands out are named ``specific.<process id>!<random>``. A group_send writes
+one row per receiving process, listing that process's member channels,
+rather than one per channel. A single reader task per process takes every
+row addressed to it with one query and fans the messages out to per-channel
+queues, which are where `capacity` applies to group messages. The socket is
+only a doorbell: a lost wakeup is covered by polling every `poll_interval`
+seconds, and a doorbell that no longer exists means its process is gone, so
+its channels leave their groups.
+
+Options, besides BaseChannelLayer's `expiry`, `capacity` and
+`channel_capacity`: the database `path`, `group_expiry` in seconds,
+`poll_interval` in seconds and `socket_dir` for the doorbells (next to the
+database by default). Messages must be JSON-serializable.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    process TEXT NOT NULL,
+    channels TEXT NOT NULL,  -- comma-separated; names cannot hold commas
+    expires REAL NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channels ON messages (channels, id);
+CREATE INDEX IF NOT EXISTS messages_process ON messages (process, id);
+CREATE TABLE IF NOT EXISTS group_members (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+);
+"""
+READ_BATCH = 500
+CLEANUP_INTERVAL = 30
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path='channels.sqlite3', expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, poll_interval=1.0, socket_dir=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = str(path)
+        self.socket_dir = str(socket_dir or f'{self.path}.sockets')
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.process_id = uuid.uuid4().hex[:12]
+        self._local = threading.local()
+        self._loop = None
+        self._reader = None
+        self._doorbell = None
+        self._queues = {}
+        self._waiting = set()
+        self._last_cleanup = 0
+        self._last_prune = 0
+
+    # Database work, run off the event loop
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    @staticmethod
+    def _process_of(channel):
+        # specific.<process id>!<random>
+        if '!' not in channel:
+            return ''
+        return channel[:channel.index('!')].rsplit('.', 1)[-1]
+
+    def _enqueue(self, body, channel=None, group=None):
+        """Queue `body` on a channel or on every member of a group"""
+        db = self._connection()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if group is None:
+                members = [channel]
+            else:
+                members = [row[0] for row in db.execute(
+                    'SELECT channel FROM group_members WHERE group_name = ? AND expires > ?', (group, now)
+                )]
+            by_process = {}
+            rows = []
+            for target in members:
+                process = self._process_of(target)
+                if process and group is not None:
+                    by_process.setdefault(process, []).append(target)
+                    continue
+                queued = db.execute(
+                    'SELECT COUNT(*) FROM messages WHERE channels = ? AND expires > ?', (target, now)
+                ).fetchone()[0]
+                if queued >= self.get_capacity(target):
+                    if group is None:
+                        raise ChannelFull(target)
+                    continue  # a full member does not stop the rest of the group
+                rows.append((process, target, now + self.expiry, body))
+            rows += [(process, ','.join(targets), now + self.expiry, body) for process, targets in by_process.items()]
+            db.executemany('INSERT INTO messages (process, channels, expires, body) VALUES (?, ?, ?, ?)', rows)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._ring({row[0] for row in rows if row[0]})
+
+    def _ring(self, processes):
+        sender = getattr(self._local, 'sender', None)
+        if sender is None:
+            sender = self._local.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sender.setblocking(False)
+        for process in processes:
+            try:
+                sender.sendto(b'\0', os.path.join(self.socket_dir, process))
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The process exited without leaving its groups
+                self._connection().execute(
+                    'DELETE FROM group_members WHERE channel LIKE ?',
+                    (f'%.{process}!%',),
+                )
+            except OSError:
+                pass  # a wakeup is already pending
+
+    def _take_for_process(self):
+        """Remove and return ``(channels, expires, body)`` of the rows for this process"""
+        db = self._connection()
+        rows = db.execute(
+            'SELECT id, channels, expires, body FROM messages WHERE process = ? ORDER BY id LIMIT ?',
+            (self.process_id, READ_BATCH),
+        ).fetchall()
+        # Only this process reads its rows, and ids grow in commit order
+        if rows:
+            db.execute('DELETE FROM messages WHERE process = ? AND id <= ?', (self.process_id, rows[-1][0]))
+        self._cleanup(db)
+        return [row[1:] for row in rows]
+
+    def _take_for_channel(self, channel):
+        db = self._connection()
+        return db.execute(
+            "DELETE FROM messages WHERE id = (SELECT id FROM messages WHERE channels = ? AND process = '' "
+            'AND expires > ? ORDER BY id LIMIT 1) RETURNING body',
+            (channel, time.time()),
+        ).fetchone()
+
+    def _cleanup(self, db):
+        now = time.time()
+        if now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM group_members WHERE expires <= ?', (now,))
+            db.execute('DELETE FROM messages WHERE expires <= ?', (now,))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    # Reader of this process's messages
+
+    def _start_reader(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # First receive, or a new event loop; queues of the old loop are unusable
+        self._stop_reader()
+        os.makedirs(self.socket_dir, exist_ok=True)
+        path = os.path.join(self.socket_dir, self.process_id)
+        if os.path.exists(path):
+            os.remove(path)
+        self._doorbell = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._doorbell.bind(path)
+        self._doorbell.setblocking(False)
+        self._loop = loop
+        self._queues = {}
+        self._reader = loop.create_task(self._read())
+
+    def _stop_reader(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._doorbell is not None:
+            self._doorbell.close()
+            try:
+                os.remove(os.path.join(self.socket_dir, self.process_id))
+            except OSError:
+                pass
+        self._loop = self._reader = self._doorbell = None
+
+    async def _read(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(loop.sock_recv(self._doorbell, 16), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            while True:
+                try:
+                    self._doorbell.recv(16)
+                except BlockingIOError:
+                    break
+            try:
+                rows = await self._run(self._take_for_process)
+                while rows:
+                    self._dispatch(rows)
+                    rows = await self._run(self._take_for_process) if len(rows) == READ_BATCH else None
+                abandoned = self._prune() if time.monotonic() - self._last_prune >= 1 else None
+                if abandoned:
+                    await self._run(self._leave_groups, abandoned)
+            except sqlite3.Error:
+                logger.exception('[ChannelLayer] Reading messages failed')
+                await asyncio.sleep(self.poll_interval)
+
+    def _dispatch(self, rows):
+        now = time.time()
+        for channels, expires, body in rows:
+            if expires <= now:
+                continue
+            for channel in channels.split(','):
+                queue = self._queues.setdefault(channel, asyncio.Queue(maxsize=self.get_capacity(channel)))
+                try:
+                    # Decoded per channel, so consumers never share a dict
+                    queue.put_nowait((expires, json.loads(body)))
+                except asyncio.QueueFull:
+                    logger.warning('[ChannelLayer] Dropped a message for full channel %s', channel)
+
+    def _prune(self):
+        """Drop expired messages; returns channels nobody received them on"""
+        self._last_prune = time.monotonic()
+        now = time.time()
+        abandoned = []
+        for channel, queue in list(self._queues.items()):
+            expired = False
+            while not queue.empty() and queue._queue[0][0] <= now:
+                queue.get_nowait()
+                expired = True
+            if queue.empty() and channel not in self._waiting:
+                del self._queues[channel]
+                if expired:
+                    abandoned.append(channel)
+        return abandoned
+
+    def _leave_groups(self, channels):
+        # Like InMemoryChannelLayer, a channel whose messages expire unread leaves its groups
+        self._connection().executemany('DELETE FROM group_members WHERE channel = ?', [(c,) for c in channels])
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert '__asgi_channel__' not in message
+        self.require_valid_channel_name(channel)
+        await self._run(self._enqueue, json.dumps(message), channel)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if self._process_of(channel) != self.process_id:
+            return await self._receive_polling(channel)
+
+        self._start_reader()
+        queue = self._queues.setdefault(channel, asyncio.Queue(maxsize=self.get_capacity(channel)))
+        self._waiting.add(channel)
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires > time.time():
+                    return message
+        finally:
+            self._waiting.discard(channel)
+            if queue.empty():
+                self._queues.pop(channel, None)
+
+    async def _receive_polling(self, channel):
+        # Channels not created by this process have no doorbell
+        delay = 0.01
+        while True:
+            row = await self._run(self._take_for_channel, channel)
+            if row:
+                return json.loads(row[0])
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+
+    async def new_channel(self, prefix='specific'):
+        # The doorbell must exist before the channel joins a group, or senders take the process for dead
+        self._start_reader()
+        return f'{prefix}.{self.process_id}!{uuid.uuid4().hex[:12]}'
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._run(self._execute, (
+            'INSERT OR REPLACE INTO group_members (group_name, channel, expires) VALUES (?, ?, ?)',
+            (group, channel, time.time() + self.group_expiry),
+        ))
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._run(self._execute, (
+            'DELETE FROM group_members WHERE group_name = ? AND channel = ?', (group, channel),
+        ))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_group_name(group)
+        await self._run(self._enqueue, json.dumps(message), None, group)
+
+    def _execute(self, *statements):
+        db = self._connection()
+        for sql, params in statements:
+            db.execute(sql, params)
+
+    async def flush(self):
+        await self._run(self._execute, ('DELETE FROM messages', ()), ('DELETE FROM group_members', ()))
+        self._queues = {}
+
+    async def close(self):
+        self._stop_reader()
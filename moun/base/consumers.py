@@ -1,12 +1,25 @@
+import asyncio
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 import logging
 
+from .follow_graph import follow_graph
+from .membership import participant_ids
+from .messaging import fanout, store_direct_message
+from .presence import mutual_presence, online_registry, presence_buffer
+
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# Unread changes arriving within this many seconds go out as one frame
+UNREAD_PUSH_DELAY = 0.25
+# Deltas are trusted for this long before the count is re-read from the database
+UNREAD_RESYNC_INTERVAL = 60
+
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
@@ -26,13 +39,21 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             await self.accept()
             logger.info(f"[WebSocket] ✅ Connected - User: {self.user.username} (ID: {self.user.id})")
             
-            # Send initial unread count
-            unread_count = await self.get_unread_count()
+            # Send initial unread count; later events carry deltas onto it
+            self.unread_push = None
+            self.unread_sent = None
+            await self.sync_unread_count()
+            await self.send_unread_count()
+            logger.info(f"[WebSocket] Sent initial count: {self.unread_count}")
+
+            # Presence: tell mutual followers we came online, then send our snapshot
+            self.mutual_ids = await self.get_mutual_follow_ids()
+            if await sync_to_async(online_registry.connect)(self.user.id):
+                await self.broadcast_presence(True)
             await self.send(text_data=json.dumps({
-                'type': 'unread_count',
-                'count': unread_count
+                'type': 'presence_snapshot',
+                'users': await self.get_mutual_presence()
             }))
-            logger.info(f"[WebSocket] Sent initial count: {unread_count}")
         else:
             logger.warning(f"[WebSocket] ❌ Rejected - User not authenticated")
             await self.close()
@@ -45,27 +66,91 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 self.user_group_name,
                 self.channel_name
             )
+            if getattr(self, 'unread_push', None):
+                self.unread_push.cancel()
+            if hasattr(self, 'mutual_ids') and await sync_to_async(online_registry.disconnect)(self.user.id):
+                await self.broadcast_presence(False)
 
-    # Receive message from WebSocket (not needed for now, but good to have)
+    # Receive message from WebSocket
     async def receive(self, text_data):
-        pass
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            return
+        if data.get('type') == 'heartbeat':
+            await self.record_heartbeat()
+
+    async def broadcast_presence(self, is_online):
+        """Push an online/offline diff to each mutual follower's notification group"""
+        for user_id in self.mutual_ids:
+            await self.channel_layer.group_send(
+                f'user_{user_id}',
+                {
+                    'type': 'presence_update',
+                    'user_id': self.user.id,
+                    'is_online': is_online,
+                }
+            )
+
+    # Handler for presence_update event from group
+    async def presence_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'user_id': event['user_id'],
+            'is_online': event['is_online']
+        }))
 
     # Handler for new_message event from group
     async def new_message(self, event):
-        # Send unread count to WebSocket
-        unread_count = await self.get_unread_count()
+        self.adjust_unread_count(event.get('delta', 1))
+
+    # Handler for unread_changed event from group (messages read or deleted)
+    async def unread_changed(self, event):
+        self.adjust_unread_count(event['delta'])
+
+    def adjust_unread_count(self, delta):
+        """Apply `delta` and push the total once the burst it belongs to settles"""
+        self.unread_count = max(self.unread_count + delta, 0)
+        if self.unread_push is None:
+            self.unread_push = asyncio.ensure_future(self.push_unread_count())
+
+    async def push_unread_count(self):
+        await asyncio.sleep(UNREAD_PUSH_DELAY)
+        self.unread_push = None
+        if time.monotonic() - self.unread_synced > UNREAD_RESYNC_INTERVAL:
+            await self.sync_unread_count()
+        if self.unread_count != self.unread_sent:
+            await self.send_unread_count()
+
+    async def sync_unread_count(self):
+        self.unread_count = await self.get_unread_count()
+        self.unread_synced = time.monotonic()
+
+    async def send_unread_count(self):
+        self.unread_sent = self.unread_count
         await self.send(text_data=json.dumps({
             'type': 'unread_count',
-            'count': unread_count
+            'count': self.unread_count
         }))
 
     @database_sync_to_async
     def get_unread_count(self):
-        from base.models import DirectMessage
-        return DirectMessage.objects.filter(
-            conversation__participants=self.user,
-            is_read=False
-        ).exclude(sender=self.user).count()
+        return User.objects.filter(id=self.user.id).values_list(
+            'unread_messages_count', flat=True
+        ).first() or 0
+
+    @database_sync_to_async
+    def get_mutual_follow_ids(self):
+        return follow_graph.mutuals_of(self.user.id)
+
+    @database_sync_to_async
+    def get_mutual_presence(self):
+        return mutual_presence(self.user)
+
+    @database_sync_to_async
+    def record_heartbeat(self):
+        presence_buffer.record(self.user.id)
+        online_registry.touch(self.user.id)
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -105,7 +190,51 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     # Receive message from WebSocket
     async def receive(self, text_data):
-        pass
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            return
+        if data.get('type') == 'send_message':
+            await self.send_direct_message(data)
+
+    async def send_direct_message(self, data):
+        """
+        Store a message sent over the socket, acknowledge it to the sender and
+        fan it out. A resent `client_id` is acknowledged again but not stored
+        or broadcast twice.
+        """
+        client_id = data.get('client_id')
+        body = data.get('body')
+        if not isinstance(client_id, str) or not 0 < len(client_id) <= 64:
+            await self.send(text_data=json.dumps({'type': 'error', 'client_id': None, 'error': 'Invalid client_id'}))
+            return
+        if not isinstance(body, str) or not body.strip():
+            await self.send(text_data=json.dumps({'type': 'error', 'client_id': client_id, 'error': 'Message body is required'}))
+            return
+
+        # Re-checked per send so a participant removed after connecting cannot
+        # keep posting and members added since are notified; the set is cached
+        members = await self.get_participant_ids()
+        if self.user.id not in members:
+            await self.send(text_data=json.dumps({'type': 'error', 'client_id': client_id, 'error': 'You do not have access to this conversation'}))
+            await self.close()
+            return
+
+        message_data, created = await store_direct_message(
+            self.conversation_id, self.user,
+            client_id=client_id, reply_to_id=data.get('reply_to_id'), body=body.strip()
+        )
+        ack = self.send(text_data=json.dumps({
+            'type': 'ack',
+            'client_id': client_id,
+            'duplicate': not created,
+            'message': message_data
+        }))
+        if not created:
+            await ack
+            return
+        await asyncio.gather(ack, fanout(self.conversation_id, message_data, members - {self.user.id}, self.channel_layer))
+        await self.mark_thread_read()
 
     # Handler for chat_message event from group
     async def chat_message(self, event):
@@ -116,11 +245,24 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
         logger.info(f"[ChatWebSocket] Sent message to {self.user.username}")
 
+    # Handler for media_ready event from group (variants built by base.tasks)
+    async def media_ready(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'media_ready',
+            'message': event['message']
+        }))
+
     @database_sync_to_async
     def check_participant(self):
-        from base.models import Conversation
-        try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return self.user in conversation.participants.all()
-        except Conversation.DoesNotExist:
-            return False
+        return self.user.id in participant_ids(self.conversation_id)
+
+    @database_sync_to_async
+    def get_participant_ids(self):
+        return participant_ids(self.conversation_id)
+
+    @database_sync_to_async
+    def mark_thread_read(self):
+        from base.models import DirectMessage
+
+        # Replying means the sender has read the thread
+        DirectMessage.objects.filter(conversation_id=self.conversation_id).mark_read_for(self.user)
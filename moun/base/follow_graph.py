@@ -0,0 +1,86 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'follow_graph:version:{}'
+
+
+def _contains(ids, user_id):
+    i = bisect_left(ids, user_id)
+    return i < len(ids) and ids[i] == user_id
+
+
+class FollowGraph:
+    """
+    Per-worker cache of the follow graph for recently active users.
+
+    Each cached user holds two sorted ``array('q')`` adjacency lists: who
+    they follow and which of those follow back. Lookups are a binary search
+    with no database query. Every user has a version counter in the Django
+    cache; Follow signals bump it for both ends of a changed edge, and a
+    worker reloads a user whose cached version no longer matches. The
+    counter only reaches other workers through a shared cache backend, so
+    entries are also reloaded once they are `ttl` seconds old, which bounds
+    how stale another worker's copy can get.
+    """
+
+    def __init__(self, max_users=None, ttl=None):
+        self.max_users = max_users or getattr(settings, 'FOLLOW_GRAPH_MAX_USERS', 10000)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'FOLLOW_GRAPH_TTL', 30)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (version, loaded_at, following, mutuals)
+
+    def _entry(self, user_id):
+        version = cache.get(VERSION_KEY.format(user_id), 0)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return entry
+
+        from .models import Follow
+
+        rows = sorted(
+            Follow.objects.filter(follower_id=user_id).values_list('followed_id', 'is_mutual')
+        )
+        entry = (
+            version,
+            time.monotonic(),
+            array('q', (followed_id for followed_id, _ in rows)),
+            array('q', (followed_id for followed_id, is_mutual in rows if is_mutual)),
+        )
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return entry
+
+    def is_following(self, follower_id, followed_id):
+        return _contains(self._entry(follower_id)[2], followed_id)
+
+    def is_mutual(self, user_id, other_id):
+        return _contains(self._entry(user_id)[3], other_id)
+
+    def mutuals_of(self, user_id):
+        return list(self._entry(user_id)[3])
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            key = VERSION_KEY.format(user_id)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Missing or evicted: start from a value no cached entry can hold
+                cache.set(key, time.time_ns(), None)
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+
+follow_graph = FollowGraph()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from base.models import Conversation
+
+
+class Command(BaseCommand):
+    help = 'Backfill Conversation.last_message / last_message_at from existing direct messages'
+
+    def handle(self, *args, **options):
+        updated = Conversation.objects.all().refresh_last_message()
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} conversations'))
@@ -0,0 +1,117 @@
+import asyncio
+import multiprocessing
+import queue
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+GROUP = 'bench_fanout'
+
+
+def run_worker(alias, sockets, messages, timeout, ready, results):
+    """One worker process: `sockets` channels in the group, each reading every message"""
+    import django
+    django.setup()
+    from channels.layers import get_channel_layer
+
+    async def main():
+        layer = get_channel_layer(alias)
+        channels = [await layer.new_channel() for _ in range(sockets)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+
+        async def read(channel):
+            latencies = []
+            try:
+                while len(latencies) < messages:
+                    message = await asyncio.wait_for(layer.receive(channel), timeout)
+                    latencies.append(time.time() - message['sent'])
+            except asyncio.TimeoutError:
+                pass
+            return latencies
+
+        readers = [asyncio.ensure_future(read(channel)) for channel in channels]
+        ready.put(True)
+        latencies = [latency for result in await asyncio.gather(*readers) for latency in result]
+        results.put((latencies, time.time()))
+        await layer.close()
+
+    asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = 'Measure group_send fanout throughput and latency across worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts to try')
+        parser.add_argument('--sockets', type=int, default=50, help='Channels per worker, all in one group')
+        parser.add_argument('--messages', type=int, default=100, help='group_send calls per run')
+        parser.add_argument('--layer', default='default', help='CHANNEL_LAYERS alias')
+        parser.add_argument('--interval', type=float, default=0, help='Milliseconds between sends; 0 floods')
+        parser.add_argument('--timeout', type=float, default=5, help='Seconds a reader waits for the next message')
+
+    def handle(self, *args, **options):
+        from channels.layers import get_channel_layer
+
+        layer = get_channel_layer(options['layer'])
+        if layer is None:
+            raise CommandError(f"No channel layer named {options['layer']!r}")
+        self.stdout.write(f'{type(layer).__name__}, {options["sockets"]} sockets per worker, {options["messages"]} messages')
+        for workers in options['workers']:
+            self.run(layer, workers, options)
+
+    def run(self, layer, workers, options):
+        sockets, messages = options['sockets'], options['messages']
+        context = multiprocessing.get_context('spawn')
+        ready, results = context.Queue(), context.Queue()
+        processes = [
+            context.Process(
+                target=run_worker,
+                args=(options['layer'], sockets, messages, options['timeout'], ready, results),
+            )
+            for _ in range(workers)
+        ]
+        asyncio.run(layer.flush())
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get(timeout=60)
+
+        async def send_all():
+            timings = []
+            for i in range(messages):
+                start = time.perf_counter()
+                await layer.group_send(GROUP, {'type': 'bench.message', 'seq': i, 'sent': time.time()})
+                timings.append(time.perf_counter() - start)
+                if options['interval']:
+                    await asyncio.sleep(options['interval'] / 1000)
+            return timings
+
+        started = time.time()
+        send_timings = asyncio.run(send_all())
+        latencies, finished = [], started
+        for _ in processes:
+            try:
+                worker_latencies, worker_finished = results.get(timeout=options['timeout'] + 60)
+            except queue.Empty:
+                break
+            latencies += worker_latencies
+            finished = max(finished, worker_finished)
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        expected = workers * sockets * messages
+        if not latencies:
+            self.stdout.write(f'{workers:>3} workers: 0/{expected} delivered')
+            return
+        latencies = sorted(latency * 1000 for latency in latencies)
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        self.stdout.write(
+            f'{workers:>3} workers: {len(latencies)}/{expected} delivered, '
+            f'{len(latencies) / max(finished - started, 1e-9):9,.0f} msg/s, '
+            f'latency mean {statistics.mean(latencies):7.2f} ms p50 {statistics.median(latencies):7.2f} ms '
+            f'p95 {p95:7.2f} ms, group_send mean {statistics.mean(send_timings) * 1000:6.2f} ms'
+        )
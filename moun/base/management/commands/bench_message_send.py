@@ -0,0 +1,71 @@
+import asyncio
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from base.membership import participant_ids
+from base.messaging import send_direct_message
+from base.models import Conversation, DirectMessage, User
+
+
+class Command(BaseCommand):
+    help = 'Measure per-message latency of the direct message send paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200, help='Messages sent per path')
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        sender = User.objects.create_user(email='bench-sender@example.invalid', username='bench-sender')
+        recipient = User.objects.create_user(email='bench-recipient@example.invalid', username='bench-recipient')
+        try:
+            conversation, _ = Conversation.objects.get_or_create_direct(sender, recipient)
+            recipient_ids = participant_ids(conversation.id) - {sender.id}
+            channel_layer = get_channel_layer()
+            # One listener per group, so the sends actually deliver
+            for group in (f'user_{recipient.id}', f'chat_{conversation.id}'):
+                channel = async_to_sync(channel_layer.new_channel)()
+                async_to_sync(channel_layer.group_add)(group, channel)
+
+            def legacy(i):
+                # conversation_detail before the async send path
+                message = DirectMessage.objects.create(conversation=conversation, sender=sender, body=f'bench {i}')
+                other_user = conversation.get_other_participant(sender)
+                async_to_sync(channel_layer.group_send)(f'user_{other_user.id}', {'type': 'new_message'})
+                async_to_sync(channel_layer.group_send)(
+                    f'chat_{conversation.id}', {'type': 'chat_message', 'message': message.to_payload()}
+                )
+
+            def bridged(i):
+                async_to_sync(send_direct_message)(conversation.id, sender, recipient_ids, body=f'bench {i}')
+
+            async def native():
+                timings = []
+                for i in range(count):
+                    start = time.perf_counter()
+                    await send_direct_message(conversation.id, sender, recipient_ids, body=f'bench {i}')
+                    timings.append(time.perf_counter() - start)
+                return timings
+
+            self.report('sync view, 2x async_to_sync (before)', [self.timed(legacy, i) for i in range(count)])
+            self.report('sync view, async_to_sync(send_direct_message)', [self.timed(bridged, i) for i in range(count)])
+            self.report('async caller, send_direct_message (socket)', asyncio.run(native()))
+        finally:
+            sender.delete()
+            recipient.delete()
+
+    def timed(self, send, i):
+        start = time.perf_counter()
+        send(i)
+        return time.perf_counter() - start
+
+    def report(self, label, timings):
+        timings = sorted(t * 1000 for t in timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'{label:<48} mean {statistics.mean(timings):6.2f} ms  '
+            f'p50 {statistics.median(timings):6.2f} ms  p95 {p95:6.2f} ms'
+        )
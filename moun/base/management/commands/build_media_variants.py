@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from base import media
+from base.models import DirectMessage
+
+
+class Command(BaseCommand):
+    help = 'Build processed variants for image, video and voice messages that have none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild variants of every media message')
+
+    def handle(self, *args, **options):
+        messages = DirectMessage.objects.filter(file_type__in=('image', 'video', 'voice')).exclude(file='')
+        if not options['all']:
+            messages = messages.filter(variants={})
+        processed = 0
+        for message in messages.iterator():
+            try:
+                if media.process(message):
+                    processed += 1
+            except Exception as e:
+                self.stderr.write(f'Message {message.id}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {processed} messages'))
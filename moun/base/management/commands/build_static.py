@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from base.staticfiles import brotli
+
+
+class Command(BaseCommand):
+    help = 'Collect static files with content-hashed names and precompressed .gz/.br copies'
+
+    def handle(self, *args, **options):
+        if brotli is None:
+            self.stderr.write('brotli is not installed; only .gz copies will be written')
+        call_command(
+            'collectstatic',
+            interactive=False,
+            verbosity=options['verbosity'],
+            # Uploads left under static/ by the old MEDIA_ROOT are not site assets
+            ignore_patterns=['chat_media', 'blobs', 'upload_staging'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Static files built in {settings.STATIC_ROOT}'))
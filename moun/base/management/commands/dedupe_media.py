@@ -0,0 +1,60 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from base.models import Blob, DirectMessage, User
+from base.storage import content_storage, is_blob, sha256_of
+
+
+class Command(BaseCommand):
+    help = 'Move existing uploads into content-addressed storage and rebuild blob reference counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-originals', action='store_true', help='Leave the old files in place')
+
+    def handle(self, *args, **options):
+        default_avatar = User._meta.get_field('avatar').default
+        fields = ((DirectMessage, 'file'), (User, 'avatar'))
+        moved = {}
+
+        def convert(name):
+            if name in moved:
+                return moved[name]
+            if is_blob(name) or name == default_avatar:
+                return name
+            if not content_storage.exists(name):
+                self.stderr.write(f'Missing file: {name}')
+                moved[name] = name
+                return name
+            with content_storage.open(name) as original:
+                moved[name] = content_storage.save(name, original)
+            return moved[name]
+
+        references = Counter()
+        for model, field in fields:
+            rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+            for pk, name in rows.values_list('pk', field):
+                new_name = convert(name)
+                if new_name != name:
+                    model.objects.filter(pk=pk).update(**{field: new_name})
+                if is_blob(new_name):
+                    references[new_name] += 1
+
+        for name, count in references.items():
+            Blob.objects.update_or_create(
+                name=name,
+                defaults={'sha256': sha256_of(name), 'size': content_storage.size(name), 'ref_count': count},
+            )
+        for orphan in Blob.objects.exclude(name__in=list(references)):
+            content_storage.delete(orphan.name)
+            orphan.delete()
+
+        freed = 0
+        originals = [old for old, new in moved.items() if old != new]
+        if not options['keep_originals']:
+            for old in originals:
+                freed += content_storage.size(old)
+                content_storage.delete(old)
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {len(originals)} files into {len(references)} blobs, freed {freed} bytes'
+        ))
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.models import Blob
+from base.storage import content_storage, discard, orphans
+
+
+class Command(BaseCommand):
+    help = 'Delete stored blobs that nothing references and files left without a Blob row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=1, help='Age below which a file may still be mid-save')
+
+    def handle(self, *args, **options):
+        cutoff = time.time() - options['hours'] * 3600
+        files = 0
+        for name in orphans(cutoff):
+            content_storage.delete(name)
+            files += 1
+
+        unreferenced = Blob.objects.filter(
+            ref_count=0, created__lt=timezone.now() - timedelta(hours=options['hours'])
+        ).values_list('name', flat=True)
+        for name in unreferenced:
+            discard(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {files} files without a row and {len(unreferenced)} unreferenced blobs'
+        ))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.models import UploadSession
+from base.uploads import staging_path
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned chunked uploads and their staging files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Age after which an unfinished upload is abandoned')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(message__isnull=True, updated__lt=cutoff)
+        for session in stale:
+            staging_path(session).unlink(missing_ok=True)
+        deleted, _ = stale.delete()
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} abandoned uploads'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the SQLite FTS5 index over rooms, topics and room messages'
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            raise CommandError('Full-text search index is not available on this database')
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Rebuilt search index'))
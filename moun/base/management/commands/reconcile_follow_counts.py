@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from base.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = 'Recompute the follower/following counters and the mutual flags from Follow rows'
+
+    def handle(self, *args, **options):
+        def count_by(field):
+            return Coalesce(Subquery(
+                Follow.objects.filter(**{field: OuterRef('pk')})
+                .order_by()
+                .values(field)
+                .annotate(count=Count('id'))
+                .values('count')
+            ), Value(0))
+
+        with transaction.atomic():
+            updated = User.objects.update(
+                follower_count=count_by('followed'),
+                following_count=count_by('follower'),
+            )
+            Follow.objects.update(is_mutual=Exists(
+                Follow.objects.filter(follower=OuterRef('followed'), followed=OuterRef('follower'))
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Reconciled follow counts for {updated} users'))
@@ -0,0 +1,23 @@
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.core.management.base import BaseCommand
+
+from base.models import DirectMessage, User
+
+
+class Command(BaseCommand):
+    help = 'Recompute User.unread_messages_count from unread direct messages'
+
+    def handle(self, *args, **options):
+        unread = (
+            DirectMessage.objects
+            .filter(conversation__participants=OuterRef('pk'), is_read=False)
+            .exclude(sender=OuterRef('pk'))
+            .values('conversation__participants')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        updated = User.objects.update(
+            unread_messages_count=Coalesce(Subquery(unread), Value(0))
+        )
+        self.stdout.write(self.style.SUCCESS(f'Reconciled unread counts for {updated} users'))
@@ -0,0 +1,228 @@
+"""
+Processed variants of chat media: downscaled images, video posters and
+normalized voice notes.
+
+Originals are never modified. For an image the pipeline writes a thumbnail
+and a chat-sized preview (WebP, plus JPEG for clients without WebP); for a
+video it grabs a poster frame with ffmpeg and derives a thumbnail and poster
+from it. Variant paths and pixel dimensions are stored on the DirectMessage,
+and templates and message payloads prefer them over the original file.
+
+Voice notes are decoded once to measure their real duration and a
+WAVEFORM_BARS-peak waveform, and transcoded to mono AAC in an .m4a so every
+browser plays them with a known duration (MediaRecorder WebM has none).
+
+Processing runs in the ``process_message_media`` Celery task, queued by the
+DirectMessage post_save handler once the message is committed. Deleting a
+message removes its variants once the delete is committed.
+"""
+import io
+import logging
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from array import array
+from contextlib import contextmanager
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name -> (longest edge in pixels, format, quality)
+IMAGE_VARIANTS = {
+    'thumb': (320, 'WEBP', 70),
+    'preview': (1280, 'WEBP', 80),
+    'preview_jpeg': (1280, 'JPEG', 82),
+}
+VIDEO_VARIANTS = {
+    'thumb': (320, 'WEBP', 70),
+    'poster': (1280, 'JPEG', 82),
+}
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'AAC': 'm4a'}
+POSTER_OFFSETS = ('1', '0')  # seconds; clips shorter than a second use the first frame
+FFMPEG_TIMEOUT = 60
+
+VOICE_ENCODING = ['-vn', '-ac', '1', '-c:a', 'aac', '-b:a', '48k', '-movflags', '+faststart', '-f', 'mp4']
+WAVEFORM_BARS = 64
+WAVEFORM_RATE = 8000  # Hz of the mono PCM the waveform is measured on
+
+
+def schedule(message_id):
+    """Queue processing; a missing broker only costs the variants"""
+    from .tasks import process_message_media
+
+    try:
+        process_message_media.delay(message_id)
+    except Exception:
+        logger.warning('[Media] Could not queue processing for message %s', message_id, exc_info=True)
+
+
+def variant_dir(message_id):
+    return f'chat_media/variants/{message_id}'
+
+
+def variant_path(message, name, fmt):
+    return f'{variant_dir(message.id)}/{name}.{EXTENSIONS[fmt]}'
+
+
+def delete_variants(message_id):
+    """Remove every variant written for a message, e.g. once it is deleted"""
+    storage = default_storage
+    directory = variant_dir(message_id)
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        storage.delete(f'{directory}/{name}')
+    try:
+        os.rmdir(storage.path(directory))
+    except (NotImplementedError, OSError):
+        pass  # remote storages have no directories to remove
+
+
+def render(image, size, fmt, quality):
+    copy = image.copy()
+    copy.thumbnail((size, size), Image.LANCZOS)
+    if fmt == 'JPEG' and copy.mode != 'RGB':
+        background = Image.new('RGB', copy.size, 'white')
+        background.paste(copy, mask=copy.getchannel('A') if 'A' in copy.getbands() else None)
+        copy = background
+    buffer = io.BytesIO()
+    copy.save(buffer, fmt, quality=quality)
+    return buffer.getvalue()
+
+
+def open_image(message):
+    with message.file.open('rb') as source:
+        image = Image.open(source)
+        animated = getattr(image, 'is_animated', False)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    return image, animated
+
+
+def find_ffmpeg(message):
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        logger.info('[Media] ffmpeg not found, skipping message %s', message.id)
+    return ffmpeg
+
+
+@contextmanager
+def local_copy(message):
+    """Path of the message file on local disk, for tools that need one"""
+    with tempfile.NamedTemporaryFile(suffix='.media') as local:
+        with message.file.open('rb') as source:
+            shutil.copyfileobj(source, local)
+        local.flush()
+        yield local.name
+
+
+def grab_poster(message):
+    """First frame after POSTER_OFFSETS of a video, or None without ffmpeg"""
+    ffmpeg = find_ffmpeg(message)
+    if not ffmpeg:
+        return None
+
+    with local_copy(message) as path:
+        for offset in POSTER_OFFSETS:
+            result = subprocess.run(
+                [ffmpeg, '-v', 'error', '-ss', offset, '-i', path,
+                 '-frames:v', '1', '-f', 'image2', '-c:v', 'png', 'pipe:1'],
+                capture_output=True, timeout=FFMPEG_TIMEOUT,
+            )
+            if result.returncode == 0 and result.stdout:
+                return Image.open(io.BytesIO(result.stdout)).convert('RGB')
+    return None
+
+
+def waveform(samples, bars=WAVEFORM_BARS):
+    """Peak of each of `bars` equal slices of `samples`, scaled to 0-100"""
+    if not samples:
+        return []
+    size = math.ceil(len(samples) / bars)
+    peaks = [max(map(abs, samples[i:i + size])) for i in range(0, len(samples), size)]
+    loudest = max(peaks) or 1
+    return [round(peak * 100 / loudest) for peak in peaks]
+
+
+def analyse_voice(ffmpeg, path):
+    """``(duration in seconds, waveform)`` of an audio file"""
+    result = subprocess.run(
+        [ffmpeg, '-v', 'error', '-i', path, '-vn', '-ac', '1', '-ar', str(WAVEFORM_RATE), '-f', 's16le', 'pipe:1'],
+        capture_output=True, timeout=FFMPEG_TIMEOUT, check=True,
+    )
+    samples = array('h')
+    samples.frombytes(result.stdout[:len(result.stdout) // 2 * 2])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return len(samples) / WAVEFORM_RATE, waveform(samples)
+
+
+def process_voice(message):
+    from .models import DirectMessage
+
+    ffmpeg = find_ffmpeg(message)
+    if not ffmpeg:
+        return {}
+
+    storage = default_storage
+    path = variant_path(message, 'voice', 'AAC')
+    with local_copy(message) as source:
+        duration, peaks = analyse_voice(ffmpeg, source)
+        with tempfile.NamedTemporaryFile(suffix='.m4a') as encoded:
+            subprocess.run(
+                [ffmpeg, '-v', 'error', '-y', '-i', source, *VOICE_ENCODING, encoded.name],
+                capture_output=True, timeout=FFMPEG_TIMEOUT, check=True,
+            )
+            if storage.exists(path):
+                storage.delete(path)
+            variants = {'voice': storage.save(path, File(encoded))}
+
+    voice_duration = max(1, round(duration)) if duration else None
+    DirectMessage.objects.filter(pk=message.pk).update(
+        voice_duration=voice_duration, waveform=peaks, variants=variants
+    )
+    message.voice_duration, message.waveform, message.variants = voice_duration, peaks, variants
+    return variants
+
+
+def process(message):
+    """Write the variants of `message` and record them; returns the variants"""
+    from .models import DirectMessage
+
+    if message.file_type == 'voice':
+        return process_voice(message)
+    if message.file_type == 'image':
+        image, animated = open_image(message)
+        # Downscaling an animated GIF would freeze it, so only its thumbnail is made
+        specs = {'thumb': IMAGE_VARIANTS['thumb']} if animated else IMAGE_VARIANTS
+    elif message.file_type == 'video':
+        image = grab_poster(message)
+        specs = VIDEO_VARIANTS
+    else:
+        return {}
+    if image is None:
+        return {}
+
+    storage = default_storage
+    variants = {}
+    for name, (size, fmt, quality) in specs.items():
+        path = variant_path(message, name, fmt)
+        if storage.exists(path):
+            storage.delete(path)
+        variants[name] = storage.save(path, ContentFile(render(image, size, fmt, quality)))
+
+    width, height = image.size
+    DirectMessage.objects.filter(pk=message.pk).update(width=width, height=height, variants=variants)
+    message.width, message.height, message.variants = width, height, variants
+    return variants
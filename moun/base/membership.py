@@ -0,0 +1,37 @@
+"""
+Cached conversation membership.
+
+Every socket connect and conversation request has to know whether the user
+belongs to the conversation. The member ids of each conversation are cached
+as a frozenset in the Django cache, loaded with one range scan over the
+``(conversation_id, user_id)`` index of the participants table, and dropped
+by the ``m2m_changed`` handler in ``base.signals`` whenever members change.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+MEMBERS_KEY = 'conversation:members:{}'
+
+
+def participant_ids(conversation_id):
+    """Frozenset of the user ids taking part in `conversation_id`"""
+    from .models import Conversation
+
+    key = MEMBERS_KEY.format(int(conversation_id))
+    members = cache.get(key)
+    if members is None:
+        members = frozenset(
+            Conversation.participants.through.objects
+            .filter(conversation_id=conversation_id)
+            .values_list('user_id', flat=True)
+        )
+        cache.set(key, members, getattr(settings, 'CONVERSATION_MEMBERS_TIMEOUT', 3600))
+    return members
+
+
+def is_participant(conversation_id, user_id):
+    return user_id in participant_ids(conversation_id)
+
+
+def invalidate(*conversation_ids):
+    cache.delete_many([MEMBERS_KEY.format(int(conversation_id)) for conversation_id in conversation_ids])
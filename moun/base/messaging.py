@@ -0,0 +1,98 @@
+"""
+Storing and fanning out direct messages.
+
+The chat socket and the HTTP send path both go through here. The message is
+stored in a single hop to a worker thread (``acreate_once`` wraps the
+synchronous create and its duplicate fallback), its payload is built once and
+shared by the acknowledgement and every broadcast, and the recipients'
+notification groups and the chat group are sent to concurrently.
+
+Notification sockets keep each user's unread count themselves: a
+``new_message`` event carries +1 and reads or deletions send
+``unread_changed`` with their delta, so no socket queries the database per
+event.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+async def store_direct_message(conversation_id, sender, client_id=None, reply_to_id=None, **fields):
+    """
+    Create a message from `sender` and return ``(message_data, created)``.
+
+    `created` is False when `client_id` repeats an earlier send, in which
+    case the original message is returned and nothing should be broadcast.
+    """
+    from .models import DirectMessage
+
+    reply_to = None
+    if reply_to_id:
+        try:
+            reply_to = await DirectMessage.objects.select_related('sender').filter(
+                id=int(reply_to_id), conversation_id=conversation_id
+            ).afirst()
+        except (TypeError, ValueError):
+            pass
+
+    message, created = await DirectMessage.objects.acreate_once(
+        client_id=client_id,
+        conversation_id=int(conversation_id),
+        sender=sender,
+        reply_to=reply_to,
+        **fields
+    )
+    return message.to_payload(), created
+
+
+async def fanout(conversation_id, message_data, recipient_ids, channel_layer=None):
+    """Notify recipients' notification sockets and the chat group at once"""
+    channel_layer = channel_layer or get_channel_layer()
+    await asyncio.gather(
+        *(
+            channel_layer.group_send(f'user_{user_id}', {'type': 'new_message', 'delta': 1})
+            for user_id in recipient_ids
+        ),
+        channel_layer.group_send(f'chat_{conversation_id}', {
+            'type': 'chat_message',
+            'message': message_data
+        }),
+    )
+
+
+async def send_direct_message(conversation_id, sender, recipient_ids, client_id=None, reply_to_id=None, **fields):
+    """Store a message and deliver it; returns ``(message_data, created)``"""
+    message_data, created = await store_direct_message(
+        conversation_id, sender, client_id=client_id, reply_to_id=reply_to_id, **fields
+    )
+    if created:
+        await fanout(conversation_id, message_data, recipient_ids)
+    return message_data, created
+
+
+def push_unread_delta(user_ids, delta):
+    """Move the unread count on the notification sockets of `user_ids` by `delta` once committed"""
+    user_ids = list(user_ids)
+    if not delta or not user_ids:
+        return
+
+    async def send_all():
+        channel_layer = get_channel_layer()
+        await asyncio.gather(*(
+            channel_layer.group_send(f'user_{user_id}', {'type': 'unread_changed', 'delta': delta})
+            for user_id in user_ids
+        ))
+
+    def push():
+        try:
+            async_to_sync(send_all)()
+        except Exception:
+            # The socket resynchronises from the database on its own
+            logger.warning('[Messaging] Could not push unread change to %s', user_ids, exc_info=True)
+
+    transaction.on_commit(push)
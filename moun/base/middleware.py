@@ -1,18 +1,23 @@
 # middleware.py
-from django.utils import timezone
+from django.conf import settings
 from django.shortcuts import redirect
 from django.urls import reverse
 import re
 
+from .presence import presence_buffer
+
 class ActiveUserMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        # Asset requests say nothing about whether the user is around
+        self.ignored_prefixes = tuple(
+            '/' + prefix.lstrip('/') for prefix in (settings.STATIC_URL, settings.MEDIA_URL) if prefix
+        )
 
     def __call__(self, request):
-        if request.user.is_authenticated:
-            # Update the last activity time of the user
-            request.user.last_activity = timezone.now()
-            request.user.save(update_fields=['last_activity'])
+        if request.user.is_authenticated and not request.path.startswith(self.ignored_prefixes):
+            # Buffer the heartbeat; it is flushed to last_activity in batches
+            presence_buffer.record(request.user.id)
         response = self.get_response(request)
         return response
 
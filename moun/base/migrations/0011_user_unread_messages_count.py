@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counts(apps, schema_editor):
+    DirectMessage = apps.get_model('base', 'DirectMessage')
+    User = apps.get_model('base', 'User')
+    unread = (
+        DirectMessage.objects
+        .filter(conversation__participants=OuterRef('pk'), is_read=False)
+        .exclude(sender=OuterRef('pk'))
+        .values('conversation__participants')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    User.objects.update(unread_messages_count=Coalesce(Subquery(unread), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_conversation_last_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_messages_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized count of unread direct messages'),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
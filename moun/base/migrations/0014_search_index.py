@@ -0,0 +1,51 @@
+from django.db import migrations, OperationalError
+
+SEARCH_TABLE = 'base_search_index'
+# rowid = object id * 4 + kind (1 room, 2 topic, 3 message), see base.search
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+                'title, body, '
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to icontains
+            return
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, body) "
+            "SELECT r.id * 4 + 1, r.name, COALESCE(r.description, '') || ' ' || COALESCE(t.name, '') "
+            "FROM base_room r LEFT JOIN base_topic t ON t.id = r.topic_id"
+        )
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, body) "
+            "SELECT id * 4 + 2, name, '' FROM base_topic"
+        )
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, body) "
+            "SELECT id * 4 + 3, '', body FROM base_message"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_message_room_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_room_counts(apps, schema_editor):
+    Room = apps.get_model('base', 'Room')
+    Topic = apps.get_model('base', 'Topic')
+    counts = (
+        Room.objects.filter(topic=OuterRef('pk'))
+        .order_by()
+        .values('topic')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    Topic.objects.update(room_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='topic',
+            options={'ordering': ['-room_count', 'name']},
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='room_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized number of rooms under this topic'),
+        ),
+        migrations.AddIndex(
+            model_name='topic',
+            index=models.Index(fields=['-room_count', 'name'], name='topic_popularity_idx'),
+        ),
+        migrations.RunPython(backfill_room_counts, migrations.RunPython.noop),
+    ]
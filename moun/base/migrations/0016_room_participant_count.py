@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_participant_counts(apps, schema_editor):
+    Room = apps.get_model('base', 'Room')
+    counts = (
+        Room.participants.through.objects.filter(room=OuterRef('pk'))
+        .order_by()
+        .values('room')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    Room.objects.update(participant_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0015_topic_room_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized number of participants'),
+        ),
+        migrations.RunPython(backfill_participant_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:07
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_graph(apps, schema_editor):
+    Follow = apps.get_model('base', 'Follow')
+    User = apps.get_model('base', 'User')
+
+    def count_by(field):
+        return Coalesce(Subquery(
+            Follow.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('id'))
+            .values('count')
+        ), Value(0))
+
+    User.objects.update(
+        follower_count=count_by('followed'),
+        following_count=count_by('follower'),
+    )
+    Follow.objects.update(is_mutual=Exists(
+        Follow.objects.filter(follower=OuterRef('followed'), followed=OuterRef('follower'))
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0017_message_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='is_mutual',
+            field=models.BooleanField(default=False, help_text='The followed user follows back'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized number of followers'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized number of users followed'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', 'is_mutual', 'followed'], name='follow_mutual_idx'),
+        ),
+        migrations.RunPython(backfill_follow_graph, migrations.RunPython.noop),
+    ]
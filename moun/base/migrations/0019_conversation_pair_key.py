@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def dedupe_direct_conversations(apps, schema_editor):
+    """
+    Give every two-person conversation its pair key. When a pair has several
+    threads, the oldest one keeps the key and receives the messages of the
+    others, which are then deleted.
+    """
+    Conversation = apps.get_model('base', 'Conversation')
+    DirectMessage = apps.get_model('base', 'DirectMessage')
+    Membership = Conversation.participants.through
+
+    pairs = Conversation.objects.annotate(n=Count('participants')).filter(n=2).values_list('id', flat=True)
+    members = {}
+    for conversation_id, user_id in (
+        Membership.objects.filter(conversation_id__in=list(pairs))
+        .order_by('conversation_id', 'user_id')
+        .values_list('conversation_id', 'user_id')
+    ):
+        members.setdefault(conversation_id, []).append(user_id)
+
+    threads = {}
+    for conversation_id in sorted(members):
+        threads.setdefault(tuple(members[conversation_id]), []).append(conversation_id)
+
+    merged = []
+    for (user_low_id, user_high_id), (keeper_id, *duplicate_ids) in threads.items():
+        if duplicate_ids:
+            DirectMessage.objects.filter(conversation_id__in=duplicate_ids).update(conversation_id=keeper_id)
+            Conversation.objects.filter(id__in=duplicate_ids).delete()
+            merged.append(keeper_id)
+        Conversation.objects.filter(id=keeper_id).update(user_low_id=user_low_id, user_high_id=user_high_id)
+
+    latest = DirectMessage.objects.filter(conversation=OuterRef('pk')).order_by('-created', '-id')
+    Conversation.objects.filter(id__in=merged).update(
+        last_message=Subquery(latest.values('id')[:1]),
+        last_message_at=Subquery(latest.values('created')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0018_follow_counters_and_mutual_flag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(dedupe_direct_conversations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='conversation_pair_unique'),
+        ),
+    ]
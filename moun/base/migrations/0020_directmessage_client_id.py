@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0019_conversation_pair_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directmessage',
+            name='client_id',
+            field=models.CharField(blank=True, help_text='Sender-generated id that makes retried sends idempotent', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='directmessage',
+            constraint=models.UniqueConstraint(fields=('sender', 'client_id'), name='dm_sender_client_id_unique'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:15
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0020_directmessage_client_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(help_text='Original file name', max_length=255)),
+                ('file_size', models.BigIntegerField(help_text='Declared total size in bytes')),
+                ('file_type', models.CharField(blank=True, choices=[('text', 'Text'), ('image', 'Image'), ('video', 'Video'), ('voice', 'Voice'), ('document', 'Document')], help_text='Sniffed from the first chunk', max_length=10)),
+                ('bytes_received', models.BigIntegerField(default=0)),
+                ('body', models.TextField(blank=True, null=True)),
+                ('voice_duration', models.IntegerField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='base.conversation')),
+                ('message', models.ForeignKey(blank=True, help_text='Set once the upload is assembled', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='base.directmessage')),
+                ('reply_to', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='base.directmessage')),
+                ('uploader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
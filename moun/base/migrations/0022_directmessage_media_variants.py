@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0021_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directmessage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, help_text='Pixel height of the image or video frame', null=True),
+        ),
+        migrations.AddField(
+            model_name='directmessage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, help_text='Storage paths of downscaled variants by name (see base.media)'),
+        ),
+        migrations.AddField(
+            model_name='directmessage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, help_text='Pixel width of the image or video frame', null=True),
+        ),
+    ]
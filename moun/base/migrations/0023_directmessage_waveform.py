@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0022_directmessage_media_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directmessage',
+            name='waveform',
+            field=models.JSONField(blank=True, default=list, help_text='Peak of each waveform bar of a voice message, 0-100'),
+        ),
+        migrations.AlterField(
+            model_name='directmessage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, help_text='Storage paths of processed variants by name (see base.media)'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:25
+
+import base.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0024_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='directmessage',
+            name='file',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=base.storage.media_storage, upload_to='chat_media/'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, db_index=True, default='avatar.svg', null=True, storage=base.storage.media_storage, upload_to=''),
+        ),
+    ]
@@ -1,7 +1,16 @@
-from django.db import models
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
+from django.core.files.storage import default_storage
 from django.utils import timezone
 
+from .messaging import push_unread_delta
+from .storage import discard as discard_blob, media_storage
+
 # Create your models here.
 class CustomUserManager(BaseUserManager):
     def get_by_natural_key(self, username):
@@ -39,7 +48,7 @@ class User(AbstractBaseUser):
     email = models.EmailField(unique=True, null=True)
     username = models.CharField(max_length=40, unique=True, null=True)
     bio = models.TextField(default="no bio...", null=True)
-    avatar = models.ImageField(default='avatar.svg', null=True, blank=True)
+    avatar = models.ImageField(default='avatar.svg', null=True, blank=True, db_index=True, storage=media_storage)
     date_joined = models.DateTimeField(auto_now_add=True)
     last_login = models.DateTimeField(auto_now=True)
     is_admin = models.BooleanField(default=False)
@@ -47,8 +56,14 @@ class User(AbstractBaseUser):
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
     last_activity = models.DateTimeField(default=timezone.now)
+    unread_messages_count = models.PositiveIntegerField(default=0, help_text='Denormalized count of unread direct messages')
+    follower_count = models.PositiveIntegerField(default=0, help_text='Denormalized number of followers')
+    following_count = models.PositiveIntegerField(default=0, help_text='Denormalized number of users followed')
     objects = CustomUserManager()
 
+    # Kept current by F() updates; a full save must not write back the copy loaded with the instance
+    COUNTER_FIELDS = ('unread_messages_count', 'follower_count', 'following_count')
+
     # Required fields for custom user model
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -64,45 +79,122 @@ class User(AbstractBaseUser):
     def has_module_perms(self, app_label):
         return True
 
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None and not kwargs.get('force_insert') and not self._state.adding:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def update_last_activity(self):
         self.last_activity = timezone.now()
-        self.save()
+        self.save(update_fields=['last_activity'])
 
     def is_following(self, user):
-        return self.following.filter(followed=user).exists()
+        from .follow_graph import follow_graph
+        return follow_graph.is_following(self.id, user.id)
+
+    def adjust_unread_messages_count(self, delta):
+        """Apply `delta` to the stored unread counter and to this instance"""
+        User.objects.filter(id=self.id).update(
+            unread_messages_count=Greatest(F('unread_messages_count') + delta, 0)
+        )
+        self.unread_messages_count = max(self.unread_messages_count + delta, 0)
 
 
 class Topic(models.Model):
     name = models.CharField(max_length=200)
+    room_count = models.PositiveIntegerField(default=0, help_text='Denormalized number of rooms under this topic')
+
+    class Meta:
+        # Most popular first, served from the index below
+        ordering = ['-room_count', 'name']
+        indexes = [
+            models.Index(fields=['-room_count', 'name'], name='topic_popularity_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
 
+class RoomQuerySet(models.QuerySet):
+    def for_feed(self, user, sample_size=8):
+        """
+        Everything a feed card renders, in a fixed number of queries: host and
+        topic are joined, at most `sample_size` participants per room are
+        prefetched into `sampled_participants` and `is_member` tells whether
+        `user` has joined.
+        """
+        if user.is_authenticated:
+            is_member = Exists(
+                Room.participants.through.objects.filter(room=OuterRef('pk'), user=user)
+            )
+        else:
+            is_member = Value(False)
+        return (
+            self.select_related('host', 'topic')
+            .annotate(is_member=is_member)
+            .prefetch_related(Prefetch(
+                'participants',
+                queryset=User.objects.only('id', 'username', 'avatar').order_by('id')[:sample_size],
+                to_attr='sampled_participants',
+            ))
+        )
+
+    def refresh_participant_count(self):
+        """Recompute the denormalized participant counter with a single UPDATE"""
+        counts = (
+            Room.participants.through.objects
+            .filter(room=OuterRef('pk'))
+            .order_by()
+            .values('room')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return self.update(participant_count=Coalesce(Subquery(counts), Value(0)))
+
+
 class Room(models.Model):
     host = models.ForeignKey(User, on_delete=models.SET_NULL,null=True)
     topic = models.ForeignKey(Topic, on_delete=models.SET_NULL,null=True)
     name = models.CharField(max_length=200)
     description = models.TextField(null=True, blank=True)
     participants = models.ManyToManyField(User, related_name='participants', blank = True)
+    participant_count = models.PositiveIntegerField(default=0, help_text='Denormalized number of participants')
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = RoomQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated', '-created']
 
     def __str__(self):
         return self.name
   
+class MessageQuerySet(models.QuerySet):
+    def for_activity(self):
+        """Room messages with the author and room joined for activity feeds"""
+        return self.select_related('user', 'room')
+
+
 class Message(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     body = models.TextField()
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
+
+    objects = MessageQuerySet.as_manager()
     
     class Meta:
-        ordering = ['-updated', '-created']
+        # Newest first, served straight from the (room, created, id) index
+        ordering = ['-created', '-id']
+        indexes = [
+            models.Index(fields=['room', 'created', 'id'], name='message_room_keyset_idx'),
+            models.Index(fields=['created', 'id'], name='message_created_idx'),
+        ]
 
     def __str__(self):
         return self.body[0:50]
@@ -112,21 +204,90 @@ class Follow(models.Model):
     follower = models.ForeignKey(User, related_name='following', on_delete=models.CASCADE)
     followed = models.ForeignKey(User, related_name='followers', on_delete=models.CASCADE)
     date_followed = models.DateTimeField(auto_now_add=True)
+    is_mutual = models.BooleanField(default=False, help_text='The followed user follows back')
 
     class Meta:
         unique_together = ('follower', 'followed')
+        indexes = [
+            models.Index(fields=['follower', 'is_mutual', 'followed'], name='follow_mutual_idx'),
+        ]
 
     def __str__(self):
         return f'{self.follower.username} follows {self.followed.username}'
 
 
+class ConversationQuerySet(models.QuerySet):
+    def for_inbox(self, user):
+        """
+        Conversations of `user` with everything the inbox renders, in a
+        constant number of queries: `last_message` (and its sender) is joined,
+        `unread_count` is a correlated subquery and the other participants are
+        prefetched into `other_participants`.
+        """
+        unread = (
+            DirectMessage.objects
+            .filter(conversation=OuterRef('pk'), is_read=False)
+            .exclude(sender=user)
+            .values('conversation')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return (
+            self.filter(participants=user)
+            .select_related('last_message__sender')
+            .annotate(unread_count=Coalesce(Subquery(unread), Value(0)))
+            .prefetch_related(Prefetch(
+                'participants',
+                queryset=User.objects.exclude(id=user.id),
+                to_attr='other_participants',
+            ))
+            .order_by(models.F('last_message_at').desc(nulls_last=True), '-updated')
+        )
+
+    def get_or_create_direct(self, user, other):
+        """
+        The 1:1 conversation between `user` and `other`, created on first use.
+
+        Looked up through the unique ``(user_low, user_high)`` pair, so this is
+        a single index probe and concurrent calls cannot create duplicates.
+        """
+        user_low_id, user_high_id = sorted((user.id, other.id))
+        with transaction.atomic():
+            conversation, created = self.get_or_create(user_low_id=user_low_id, user_high_id=user_high_id)
+            if created:
+                conversation.participants.add(user_low_id, user_high_id)
+        return conversation, created
+
+    def refresh_last_message(self):
+        """Recompute the denormalized last message columns with a single UPDATE"""
+        latest = (
+            DirectMessage.objects
+            .filter(conversation=OuterRef('pk'))
+            .order_by('-created', '-id')
+        )
+        return self.update(
+            last_message=Subquery(latest.values('id')[:1]),
+            last_message_at=Subquery(latest.values('created')[:1]),
+        )
+
+
 class Conversation(models.Model):
     participants = models.ManyToManyField(User, related_name='conversations')
+    # Canonical pair key of a 1:1 conversation (lower user id first)
+    user_low = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message = models.ForeignKey('DirectMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ConversationQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated']
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='conversation_pair_unique'),
+        ]
 
     def __str__(self):
         usernames = [user.username for user in self.participants.all()]
@@ -135,10 +296,48 @@ class Conversation(models.Model):
     def get_other_participant(self, user):
         """Get the other participant in a 1-on-1 conversation"""
         return self.participants.exclude(id=user.id).first()
-    
-    def last_message(self):
-        """Get the most recent message in this conversation"""
-        return self.direct_messages.order_by('-created').first()
+
+
+class DirectMessageQuerySet(models.QuerySet):
+    def mark_read_for(self, user):
+        """Mark messages received by `user` as read and keep their unread counter in sync"""
+        updated = self.filter(is_read=False).exclude(sender=user).update(is_read=True)
+        if updated:
+            user.adjust_unread_messages_count(-updated)
+            push_unread_delta([user.id], -updated)
+        return updated
+
+    def create_once(self, client_id=None, **fields):
+        """
+        Create a message unless its sender already sent one with `client_id`.
+
+        Returns ``(message, created)``; a client retrying a send it never saw
+        acknowledged gets the original message back instead of a duplicate.
+        """
+        message = self.model(client_id=client_id or None, **fields)
+        try:
+            # Atomic even without a client_id, so the file is stored and its
+            # blob reference counted in one transaction (see base.storage)
+            with transaction.atomic(using=self.db):
+                message.save(force_insert=True, using=self.db)
+            return message, True
+        except IntegrityError:
+            # The file was stored before the insert failed
+            if message.file:
+                discard_blob(message.file.name)
+            if not client_id:
+                raise
+            existing = (
+                self.select_related('sender', 'reply_to__sender')
+                .filter(sender=fields['sender'], client_id=client_id)
+                .first()
+            )
+            if existing is None:
+                raise
+            return existing, False
+
+    async def acreate_once(self, client_id=None, **fields):
+        return await sync_to_async(self.create_once)(client_id=client_id, **fields)
 
 
 class DirectMessage(models.Model):
@@ -153,20 +352,129 @@ class DirectMessage(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='direct_messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     body = models.TextField(blank=True, null=True)
-    file = models.FileField(upload_to='chat_media/', blank=True, null=True)
+    file = models.FileField(upload_to='chat_media/', blank=True, null=True, db_index=True, storage=media_storage)
     file_type = models.CharField(max_length=10, choices=MESSAGE_TYPES, default='text')
     file_name = models.CharField(max_length=255, blank=True, null=True, help_text='Original file name')
     file_size = models.BigIntegerField(blank=True, null=True, help_text='File size in bytes')
     voice_duration = models.IntegerField(blank=True, null=True, help_text='Duration in seconds for voice messages')
     is_read = models.BooleanField(default=False)
     reply_to = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='replies')
+    client_id = models.CharField(max_length=64, blank=True, null=True, help_text='Sender-generated id that makes retried sends idempotent')
+    width = models.PositiveIntegerField(blank=True, null=True, help_text='Pixel width of the image or video frame')
+    height = models.PositiveIntegerField(blank=True, null=True, help_text='Pixel height of the image or video frame')
+    variants = models.JSONField(default=dict, blank=True, help_text='Storage paths of processed variants by name (see base.media)')
+    waveform = models.JSONField(default=list, blank=True, help_text='Peak of each waveform bar of a voice message, 0-100')
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = DirectMessageQuerySet.as_manager()
+
     class Meta:
         ordering = ['created']
+        indexes = [
+            models.Index(fields=['conversation', 'created', 'id'], name='dm_conversation_keyset_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['sender', 'client_id'], name='dm_sender_client_id_unique'),
+        ]
 
     def __str__(self):
         if self.file_type != 'text':
             return f'{self.sender.username}: [{self.file_type.upper()}]'
         return f'{self.sender.username}: {self.body[:50]}'
+
+    def variant_url(self, name):
+        path = (self.variants or {}).get(name)
+        return default_storage.url(path) if path else None
+
+    @property
+    def thumb_url(self):
+        return self.variant_url('thumb')
+
+    @property
+    def preview_webp_url(self):
+        return self.variant_url('preview')
+
+    @property
+    def preview_url(self):
+        """Chat-sized JPEG of an image, or the original until it is processed"""
+        return self.variant_url('preview_jpeg') or (self.file.url if self.file else None)
+
+    @property
+    def poster_url(self):
+        return self.variant_url('poster')
+
+    @property
+    def voice_url(self):
+        """Normalized AAC of a voice message, or the original until it is processed"""
+        return self.variant_url('voice') or (self.file.url if self.file else None)
+
+    def to_payload(self):
+        """JSON-serializable form used by the chat WebSocket and the history API"""
+        data = {
+            'id': self.id,
+            'body': self.body,
+            'file_url': self.file.url if self.file else None,
+            'preview_url': self.preview_url,
+            'preview_webp_url': self.preview_webp_url,
+            'thumb_url': self.thumb_url,
+            'poster_url': self.poster_url,
+            'width': self.width,
+            'height': self.height,
+            'voice_url': self.voice_url,
+            'waveform': self.waveform,
+            'file_type': self.file_type,
+            'file_name': self.file_name,
+            'file_size': self.file_size,
+            'voice_duration': self.voice_duration,
+            'sender_id': self.sender.id,
+            'sender_username': self.sender.username,
+            'sender_avatar': self.sender.avatar.url if self.sender.avatar else None,
+            'created': self.created.strftime('%b %d, %I:%M %p'),
+            'client_id': self.client_id,
+            'reply_to': None
+        }
+        if self.reply_to:
+            data['reply_to'] = {
+                'id': self.reply_to.id,
+                'body': self.reply_to.body,
+                'file_type': self.reply_to.file_type,
+                'sender_username': self.reply_to.sender.username
+            }
+        return data
+
+
+class Blob(models.Model):
+    """A stored media file and the number of fields referencing it (see base.storage)"""
+    name = models.CharField(max_length=255, unique=True, help_text='Storage path, blobs/ab/cd/<sha256><ext>')
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(help_text='File size in bytes')
+    ref_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count} refs)'
+
+
+class UploadSession(models.Model):
+    """A resumable chunked upload that becomes a DirectMessage once complete"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='upload_sessions')
+    uploader = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255, help_text='Original file name')
+    file_size = models.BigIntegerField(help_text='Declared total size in bytes')
+    file_type = models.CharField(max_length=10, choices=DirectMessage.MESSAGE_TYPES, blank=True, help_text='Sniffed from the first chunk')
+    bytes_received = models.BigIntegerField(default=0)
+    body = models.TextField(blank=True, null=True)
+    reply_to = models.ForeignKey(DirectMessage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    voice_duration = models.IntegerField(blank=True, null=True)
+    message = models.ForeignKey(DirectMessage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', help_text='Set once the upload is assembled')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.file_name} ({self.bytes_received}/{self.file_size})'
+
+    @property
+    def is_complete(self):
+        return self.bytes_received >= self.file_size
@@ -0,0 +1,64 @@
+"""
+Keyset (cursor) pagination over ``(created, id)``.
+
+A cursor is an opaque ``"<epoch microseconds>_<id>"`` string taken from the
+last row of a page. Unlike OFFSET pagination, fetching the next page is an
+index range scan no matter how deep the client has scrolled.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
+
+
+def encode_cursor(obj, field='created'):
+    value = getattr(obj, field)
+    micros = int(value.timestamp()) * 1_000_000 + value.microsecond
+    return f'{micros}_{obj.pk}'
+
+
+def decode_cursor(cursor):
+    """Return ``(datetime, pk)`` for `cursor`, or None if it is malformed"""
+    try:
+        micros, pk = cursor.split('_', 1)
+        micros, pk = int(micros), int(pk)
+        seconds, remainder = divmod(micros, 1_000_000)
+        value = datetime.fromtimestamp(seconds, tz=dt_timezone.utc).replace(microsecond=remainder)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        return None
+    # Larger ids cannot be bound as a database integer
+    if not 0 <= pk < 2 ** 63:
+        return None
+    return value, pk
+
+
+def page_before(queryset, cursor=None, limit=50, field='created'):
+    """
+    Up to `limit` rows older than `cursor`, newest first.
+
+    Returns ``(rows, next_cursor)``; `next_cursor` is None on the last page.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        value, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+    rows = list(queryset.order_by(f'-{field}', '-pk')[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1], field)
+    return rows, None
+
+
+def page_after(queryset, cursor=None, limit=50, field='created'):
+    """
+    Up to `limit` rows newer than `cursor`, oldest first.
+
+    Returns ``(rows, next_cursor)``; `next_cursor` points at the newest row
+    returned (or echoes `cursor` when nothing is new) so clients can keep
+    polling from it.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        value, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+    rows = list(queryset.order_by(field, 'pk')[:limit])
+    return rows, encode_cursor(rows[-1], field) if rows else cursor
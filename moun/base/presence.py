@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceBuffer:
+    """
+    Write-behind buffer for User.last_activity.
+
+    Heartbeats are coalesced per user in process memory and written with a
+    single bulk UPDATE either every `flush_interval` seconds or once
+    `flush_threshold` users are pending. A user is written at most once per
+    `throttle` seconds, so a burst of requests costs no database writes.
+
+    Heartbeats still pending when the process exits are dropped rather than
+    written at exit, when the settings may already name another database;
+    the next heartbeat after a restart records the user again. A disabled
+    buffer ignores heartbeats altogether, which is how the test suite runs.
+    """
+
+    def __init__(self, throttle=None, flush_interval=None, flush_threshold=None, enabled=True):
+        self.throttle = throttle if throttle is not None else getattr(settings, 'PRESENCE_WRITE_THROTTLE', 30)
+        self.flush_interval = flush_interval if flush_interval is not None else getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 15)
+        self.flush_threshold = flush_threshold if flush_threshold is not None else getattr(settings, 'PRESENCE_FLUSH_THRESHOLD', 200)
+        self._lock = threading.Lock()
+        self._pending = {}    # user_id -> unix timestamp of the latest heartbeat
+        self._persisted = {}  # user_id -> unix timestamp last handed to the database
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self.enabled = enabled
+
+    def record(self, user_id, now=None):
+        """Record a heartbeat for `user_id`; returns True if it was buffered"""
+        if not self.enabled:
+            return False
+        now = now if now is not None else time.time()
+        with self._lock:
+            if now - self._persisted.get(user_id, 0) < self.throttle:
+                return False
+            self._pending[user_id] = now
+            should_flush = (
+                len(self._pending) >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        self._ensure_flusher()
+        if should_flush:
+            self.flush()
+        return True
+
+    def last_seen(self, user_id):
+        """Latest heartbeat for `user_id` that has not reached the database yet"""
+        with self._lock:
+            ts = self._pending.get(user_id)
+        return datetime.fromtimestamp(ts, tz=dt_timezone.utc) if ts else None
+
+    def forget(self, user_id):
+        """Drop buffered state, e.g. when a user logs out and is marked offline"""
+        with self._lock:
+            self._pending.pop(user_id, None)
+            self._persisted.pop(user_id, None)
+
+    def flush(self):
+        """Write all pending heartbeats in one bulk UPDATE"""
+        from .models import User
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            self._persisted.update(pending)
+            # Entries older than the throttle window no longer suppress writes
+            cutoff = time.time() - self.throttle
+            self._persisted = {uid: ts for uid, ts in self._persisted.items() if ts >= cutoff}
+        if not pending:
+            return 0
+
+        users = [
+            User(id=user_id, last_activity=datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+            for user_id, ts in pending.items()
+        ]
+        try:
+            User.objects.bulk_update(users, ['last_activity'])
+        except Exception:
+            logger.exception('[Presence] Failed to flush %d heartbeats', len(users))
+            with self._lock:
+                for user_id, ts in pending.items():
+                    self._pending.setdefault(user_id, ts)
+                    self._persisted.pop(user_id, None)
+            return 0
+        return len(users)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='presence-flusher', daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if time.monotonic() - self._last_flush < self.flush_interval:
+                continue
+            close_old_connections()
+            self.flush()
+
+
+class ConnectionRegistry:
+    """
+    Counts open NotificationConsumer sockets per user in the Django cache.
+
+    The cache is shared by every worker (see settings.CACHES), so a user
+    whose last socket on one worker closes stays online while another
+    worker still holds one. `connect`/`disconnect` return True only on the
+    offline -> online and online -> offline transitions, which are the only
+    moments presence needs to be pushed to other users. A count expires
+    `timeout` seconds after the last heartbeat `touch`ed it, so sockets of
+    a worker that died without disconnecting stop counting.
+    """
+
+    KEY = 'presence:sockets:{}'
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout if timeout is not None else getattr(settings, 'PRESENCE_ONLINE_WINDOW', 80)
+
+    def connect(self, user_id):
+        key = self.KEY.format(user_id)
+        if cache.add(key, 1, self.timeout):
+            return True
+        try:
+            sockets = cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            cache.set(key, 1, self.timeout)
+            return True
+        cache.touch(key, self.timeout)
+        return sockets == 1
+
+    def disconnect(self, user_id):
+        key = self.KEY.format(user_id)
+        try:
+            # Left at zero rather than deleted, so a concurrent connect is not lost
+            return cache.decr(key) <= 0
+        except ValueError:
+            return True
+
+    def touch(self, user_id):
+        cache.touch(self.KEY.format(user_id), self.timeout)
+
+    def connected(self, user_ids):
+        """The ids among `user_ids` with an open socket"""
+        counts = cache.get_many([self.KEY.format(user_id) for user_id in user_ids])
+        return {user_id for user_id in user_ids if counts.get(self.KEY.format(user_id), 0) > 0}
+
+    def is_connected(self, user_id):
+        return cache.get(self.KEY.format(user_id), 0) > 0
+
+
+presence_buffer = PresenceBuffer()
+online_registry = ConnectionRegistry()
+
+
+def is_online(user, connected=None):
+    """
+    A user is online with an open socket or a recent heartbeat; `connected`
+    is a set of ids known to have a socket, to look many users up at once
+    """
+    if connected is None:
+        connected = online_registry.connected([user.id])
+    if user.id in connected:
+        return True
+    last_activity = presence_buffer.last_seen(user.id) or user.last_activity
+    if not last_activity:
+        return False
+    return (timezone.now() - last_activity).total_seconds() < getattr(settings, 'PRESENCE_ONLINE_WINDOW', 80)
+
+
+def mark_offline(user):
+    """Drop buffered heartbeats of `user` and date its last activity outside the online window"""
+    presence_buffer.forget(user.id)
+    user.last_activity = timezone.now() - timedelta(seconds=getattr(settings, 'PRESENCE_ONLINE_WINDOW', 80))
+    user.save(update_fields=['last_activity'])
+
+
+def mutual_presence(user):
+    """Online status of every mutual follower of `user`"""
+    from .follow_graph import follow_graph
+    from .models import User
+
+    mutuals = list(User.objects.filter(id__in=follow_graph.mutuals_of(user.id)).only('id', 'last_activity'))
+    connected = online_registry.connected([mutual.id for mutual in mutuals])
+    return [{'user_id': mutual.id, 'is_online': is_online(mutual, connected)} for mutual in mutuals]
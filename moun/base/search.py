@@ -0,0 +1,142 @@
+"""
+Full-text search over rooms, topics and room messages.
+
+On SQLite the documents live in the FTS5 table ``base_search_index`` (created
+by migration 0014_search_index) and are kept current by the signal handlers in
+``base.signals``. Other backends, or SQLite builds without FTS5, fall back to
+the original ``icontains`` filters, as do queries without any word characters.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+SEARCH_TABLE = 'base_search_index'
+# bm25 weights per column: title, body
+RANK = f'bm25({SEARCH_TABLE}, 10.0, 1.0)'
+
+# Each document's rowid packs the object id and its kind so that upserts and
+# deletes are rowid lookups instead of scans over unindexed columns
+KINDS = {'room': 1, 'topic': 2, 'message': 3}
+KIND_BITS = 4
+
+
+def _rowid(kind, object_id):
+    return object_id * KIND_BITS + KINDS[kind]
+
+_fts_available = None
+
+
+def fts_enabled():
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (
+            connection.vendor == 'sqlite'
+            and SEARCH_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available
+
+
+def build_match(q):
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    terms = re.findall(r'\w+', q or '')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _filter_ranked(queryset, kind, q):
+    # Joined in SQL so that LIMIT and the bm25 ordering are applied by SQLite:
+    # the MATCH drives the join and each hit is a primary key lookup
+    qn = connection.ops.quote_name
+    table = qn(queryset.model._meta.db_table)
+    return queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=[
+            f'{SEARCH_TABLE} MATCH %s',
+            f'{SEARCH_TABLE}.rowid %% {KIND_BITS} = {KINDS[kind]}',
+            f'{table}.{qn("id")} = {SEARCH_TABLE}.rowid / {KIND_BITS}',
+        ],
+        params=[build_match(q)],
+        select={'search_rank': RANK},
+        order_by=['search_rank'],
+    )
+
+
+def search_rooms(queryset, q):
+    """Rooms whose name, description or topic match `q`, best match first"""
+    if not q:
+        return queryset
+    # Punctuation-only queries have no FTS terms and keep the substring match
+    if build_match(q) and fts_enabled():
+        return _filter_ranked(queryset, 'room', q)
+    return queryset.filter(
+        Q(topic__name__icontains=q) |
+        Q(name__icontains=q) |
+        Q(description__icontains=q)
+    )
+
+
+def search_topics(queryset, q):
+    """Topics whose name matches `q`, best match first"""
+    if not q:
+        return queryset
+    if build_match(q) and fts_enabled():
+        return _filter_ranked(queryset, 'topic', q)
+    return queryset.filter(name__icontains=q)
+
+
+def search_messages(queryset, q):
+    """Room messages whose body matches `q`, best match first"""
+    if not q:
+        return queryset
+    if build_match(q) and fts_enabled():
+        return _filter_ranked(queryset, 'message', q)
+    return queryset.filter(body__icontains=q)
+
+
+def _replace(kind, object_id, title, body):
+    rowid = _rowid(kind, object_id)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [rowid])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, body) VALUES (%s, %s, %s)',
+            [rowid, title or '', body or ''],
+        )
+
+
+def index_room(room):
+    topic_name = room.topic.name if room.topic_id else ''
+    _replace('room', room.id, room.name, f'{room.description or ""} {topic_name}')
+
+
+def index_topic(topic):
+    _replace('topic', topic.id, topic.name, '')
+
+
+def index_message(message):
+    _replace('message', message.id, '', message.body)
+
+
+def unindex(kind, object_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [_rowid(kind, object_id)])
+
+
+REBUILD_SQL = [
+    f'DELETE FROM {SEARCH_TABLE}',
+    f"INSERT INTO {SEARCH_TABLE} (rowid, title, body) "
+    f"SELECT r.id * {KIND_BITS} + {KINDS['room']}, r.name, "
+    f"COALESCE(r.description, '') || ' ' || COALESCE(t.name, '') "
+    f"FROM base_room r LEFT JOIN base_topic t ON t.id = r.topic_id",
+    f"INSERT INTO {SEARCH_TABLE} (rowid, title, body) "
+    f"SELECT id * {KIND_BITS} + {KINDS['topic']}, name, '' FROM base_topic",
+    f"INSERT INTO {SEARCH_TABLE} (rowid, title, body) "
+    f"SELECT id * {KIND_BITS} + {KINDS['message']}, '', body FROM base_message",
+]
+
+
+def rebuild():
+    """Repopulate the whole index from the source tables"""
+    with connection.cursor() as cursor:
+        for sql in REBUILD_SQL:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
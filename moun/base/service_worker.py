@@ -0,0 +1,47 @@
+"""
+The service worker script, built once and kept in memory.
+
+Every open tab asks for /service-worker.js on each update check. The script
+(the PRECACHE prefix from ``base.staticfiles`` followed by
+``static/js/service-worker.js``) is built once per modification of the
+source file, which costs one stat per request to notice, and served from
+memory with a strong ETag so an unchanged worker is answered with a bodiless
+304. Its version, a prefix of the same hash, is served on its own so pages
+can poll a few bytes instead of the script.
+"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.http import quote_etag
+
+from .staticfiles import precache_manifest
+
+Script = namedtuple('Script', 'key body etag version')
+
+
+class ServiceWorkerScript:
+    """In-memory copy of the service worker, keyed by the source's mtime and size"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(settings.BASE_DIR, 'static', 'js', 'service-worker.js')
+        self._script = None
+
+    def get(self):
+        """The current Script; raises FileNotFoundError without a source"""
+        st = os.stat(self.path)
+        key = (st.st_mtime_ns, st.st_size)
+        script = self._script
+        if script is None or script.key != key:
+            with open(self.path, 'rb') as f:
+                source = f.read()
+            body = f'const PRECACHE = {json.dumps(precache_manifest())};\n'.encode() + source
+            digest = hashlib.sha256(body).hexdigest()
+            # A racing rebuild produces the same bytes, so no lock is needed
+            script = self._script = Script(key, body, quote_etag(digest), digest[:16])
+        return script
+
+
+worker_script = ServiceWorkerScript()
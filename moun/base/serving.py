@@ -0,0 +1,224 @@
+"""
+Serving uploaded media with byte ranges and conditional requests.
+
+Replaces ``django.views.static.serve`` for MEDIA_URL. A video player seeking
+through a clip or a voice note being replayed asks for byte ranges, which are
+answered with 206 Partial Content from a seek into the file. Every response
+carries a strong ETag derived from the content and a Last-Modified date, so
+a revalidating client gets a 304 without a body. Content-addressed blobs
+(see ``base.storage``) never change, so they are cacheable for a year and
+their ETag is the SHA-256 already in their name; any other file is hashed
+once per modification and the digest cached.
+
+Chat media is only readable by the participants of a conversation that has
+a message referencing it. The conversations referencing a file are looked up
+once and cached, and membership is checked against the cached member set of
+``base.membership``, so a request costs no participants query.
+
+With ``MEDIA_SENDFILE = 'x-sendfile'`` or ``'x-accel-redirect'`` the file
+transfer itself, ranges included, is handed to the front web server after
+authorization (``MEDIA_ACCEL_REDIRECT_PREFIX`` names nginx's internal
+location).
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .membership import is_participant
+from .storage import is_blob, sha256_of
+
+OWNERS_KEY = 'media:owners:{}'
+ETAG_KEY = 'media:etag:{}'
+PRIVATE_PREFIXES = ('blobs/', 'chat_media/')
+VARIANT_PATH = re.compile(r'^chat_media/variants/(\d+)/')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 256 * 1024
+IMMUTABLE = 'max-age=31536000, immutable'
+
+
+def _key(template, *parts):
+    # Media names can hold spaces and other characters memcached rejects
+    return template.format(hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def owners(name):
+    """``(public, conversation ids)`` of the media file `name`"""
+    from .models import DirectMessage, User
+
+    key = _key(OWNERS_KEY, name)
+    cached = cache.get(key)
+    if cached is None:
+        match = VARIANT_PATH.match(name)
+        if match:
+            public = False
+            conversation_ids = DirectMessage.objects.filter(pk=match[1]).values_list('conversation_id', flat=True)
+        else:
+            # A blob can be somebody's avatar as well as an attachment
+            public = is_blob(name) and User.objects.filter(avatar=name).exists()
+            conversation_ids = () if public else (
+                DirectMessage.objects.filter(file=name).values_list('conversation_id', flat=True).distinct()
+            )
+        cached = (public, frozenset(conversation_ids))
+        cache.set(key, cached, getattr(settings, 'CONVERSATION_MEMBERS_TIMEOUT', 3600))
+    return cached
+
+
+def forget(name):
+    """Drop the cached owners of `name` after its references changed"""
+    cache.delete(_key(OWNERS_KEY, name))
+
+
+def access(user, name):
+    """'public' or 'private' if `user` may read `name`, otherwise None"""
+    if not name.startswith(PRIVATE_PREFIXES):
+        return 'public'  # site images and the default avatar
+    public, conversation_ids = owners(name)
+    if public:
+        return 'public'
+    if user.is_authenticated and any(is_participant(cid, user.id) for cid in conversation_ids):
+        return 'private'
+    return None
+
+
+def content_etag(name, path, st):
+    """Strong ETag of the file's content"""
+    if is_blob(name):
+        return quote_etag(sha256_of(name))
+    key = _key(ETAG_KEY, name, st.st_mtime_ns, st.st_size)
+    digest = cache.get(key)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+        cache.set(key, digest, None)
+    return quote_etag(digest)
+
+
+def byte_range(request, size, etag, last_modified):
+    """
+    ``(start, end)`` inclusive of the requested single byte range, or None
+    to send the whole file. Raises ValueError for an unsatisfiable range.
+    """
+    match = RANGE.match(request.headers.get('Range', '').strip())
+    if not match or not any(match.groups()):
+        return None  # no range, or multiple ranges, which get the whole file
+
+    # A range against a different version of the file is answered in full
+    if_range = request.headers.get('If-Range', '').strip()
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != last_modified:
+            return None
+
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+        if not int(last):
+            raise ValueError('empty suffix range')
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    if start >= size:
+        raise ValueError('range starts beyond the file')
+    return start, end
+
+
+async def read_range(path, start, length):
+    """Async iterator over `length` bytes of `path` from `start`"""
+    f = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+    try:
+        await sync_to_async(f.seek, thread_sensitive=False)(start)
+        while length > 0:
+            block = await sync_to_async(f.read, thread_sensitive=False)(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
+async def serve(request, path):
+    """Serve the media file at `path` under MEDIA_ROOT"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Media file not found')
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('Media file not found')
+
+    # request.user, already loaded by the middleware, rather than auser()
+    visibility = await sync_to_async(access)(request.user, name)
+    if visibility is None:
+        # Same answer as a missing file, so ids cannot be probed
+        raise Http404('Media file not found')
+
+    etag = await sync_to_async(content_etag, thread_sensitive=False)(name, full_path, st)
+    last_modified = int(st.st_mtime)
+    content_type, encoding = mimetypes.guess_type(name)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': f'{visibility}, ' + (IMMUTABLE if is_blob(name) else 'no-cache'),
+        'Accept-Ranges': 'bytes',
+    }
+    response = HttpResponse(headers=headers)
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+    if conditional is not response:
+        return conditional
+
+    content_type = content_type or 'application/octet-stream'
+    offload = getattr(settings, 'MEDIA_SENDFILE', None)
+    if offload:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if offload == 'x-accel-redirect':
+            prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + quote(name)
+        else:
+            response['X-Sendfile'] = full_path
+        return response
+
+    try:
+        requested = byte_range(request, st.st_size, etag, last_modified)
+    except ValueError:
+        response = HttpResponse(status=416, headers=headers)
+        response['Content-Range'] = f'bytes */{st.st_size}'
+        return response
+
+    start, end = requested or (0, st.st_size - 1)
+    length = end - start + 1
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, headers=headers)
+    else:
+        response = StreamingHttpResponse(read_range(full_path, start, length), content_type=content_type, headers=headers)
+    if requested:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+    response['Content-Length'] = str(max(length, 0))
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
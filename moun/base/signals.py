@@ -0,0 +1,236 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import media, membership, messaging, search, serving, storage
+from .follow_graph import follow_graph
+from .models import Conversation, DirectMessage, Follow, Message, Room, Topic, User
+
+
+@receiver(post_save, sender=DirectMessage)
+def direct_message_created(sender, instance, created, **kwargs):
+    """Point the conversation at its newest message, bump recipients' unread counters and queue media processing"""
+    if not created:
+        return
+    Conversation.objects.filter(id=instance.conversation_id).filter(
+        Q(last_message_at__isnull=True) | Q(last_message_at__lte=instance.created)
+    ).update(last_message=instance, last_message_at=instance.created)
+
+    if instance.file and instance.file_type in ('image', 'video', 'voice'):
+        transaction.on_commit(lambda: media.schedule(instance.id))
+
+    if not instance.is_read:
+        User.objects.filter(conversations=instance.conversation_id).exclude(
+            id=instance.sender_id
+        ).update(unread_messages_count=F('unread_messages_count') + 1)
+
+
+@receiver(pre_delete, sender=DirectMessage)
+def direct_message_about_to_delete(sender, instance, **kwargs):
+    # Deleting the conversation removes its participant rows before post_delete runs
+    if not instance.is_read:
+        instance._unread_recipients = membership.participant_ids(instance.conversation_id) - {instance.sender_id}
+
+
+@receiver(post_delete, sender=DirectMessage)
+def direct_message_deleted(sender, instance, **kwargs):
+    """Fall back to the previous message, release unread counters and drop the media variants of a removed message"""
+    # on_delete=SET_NULL has already cleared last_message by the time this runs
+    Conversation.objects.filter(
+        id=instance.conversation_id, last_message__isnull=True
+    ).refresh_last_message()
+
+    if instance.file and instance.file_type in ('image', 'video', 'voice'):
+        # Bound now: the instance's pk is cleared once the delete completes
+        message_id = instance.id
+        transaction.on_commit(lambda: media.delete_variants(message_id))
+
+    if not instance.is_read:
+        recipients = getattr(instance, '_unread_recipients', None)
+        if recipients is None:
+            recipients = membership.participant_ids(instance.conversation_id) - {instance.sender_id}
+        User.objects.filter(id__in=recipients).update(
+            unread_messages_count=Greatest(F('unread_messages_count') - 1, 0)
+        )
+        messaging.push_unread_delta(recipients, -1)
+
+
+@receiver(post_save, sender=DirectMessage)
+def direct_message_file_retained(sender, instance, created, **kwargs):
+    if created and instance.file:
+        name = instance.file.name
+        storage.retain(name)
+        transaction.on_commit(lambda: serving.forget(name))
+
+
+@receiver(post_delete, sender=DirectMessage)
+def direct_message_file_released(sender, instance, **kwargs):
+    if instance.file:
+        name = instance.file.name
+        transaction.on_commit(lambda: (storage.release(name), serving.forget(name)))
+
+
+@receiver(pre_save, sender=User)
+def user_about_to_save(sender, instance, update_fields=None, **kwargs):
+    # Remember the stored avatar so post_save can move its blob reference
+    if instance.pk and (update_fields is None or 'avatar' in update_fields):
+        instance._previous_avatar = User.objects.filter(pk=instance.pk).values_list('avatar', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_avatar_changed(sender, instance, created, **kwargs):
+    current = instance.avatar.name if instance.avatar else None
+    previous = None if created else getattr(instance, '_previous_avatar', current)
+    instance._previous_avatar = current
+    if current == previous:
+        return
+    storage.retain(current)
+    if current:
+        transaction.on_commit(lambda: serving.forget(current))
+    if previous:
+        transaction.on_commit(lambda: (storage.release(previous), serving.forget(previous)))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    if instance.avatar:
+        name = instance.avatar.name
+        transaction.on_commit(lambda: (storage.release(name), serving.forget(name)))
+
+
+@receiver(pre_save, sender=Room)
+def room_about_to_save(sender, instance, **kwargs):
+    """Remember the stored topic so post_save can move the room between counters"""
+    instance._previous_topic_id = None
+    if instance.pk:
+        instance._previous_topic_id = (
+            Room.objects.filter(pk=instance.pk).values_list('topic_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Room)
+def room_saved(sender, instance, created, **kwargs):
+    previous_topic_id = None if created else getattr(instance, '_previous_topic_id', None)
+    if previous_topic_id != instance.topic_id:
+        if previous_topic_id:
+            Topic.objects.filter(id=previous_topic_id).update(
+                room_count=Greatest(F('room_count') - 1, 0)
+            )
+        if instance.topic_id:
+            Topic.objects.filter(id=instance.topic_id).update(room_count=F('room_count') + 1)
+
+    if search.fts_enabled():
+        search.index_room(instance)
+
+
+@receiver(post_delete, sender=Room)
+def room_deleted(sender, instance, **kwargs):
+    if instance.topic_id:
+        Topic.objects.filter(id=instance.topic_id).update(
+            room_count=Greatest(F('room_count') - 1, 0)
+        )
+
+    if search.fts_enabled():
+        search.unindex('room', instance.id)
+
+
+@receiver(post_save, sender=Topic)
+def topic_saved(sender, instance, **kwargs):
+    if search.fts_enabled():
+        search.index_topic(instance)
+        # Room documents carry their topic's name
+        for room in instance.room_set.select_related('topic'):
+            search.index_room(room)
+
+
+@receiver(post_delete, sender=Topic)
+def topic_deleted(sender, instance, **kwargs):
+    if search.fts_enabled():
+        search.unindex('topic', instance.id)
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, **kwargs):
+    if search.fts_enabled():
+        search.index_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    if search.fts_enabled():
+        search.unindex('message', instance.id)
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def room_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Room.participant_count in step with joins and leaves"""
+    if reverse and action == 'pre_clear':
+        # user.participants.clear() does not report which rooms it leaves
+        instance._cleared_room_ids = list(instance.participants.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Room.objects.filter(id=instance.id).refresh_participant_count()
+    else:
+        room_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_room_ids', [])
+        if room_ids:
+            Room.objects.filter(id__in=room_ids).refresh_participant_count()
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def conversation_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached member sets of conversations whose participants changed"""
+    if reverse and action == 'pre_clear':
+        instance._cleared_conversation_ids = list(instance.conversations.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        conversation_ids = [instance.id]
+    else:
+        conversation_ids = list(pk_set) if action != 'post_clear' else getattr(instance, '_cleared_conversation_ids', [])
+    if conversation_ids:
+        transaction.on_commit(lambda: membership.invalidate(*conversation_ids))
+
+
+@receiver(post_delete, sender=Conversation)
+def conversation_deleted(sender, instance, **kwargs):
+    # Bound now: the instance's pk is cleared once the delete completes
+    conversation_id = instance.id
+    transaction.on_commit(lambda: membership.invalidate(conversation_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """Bump both users' counters and flag the pair as mutual when followed back"""
+    if not created:
+        return
+    User.objects.filter(id=instance.followed_id).update(follower_count=F('follower_count') + 1)
+    User.objects.filter(id=instance.follower_id).update(following_count=F('following_count') + 1)
+
+    followed_back = Follow.objects.filter(
+        follower_id=instance.followed_id, followed_id=instance.follower_id
+    ).update(is_mutual=True)
+    if followed_back:
+        Follow.objects.filter(pk=instance.pk).update(is_mutual=True)
+        instance.is_mutual = True
+
+    transaction.on_commit(lambda: follow_graph.invalidate(instance.follower_id, instance.followed_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    User.objects.filter(id=instance.followed_id).update(
+        follower_count=Greatest(F('follower_count') - 1, 0)
+    )
+    User.objects.filter(id=instance.follower_id).update(
+        following_count=Greatest(F('following_count') - 1, 0)
+    )
+    Follow.objects.filter(
+        follower_id=instance.followed_id, followed_id=instance.follower_id
+    ).update(is_mutual=False)
+
+    transaction.on_commit(lambda: follow_graph.invalidate(instance.follower_id, instance.followed_id))
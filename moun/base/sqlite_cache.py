@@ -0,0 +1,155 @@
+"""
+A Django cache shared by every worker process on one host.
+
+The cache holds counters that several workers change at once: open socket
+counts in base.presence and follow-graph versions in base.follow_graph.
+FileBasedCache implements `add` as a check followed by a write and `incr` as
+a read followed by a write, with no lock between the processes, so two
+workers connecting the same user can both read 1 and both write 2, and the
+count never returns to zero. SQLiteCache keeps entries in one SQLite
+database (WAL mode, by default the channel layer's) and runs every
+read-modify-write inside BEGIN IMMEDIATE, which holds SQLite's write lock
+across processes, so concurrent `add`, `incr` and `decr` calls are applied
+one after the other.
+
+LOCATION is the database path. Expired entries are removed every
+`CULL_INTERVAL` seconds, and past MAX_ENTRIES the soonest-expiring
+1/CULL_FREQUENCY of the entries go too.
+"""
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL  -- NULL never expires
+);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+"""
+CULL_INTERVAL = 30
+LIVE = '(expires IS NULL OR expires > ?)'
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = str(location)
+        self._local = threading.local()
+        self._last_cull = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _write(self, function):
+        """Run `function(db, now)` holding the database's write lock"""
+        db = self._connection()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = function(db, now)
+            if now - self._last_cull > CULL_INTERVAL:
+                self._last_cull = now
+                self._cull(db, now)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return result
+
+    def _cull(self, db, now):
+        db.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        (count,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (max(1, count // self._cull_frequency),),
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+
+        def add(db, now):
+            db.execute(f'DELETE FROM cache WHERE key = ? AND NOT {LIVE}', (key, now))
+            return db.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires),
+            ).rowcount == 1
+
+        return self._write(add)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            f'SELECT value FROM cache WHERE key = ? AND {LIVE}', (key, time.time())
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({", ".join("?" * len(keys))}) AND {LIVE}',
+            (*keys, time.time()),
+        )
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.get_backend_timeout(timeout))
+        self._write(lambda db, now: db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', row
+        ))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+        return self._write(lambda db, now: db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {LIVE}', (expires, key, now)
+        ).rowcount == 1)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def incr(db, now):
+            row = db.execute(f'SELECT value FROM cache WHERE key = ? AND {LIVE}', (key, now)).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?', (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key)
+            )
+            return value
+
+        return self._write(incr)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda db, now: db.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {LIVE}', (key, time.time())
+        ).fetchone() is not None
+
+    def clear(self):
+        self._write(lambda db, now: db.execute('DELETE FROM cache'))
+
+    def close(self, **kwargs):
+        # Connections are kept per thread for the life of the process
+        pass
@@ -0,0 +1,212 @@
+"""
+Fingerprinted, precompressed static files.
+
+``python manage.py build_static`` collects ``static/`` into STATIC_ROOT
+through CompressedManifestStaticFilesStorage. Every file gets a copy named
+after its content hash (``style.3f2a9c1e0b4d.css``) listed in
+``staticfiles.json``, and text assets get ``.gz`` siblings, plus ``.br``
+ones when the optional ``brotli`` package is installed. Templates resolve
+names through ``{% static %}``, so they link the hashed copies once DEBUG is
+off.
+
+StaticFilesApp answers STATIC_URL requests in the ASGI stack ahead of
+Django's middleware. STATIC_ROOT is indexed once at startup, the smallest
+variant the client accepts is chosen from Accept-Encoding, and hashed names
+are sent with ``Cache-Control: immutable`` since their content can never
+change under the same URL.
+
+The service worker precaches the same hashed URLs (``precache_manifest``).
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from collections import namedtuple
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.map', '.ico', '.webmanifest')
+MIN_COMPRESS_SIZE = 512
+IN_MEMORY_SIZE = 256 * 1024  # larger files are read from disk per request
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+
+# Precached on install; the root page and offline page are added by the worker
+PRECACHE_CRITICAL = [
+    'styles/style.css',
+    'styles/pwa-install.css',
+    'js/script.js',
+    'js/offline-storage.js',
+    'js/offline-integration.js',
+    'js/pwa-install-prompt.js',
+    'manifest.json',
+    'images/avatar.svg',
+    'images/logo.png',
+]
+PRECACHE_ADDITIONAL = [
+    f'images/icons/android/android-launchericon-{size}-{size}.png' for size in (48, 72, 96, 144, 192, 512)
+]
+
+# Smallest first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+Variant = namedtuple('Variant', 'path size etag body')
+Asset = namedtuple('Asset', 'content_type cache_control variants')
+
+
+def compress(path):
+    """Write the .gz (and .br) siblings of `path` where they pay off"""
+    if not path.endswith(COMPRESSIBLE):
+        return
+    with open(path, 'rb') as f:
+        data = f.read()
+    encoders = {'.gz': lambda d: gzip.compress(d, 9, mtime=0)}
+    if brotli is not None:
+        encoders['.br'] = lambda d: brotli.compress(d, quality=11)
+    for suffix, encode in encoders.items():
+        packed = encode(data) if len(data) >= MIN_COMPRESS_SIZE else None
+        if packed is not None and len(packed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as f:
+                f.write(packed)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also precompresses what it collects"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in {*paths, *self.hashed_files.values()}:
+            compress(self.path(name))
+
+
+def precache_manifest():
+    """``{version, critical, additional}`` precache lists of the service worker"""
+    critical = [staticfiles_storage.url(name) for name in PRECACHE_CRITICAL]
+    additional = [staticfiles_storage.url(name) for name in PRECACHE_ADDITIONAL]
+    # The hashed URLs change with the content, and so does the version
+    version = hashlib.md5(json.dumps([critical, additional]).encode()).hexdigest()[:12]
+    return {'version': version, 'critical': critical, 'additional': additional}
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def index(root):
+    """Map every collected file under `root` to its Asset"""
+    root = Path(root)
+    try:
+        with open(root / 'staticfiles.json') as f:
+            hashed = set(json.load(f)['paths'].values())
+    except (OSError, ValueError, KeyError):
+        return {}
+
+    assets = {}
+    for directory, _, files in os.walk(root):
+        for file in files:
+            path = os.path.join(directory, file)
+            name = Path(path).relative_to(root).as_posix()
+            if name.endswith(('.gz', '.br')) or name == 'staticfiles.json':
+                continue
+            variants = {}
+            for encoding, suffix in ((None, ''), *ENCODINGS):
+                if os.path.exists(path + suffix):
+                    variants[encoding] = load(path + suffix, encoding)
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            assets[name] = Asset(content_type, IMMUTABLE if name in hashed else REVALIDATE, variants)
+    return assets
+
+
+def load(path, encoding):
+    with open(path, 'rb') as f:
+        body = f.read()
+    digest = hashlib.md5(body).hexdigest()
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    return Variant(path, len(body), etag, body if len(body) <= IN_MEMORY_SIZE else None)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class StaticFilesApp:
+    """
+    ASGI application serving STATIC_ROOT, passing everything else on.
+
+    The index is built once; run build_static before starting the server.
+    Requests for names not collected fall through to `application`.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        root = getattr(settings, 'STATIC_ROOT', None)
+        self.assets = index(root) if root else {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.prefix):
+            return await self.application(scope, receive, send)
+        asset = self.assets.get(scope['path'][len(self.prefix):])
+        if asset is None:
+            return await self.application(scope, receive, send)
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await self.respond(send, 405, [(b'allow', b'GET, HEAD')])
+
+        request_headers = {}
+        for key, value in scope.get('headers', []):
+            request_headers[key.decode('latin-1').lower()] = value.decode('latin-1')
+        accepted = accepted_encodings(request_headers.get('accept-encoding', ''))
+        encoding = next((e for e, _ in ENCODINGS if e in accepted and e in asset.variants), None)
+        variant = asset.variants[encoding]
+
+        headers = [
+            (b'etag', variant.etag.encode()),
+            (b'cache-control', asset.cache_control.encode()),
+        ]
+        if len(asset.variants) > 1:
+            headers.append((b'vary', b'Accept-Encoding'))
+        etags = parse_etags(request_headers.get('if-none-match', ''))
+        if '*' in etags or variant.etag in etags:
+            return await self.respond(send, 304, headers)
+
+        headers += [
+            (b'content-type', asset.content_type.encode()),
+            (b'content-length', str(variant.size).encode()),
+        ]
+        if encoding:
+            headers.append((b'content-encoding', encoding.encode()))
+        body = b''
+        if scope['method'] == 'GET':
+            body = variant.body if variant.body is not None else await sync_to_async(read, thread_sensitive=False)(variant.path)
+        await self.respond(send, 200, headers, body)
+
+    async def respond(self, send, status, headers, body=b''):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,185 @@
+"""
+Content-addressed storage for uploaded media.
+
+Every file saved through ``media_storage`` is named after the SHA-256 of its
+content and kept in a sharded tree, ``blobs/ab/cd/abcd...<ext>``. The same
+photo uploaded twice is stored once. A Blob row per stored file counts the
+DirectMessage.file and User.avatar values pointing at it; the signal
+handlers in ``base.signals`` retain and release those references, and the
+file is deleted when the last one goes. Placing a file, counting and
+deleting all happen with the blob's row locked, so a save and a release of
+the same content cannot interleave; saves must run in the transaction that
+retains the reference. ``purge_orphan_blobs`` removes files left without a
+row. Knowing a blob's hash also lets a client skip uploading content it can
+already read (see ``base.views.create_upload``).
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+BLOB_PREFIX = 'blobs'
+INCOMING_PREFIX = '.incoming-'
+
+
+def blob_name(sha256, extension=''):
+    return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{BLOB_PREFIX}/')
+
+
+def sha256_of(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that ignores the requested name and stores by content hash"""
+
+    def get_available_name(self, name, max_length=None):
+        # The real name is only known once the content is hashed in _save
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()[:16]
+        staging = self.path(BLOB_PREFIX)
+        os.makedirs(staging, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=staging, prefix=INCOMING_PREFIX, delete=False) as tmp:
+            for chunk in content.chunks():
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        name = blob_name(digest.hexdigest(), extension)
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with transaction.atomic():
+            # The file is (re)placed while its row is locked, so a release()
+            # of the same content cannot delete it before the reference this
+            # save is for is retained in the caller's transaction
+            lock(name, size)
+            os.replace(tmp.name, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name
+
+
+content_storage = ContentAddressedStorage()
+
+
+def media_storage():
+    """Storage of uploaded media fields; a callable keeps migrations stable"""
+    return content_storage
+
+
+def lock(name, size=None):
+    """
+    Lock the Blob row of `name` until the current transaction ends, creating
+    it unreferenced if missing. Raises FileNotFoundError when there is
+    neither a row nor a file.
+    """
+    from .models import Blob
+
+    # A no-op UPDATE takes the row lock on every backend, SQLite included
+    if Blob.objects.filter(name=name).update(ref_count=F('ref_count')):
+        return
+    Blob.objects.get_or_create(
+        name=name,
+        defaults={
+            'sha256': sha256_of(name),
+            'size': size if size is not None else content_storage.size(name),
+            'ref_count': 0,
+        },
+    )
+
+
+def retain(name):
+    """Count one more reference to the blob `name`"""
+    from .models import Blob
+
+    if not is_blob(name):
+        return
+    with transaction.atomic():
+        lock(name)
+        Blob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+
+def release(name):
+    """Drop one reference to the blob `name`, deleting it with the last one"""
+    from .models import Blob
+
+    if not is_blob(name):
+        return
+    with transaction.atomic():
+        if not Blob.objects.filter(name=name).update(ref_count=Greatest(F('ref_count') - 1, 0)):
+            return
+        if Blob.objects.filter(name=name, ref_count=0).delete()[0]:
+            # Still holding the lock: a concurrent save of this content waits
+            # and then writes the file again
+            content_storage.delete(name)
+
+
+def discard(name):
+    """Delete the blob `name` if nothing references it, e.g. after a failed save"""
+    from .models import Blob
+
+    if not is_blob(name):
+        return
+    with transaction.atomic():
+        if Blob.objects.filter(name=name).update(ref_count=F('ref_count')):
+            if not Blob.objects.filter(name=name, ref_count=0).delete()[0]:
+                return
+        content_storage.delete(name)
+
+
+def orphans(older_than):
+    """
+    Names of blob files with no Blob row and of abandoned partial writes,
+    last modified before the `older_than` timestamp
+    """
+    from .models import Blob
+
+    root = content_storage.path(BLOB_PREFIX)
+    for directory, _, files in os.walk(root):
+        candidates = {}
+        for file in files:
+            path = os.path.join(directory, file)
+            try:
+                if os.path.getmtime(path) >= older_than:
+                    continue  # possibly a save in progress
+            except FileNotFoundError:
+                continue
+            name = os.path.relpath(path, content_storage.location).replace(os.sep, '/')
+            if file.startswith(INCOMING_PREFIX):
+                yield name
+            else:
+                candidates[name] = True
+        if candidates:
+            known = set(Blob.objects.filter(name__in=list(candidates)).values_list('name', flat=True))
+            yield from (name for name in candidates if name not in known)
+
+
+def find(sha256, user):
+    """
+    The stored Blob with this content hash, if `user` can already read it.
+
+    Limited to content the user has sent, received or uses as an avatar, so
+    a hash alone does not confirm that anybody stored a file.
+    """
+    from .models import Blob, DirectMessage
+
+    blob = Blob.objects.filter(sha256=(sha256 or '').lower(), ref_count__gt=0).first()
+    if blob is None:
+        return None
+    if user.avatar and user.avatar.name == blob.name:
+        return blob
+    if DirectMessage.objects.filter(file=blob.name, conversation__participants=user).exists():
+        return blob
+    return None
@@ -1,24 +1,38 @@
 # tasks.py
-import requests
-import json
-from .models import User
-from celery import shared_task
-from django.http import HttpRequest
-from .views import check_user_status
+# Presence is pushed over NotificationConsumer (see base.presence), so there is
+# no longer a periodic check_user_status task.
+import logging
+
+from asgiref.sync import async_to_sync
 from celery import shared_task
+from channels.layers import get_channel_layer
+
+from . import media
+from .models import DirectMessage
+
+logger = logging.getLogger(__name__)
 
-# @shared_task
-# def check_user_status_task():
-#     request = HttpRequest()
-#     request.user = User.objects.first()  # replace with your logic to get the user
-#     response = check_user_status(request)
-#     data = response.getvalue()
-#     with open('user_status.json', 'w') as f:
-#         json.dump(data, f)
 
-@shared_task
-def check_user_status_task():
-    response = requests.get('http://localhost:8000/check_user_status/')
-    data = response.json()
-    with open('user_status.json', 'w') as f:
-        json.dump(data, f)
\ No newline at end of file
+@shared_task(ignore_result=True)
+def process_message_media(message_id):
+    """Build image/video variants for a message and tell open chats about them"""
+    message = DirectMessage.objects.select_related('sender', 'reply_to__sender').filter(id=message_id).first()
+    if message is None or not message.file:
+        return
+    try:
+        variants = media.process(message)
+    except Exception:
+        logger.exception('[Media] Processing failed for message %s', message_id)
+        return
+    if variants and not DirectMessage.objects.filter(id=message_id).exists():
+        # Deleted while processing, after its variants were cleaned up
+        media.delete_variants(message_id)
+        return
+    if variants:
+        async_to_sync(get_channel_layer().group_send)(
+            f'chat_{message.conversation_id}',
+            {
+                'type': 'media_ready',
+                'message': message.to_payload()
+            }
+        )
@@ -0,0 +1,5 @@
+from base.presence import presence_buffer
+
+# Requests made by tests must not leave heartbeats behind for later tests,
+# nor start the flusher thread
+presence_buffer.enabled = False
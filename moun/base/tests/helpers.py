@@ -0,0 +1,51 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from base.models import Conversation, DirectMessage, User
+
+# Templates resolve {% static %} without a collected manifest
+plain_static = override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+def make_user(username):
+    return User.objects.create_user(email=f'{username}@example.com', username=username)
+
+
+def make_conversation(*users):
+    conversation = Conversation.objects.create()
+    conversation.participants.add(*users)
+    return conversation
+
+
+def send(conversation, sender, body='hi', **fields):
+    return DirectMessage.objects.create(conversation=conversation, sender=sender, body=body, **fields)
+
+
+class MediaTestMixin:
+    """
+    A temporary MEDIA_ROOT and upload staging directory, an empty cache and
+    a conversation between `alice` and `bob`; `media_settings` overrides
+    further settings for the test.
+    """
+    media_settings = {}
+
+    def setUp(self):
+        super().setUp()
+        # Cached members and owners would outlive ids reused by the next test
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root, CHAT_UPLOAD_STAGING_DIR=f'{self.media_root}/staging', **self.media_settings
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.conversation = make_conversation(self.alice, self.bob)
@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from channels.exceptions import ChannelFull
+from django.test import SimpleTestCase
+
+from base.channel_layer import SQLiteChannelLayer
+
+
+class SQLiteChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.path = os.path.join(self.root, 'channels.sqlite3')
+
+    @contextlib.asynccontextmanager
+    async def layers(self, count=1, **options):
+        """`count` layers on one database, each standing in for a worker process"""
+        options = {'poll_interval': 0.1, **options}
+        layers = [SQLiteChannelLayer(path=self.path, **options) for _ in range(count)]
+        try:
+            yield layers
+        finally:
+            for layer in layers:
+                await layer.close()
+
+    async def receive(self, layer, channel, timeout=2):
+        return await asyncio.wait_for(layer.receive(channel), timeout)
+
+    async def assertNothingFor(self, layer, channel):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(layer, channel, timeout=0.3)
+
+    def group_members(self):
+        with contextlib.closing(sqlite3.connect(self.path)) as db:
+            return {row[0] for row in db.execute('SELECT channel FROM group_members')}
+
+    async def test_send_and_receive(self):
+        async with self.layers() as (layer,):
+            channel = await layer.new_channel()
+            await layer.send(channel, {'type': 'chat.message', 'n': 1})
+            await layer.send(channel, {'type': 'chat.message', 'n': 2})
+            self.assertEqual((await self.receive(layer, channel))['n'], 1)
+            self.assertEqual((await self.receive(layer, channel))['n'], 2)
+
+    async def test_send_between_processes(self):
+        async with self.layers(2) as (one, two):
+            channel = await two.new_channel()
+            await one.send(channel, {'type': 'hello'})
+            self.assertEqual(await self.receive(two, channel), {'type': 'hello'})
+            # A channel without a process id is polled from the database
+            await two.send('worker', {'type': 'job'})
+            self.assertEqual(await self.receive(one, 'worker'), {'type': 'job'})
+
+    async def test_group_send_reaches_every_process(self):
+        async with self.layers(2) as (one, two):
+            channels = [await one.new_channel(), await one.new_channel(), await two.new_channel()]
+            for channel in channels:
+                await one.group_add('chat_1', channel)
+            await two.group_send('chat_1', {'type': 'new_message'})
+            await one.group_send('chat_2', {'type': 'nobody'})
+            for layer, channel in zip((one, one, two), channels):
+                self.assertEqual(await self.receive(layer, channel), {'type': 'new_message'})
+            await self.assertNothingFor(two, channels[2])
+
+    async def test_group_discard(self):
+        async with self.layers() as (layer,):
+            kept, dropped = await layer.new_channel(), await layer.new_channel()
+            await layer.group_add('chat_1', kept)
+            await layer.group_add('chat_1', dropped)
+            await layer.group_discard('chat_1', dropped)
+            await layer.group_send('chat_1', {'type': 'new_message'})
+            self.assertEqual(await self.receive(layer, kept), {'type': 'new_message'})
+            await self.assertNothingFor(layer, dropped)
+
+    async def test_expired_messages_are_not_delivered(self):
+        async with self.layers(expiry=0.1) as (layer,):
+            channel = await layer.new_channel()
+            await layer.send(channel, {'type': 'late'})
+            await layer.send('worker', {'type': 'late'})
+            await asyncio.sleep(0.2)
+            await layer.send(channel, {'type': 'fresh'})
+            await layer.send('worker', {'type': 'fresh'})
+            self.assertEqual(await self.receive(layer, channel), {'type': 'fresh'})
+            self.assertEqual(await self.receive(layer, 'worker'), {'type': 'fresh'})
+
+    async def test_capacity(self):
+        async with self.layers(capacity=2) as (layer,):
+            for n in range(2):
+                await layer.send('worker', {'type': 'job', 'n': n})
+            with self.assertRaises(ChannelFull):
+                await layer.send('worker', {'type': 'job', 'n': 2})
+
+            # A full member of a group does not hold the others back
+            full, listening = await layer.new_channel(), await layer.new_channel()
+            for channel in (full, listening):
+                await layer.group_add('chat_1', channel)
+            with self.assertLogs('base.channel_layer', 'WARNING'):
+                for n in range(3):
+                    await layer.group_send('chat_1', {'type': 'new_message', 'n': n})
+                    self.assertEqual((await self.receive(layer, listening))['n'], n)
+            self.assertEqual([(await self.receive(layer, full))['n'] for _ in range(2)], [0, 1])
+            await self.assertNothingFor(layer, full)
+
+    async def test_flush(self):
+        async with self.layers() as (layer,):
+            channel = await layer.new_channel()
+            await layer.group_add('chat_1', channel)
+            await layer.send('worker', {'type': 'job'})
+            await layer.flush()
+            self.assertEqual(self.group_members(), set())
+            await self.assertNothingFor(layer, 'worker')
+
+    async def test_channels_of_an_exited_process_leave_their_groups(self):
+        async with self.layers(2) as (one, two):
+            alive, gone = await one.new_channel(), await two.new_channel()
+            await one.group_add('chat_1', alive)
+            await one.group_add('chat_1', gone)
+            await two.close()
+            await one.group_send('chat_1', {'type': 'new_message'})
+            self.assertEqual(await self.receive(one, alive), {'type': 'new_message'})
+            self.assertEqual(self.group_members(), {alive})
+
+    async def test_messages_are_not_shared_between_receivers(self):
+        async with self.layers() as (layer,):
+            first, second = await layer.new_channel(), await layer.new_channel()
+            await layer.group_add('chat_1', first)
+            await layer.group_add('chat_1', second)
+            await layer.group_send('chat_1', {'type': 'new_message', 'seen': []})
+            (await self.receive(layer, first))['seen'].append(first)
+            self.assertEqual(await self.receive(layer, second), {'type': 'new_message', 'seen': []})
@@ -0,0 +1,69 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from base import membership
+from base.models import Conversation, Follow
+
+from .helpers import make_conversation, make_user
+
+
+class DirectConversationTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+
+    def test_pair_is_canonical(self):
+        first, created = Conversation.objects.get_or_create_direct(self.bob, self.alice)
+        self.assertTrue(created)
+        second, created = Conversation.objects.get_or_create_direct(self.alice, self.bob)
+        self.assertFalse(created)
+        self.assertEqual(first, second)
+        self.assertEqual(set(first.participants.values_list('id', flat=True)), {self.alice.id, self.bob.id})
+
+    def test_start_conversation_requires_mutual_follow(self):
+        self.client.force_login(self.alice)
+        url = reverse('start-conversation', args=[self.bob.id])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=self.alice, followed=self.bob)
+            Follow.objects.create(follower=self.bob, followed=self.alice)
+        response = self.client.get(url)
+        conversation = Conversation.objects.get()
+        self.assertEqual(response.json(), {'success': True, 'redirect': f'/conversation/{conversation.id}/'})
+        self.client.get(url)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+
+class MembershipCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob, self.carol = make_user('alice'), make_user('bob'), make_user('carol')
+        self.conversation = make_conversation(self.alice, self.bob)
+
+    def test_members_are_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(membership.participant_ids(self.conversation.id), {self.alice.id, self.bob.id})
+            self.assertTrue(membership.is_participant(self.conversation.id, self.bob.id))
+            self.assertFalse(membership.is_participant(self.conversation.id, self.carol.id))
+
+    def test_changes_from_either_side_invalidate(self):
+        membership.participant_ids(self.conversation.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.add(self.carol)
+        self.assertTrue(membership.is_participant(self.conversation.id, self.carol.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.carol.conversations.remove(self.conversation)
+        self.assertFalse(membership.is_participant(self.conversation.id, self.carol.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.conversations.clear()
+        self.assertEqual(membership.participant_ids(self.conversation.id), {self.alice.id})
+
+    def test_deleted_conversation_has_no_members(self):
+        conversation_id = self.conversation.id
+        membership.participant_ids(conversation_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.delete()
+        self.assertEqual(membership.participant_ids(conversation_id), frozenset())
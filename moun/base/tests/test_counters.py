@@ -0,0 +1,84 @@
+from django.test import TestCase
+
+from base.models import Room, Topic
+
+from .helpers import make_user
+
+
+def room_counts():
+    return dict(Topic.objects.values_list('name', 'room_count'))
+
+
+class TopicRoomCountTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host')
+        self.python = Topic.objects.create(name='Python')
+        self.cooking = Topic.objects.create(name='Cooking')
+
+    def test_create_move_and_delete(self):
+        room = Room.objects.create(host=self.host, topic=self.python, name='a')
+        Room.objects.create(host=self.host, topic=self.python, name='b')
+        self.assertEqual(room_counts(), {'Python': 2, 'Cooking': 0})
+
+        room.topic = self.cooking
+        room.save()
+        self.assertEqual(room_counts(), {'Python': 1, 'Cooking': 1})
+
+        room.name = 'renamed'
+        room.save()
+        self.assertEqual(room_counts(), {'Python': 1, 'Cooking': 1})
+
+        room.delete()
+        self.assertEqual(room_counts(), {'Python': 1, 'Cooking': 0})
+
+    def test_deleting_topic_leaves_rooms_without_topic(self):
+        room = Room.objects.create(host=self.host, topic=self.python, name='a')
+        self.python.delete()
+        room.refresh_from_db()
+        room.delete()
+        self.assertEqual(room_counts(), {'Cooking': 0})
+
+    def test_topics_are_ordered_by_popularity(self):
+        Room.objects.create(host=self.host, topic=self.cooking, name='a')
+        Topic.objects.create(name='Art')
+        self.assertEqual([t.name for t in Topic.objects.all()], ['Cooking', 'Art', 'Python'])
+
+
+class RoomParticipantCountTests(TestCase):
+    def setUp(self):
+        self.host, self.bob, self.carol = make_user('host'), make_user('bob'), make_user('carol')
+        self.room = Room.objects.create(host=self.host, name='a')
+
+    def participant_count(self):
+        return Room.objects.values_list('participant_count', flat=True).get(pk=self.room.pk)
+
+    def test_both_directions_of_the_relation(self):
+        self.room.participants.add(self.bob, self.carol)
+        self.assertEqual(self.participant_count(), 2)
+        self.carol.participants.remove(self.room)
+        self.assertEqual(self.participant_count(), 1)
+        self.bob.participants.clear()
+        self.assertEqual(self.participant_count(), 0)
+        self.room.participants.add(self.bob)
+        self.room.participants.clear()
+        self.assertEqual(self.participant_count(), 0)
+
+    def test_feed_query_count_is_fixed(self):
+        rooms = [Room.objects.create(host=self.host, name=f'r{i}') for i in range(3)]
+        for room in rooms:
+            room.participants.add(self.bob, self.carol)
+        rooms[0].participants.add(self.host)
+        # rooms with host and topic, then the sampled participants
+        with self.assertNumQueries(2):
+            feed = list(Room.objects.for_feed(self.host))
+        members = {room.name: room.is_member for room in feed}
+        self.assertEqual(members, {'a': False, 'r0': True, 'r1': False, 'r2': False})
+        self.assertEqual(
+            [len(room.sampled_participants) for room in feed if room.name != 'a'], [2, 2, 3]
+        )
+
+    def test_feed_samples_at_most_sample_size_participants(self):
+        self.room.participants.add(*[make_user(f'u{i}') for i in range(5)])
+        room = Room.objects.for_feed(self.host, sample_size=3).get(pk=self.room.pk)
+        self.assertEqual(len(room.sampled_participants), 3)
+        self.assertEqual(room.participant_count, 5)
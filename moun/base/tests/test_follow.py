@@ -0,0 +1,132 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from base.follow_graph import FollowGraph, follow_graph
+from base.models import Follow, User
+
+from .helpers import make_user
+
+
+def counts(user):
+    return tuple(User.objects.values_list('follower_count', 'following_count').get(pk=user.pk))
+
+
+def mutual_flags():
+    return dict(
+        ((follow.follower.username, follow.followed.username), follow.is_mutual)
+        for follow in Follow.objects.select_related('follower', 'followed')
+    )
+
+
+class FollowCounterTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+
+    def test_counters_follow_edges(self):
+        Follow.objects.create(follower=self.alice, followed=self.bob)
+        self.assertEqual((counts(self.alice), counts(self.bob)), ((0, 1), (1, 0)))
+        Follow.objects.filter(follower=self.alice).delete()
+        self.assertEqual((counts(self.alice), counts(self.bob)), ((0, 0), (0, 0)))
+
+    def test_follow_back_marks_both_edges_mutual(self):
+        Follow.objects.create(follower=self.alice, followed=self.bob)
+        self.assertEqual(mutual_flags(), {('alice', 'bob'): False})
+        back = Follow.objects.create(follower=self.bob, followed=self.alice)
+        self.assertTrue(back.is_mutual)
+        self.assertEqual(mutual_flags(), {('alice', 'bob'): True, ('bob', 'alice'): True})
+
+        back.delete()
+        self.assertEqual(mutual_flags(), {('alice', 'bob'): False})
+
+    def test_saving_a_loaded_user_keeps_newer_counts(self):
+        bob = User.objects.get(pk=self.bob.pk)
+        Follow.objects.create(follower=self.alice, followed=self.bob)
+        bob.bio = 'updated'
+        bob.save()
+        self.assertEqual(counts(self.bob), (1, 0))
+
+    def test_reconcile_recomputes_counters_and_flags(self):
+        Follow.objects.create(follower=self.alice, followed=self.bob)
+        Follow.objects.create(follower=self.bob, followed=self.alice)
+        User.objects.update(follower_count=7, following_count=0)
+        Follow.objects.update(is_mutual=False)
+        call_command('reconcile_follow_counts', stdout=StringIO())
+        self.assertEqual((counts(self.alice), counts(self.bob)), ((1, 1), (1, 1)))
+        self.assertEqual(mutual_flags(), {('alice', 'bob'): True, ('bob', 'alice'): True})
+
+    def test_deleting_user_releases_counters(self):
+        carol = make_user('carol')
+        Follow.objects.create(follower=self.alice, followed=self.bob)
+        Follow.objects.create(follower=carol, followed=self.bob)
+        self.alice.delete()
+        self.assertEqual(counts(self.bob), (1, 0))
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.graph = FollowGraph(ttl=30)
+
+    def test_lookups_after_the_first_are_query_free(self):
+        Follow.objects.create(follower=self.alice, followed=self.bob)
+        Follow.objects.create(follower=self.bob, followed=self.alice)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.graph.is_following(self.alice.id, self.bob.id))
+            self.assertTrue(self.graph.is_mutual(self.alice.id, self.bob.id))
+            self.assertEqual(self.graph.mutuals_of(self.alice.id), [self.bob.id])
+
+    def test_version_bump_reloads_other_instances(self):
+        self.assertFalse(self.graph.is_following(self.alice.id, self.bob.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            # The signal invalidates the module-level graph, which bumps the version
+            Follow.objects.create(follower=self.alice, followed=self.bob)
+        self.assertTrue(self.graph.is_following(self.alice.id, self.bob.id))
+
+    def test_entries_expire_without_a_version_bump(self):
+        self.assertFalse(self.graph.is_following(self.alice.id, self.bob.id))
+        # A follow whose version bump never reached this worker's cache
+        Follow.objects.create(follower=self.alice, followed=self.bob)
+        cache.clear()
+        self.assertFalse(self.graph.is_following(self.alice.id, self.bob.id))
+        with mock.patch('base.follow_graph.time.monotonic', return_value=10 ** 9):
+            self.assertTrue(self.graph.is_following(self.alice.id, self.bob.id))
+
+    def test_least_recently_used_users_are_evicted(self):
+        graph = FollowGraph(max_users=1)
+        graph.is_following(self.alice.id, self.bob.id)
+        graph.is_following(self.bob.id, self.alice.id)
+        self.assertEqual(list(graph._entries), [self.bob.id])
+
+
+class FollowUserViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.client.force_login(self.alice)
+        self.url = reverse('follow-user', args=[self.bob.id])
+
+    def toggle(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()[str(self.bob.id)]
+
+    def test_toggle(self):
+        self.assertEqual(self.toggle(), {'num_followers': 1, 'is_following': True})
+        self.assertEqual(self.toggle(), {'num_followers': 0, 'is_following': False})
+
+    def test_stale_cache_does_not_cause_a_duplicate_follow(self):
+        with mock.patch.object(follow_graph, 'is_following', return_value=False):
+            Follow.objects.create(follower=self.alice, followed=self.bob)
+            self.assertEqual(self.toggle(), {'num_followers': 0, 'is_following': False})
+        with mock.patch.object(follow_graph, 'is_following', return_value=True):
+            self.assertEqual(self.toggle(), {'num_followers': 1, 'is_following': True})
+
+    def test_cannot_follow_self(self):
+        response = self.client.post(reverse('follow-user', args=[self.alice.id]))
+        self.assertEqual(response.status_code, 400)
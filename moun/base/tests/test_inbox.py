@@ -0,0 +1,78 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from base.models import Conversation
+
+from .helpers import make_conversation, make_user, plain_static, send
+
+
+class LastMessageTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.conversation = make_conversation(self.alice, self.bob)
+
+    def test_new_message_becomes_last_message(self):
+        send(self.conversation, self.alice, 'first')
+        second = send(self.conversation, self.bob, 'second')
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, second.id)
+        self.assertEqual(self.conversation.last_message_at, second.created)
+
+    def test_deleting_last_message_falls_back_to_previous(self):
+        first = send(self.conversation, self.alice, 'first')
+        send(self.conversation, self.bob, 'second').delete()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, first.id)
+
+        first.delete()
+        self.conversation.refresh_from_db()
+        self.assertIsNone(self.conversation.last_message_id)
+        self.assertIsNone(self.conversation.last_message_at)
+
+    def test_refresh_last_message(self):
+        message = send(self.conversation, self.alice)
+        Conversation.objects.filter(pk=self.conversation.pk).update(last_message=None, last_message_at=None)
+        Conversation.objects.filter(pk=self.conversation.pk).refresh_last_message()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, message.id)
+
+
+@plain_static
+class InboxTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.client.force_login(self.alice)
+
+    def add_conversation(self, username):
+        other = make_user(username)
+        conversation = make_conversation(self.alice, other)
+        send(conversation, other, f'from {username}')
+        send(conversation, other, f'again from {username}')
+        return conversation
+
+    def inbox_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('inbox'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_conversations(self):
+        self.add_conversation('bob')
+        few, _ = self.inbox_queries()
+        for username in ('carol', 'dave', 'erin'):
+            self.add_conversation(username)
+        many, _ = self.inbox_queries()
+        self.assertEqual(few, many)
+
+    def test_newest_conversation_first_with_unread_counts(self):
+        older = self.add_conversation('bob')
+        newer = self.add_conversation('carol')
+        send(newer, self.alice, 'reply')
+        _, response = self.inbox_queries()
+        rows = response.context['conversations_data']
+        self.assertEqual([row['conversation'].id for row in rows], [newer.id, older.id])
+        self.assertEqual([row['unread_count'] for row in rows], [2, 2])
+        self.assertEqual(rows[0]['last_message'].body, 'reply')
+        self.assertEqual(rows[1]['other_user'].username, 'bob')
@@ -0,0 +1,113 @@
+import io
+import os
+import subprocess
+import sys
+from array import array
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase
+from PIL import Image
+
+from base import media
+from base.models import DirectMessage
+from base.tasks import process_message_media
+
+from .helpers import MediaTestMixin
+
+
+def png(width=1600, height=900):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'teal').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class MediaVariantTests(MediaTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.message = DirectMessage.objects.create(
+            conversation=self.conversation, sender=self.alice,
+            file=ContentFile(png(), name='photo.png'), file_type='image', file_name='photo.png',
+        )
+
+    def variant_dir(self):
+        return os.path.join(self.media_root, media.variant_dir(self.message.id))
+
+    def test_image_variants_are_downscaled(self):
+        variants = media.process(self.message)
+        self.assertEqual(set(variants), {'thumb', 'preview', 'preview_jpeg'})
+        with default_storage.open(variants['thumb']) as f:
+            self.assertEqual(Image.open(f).size, (320, 180))
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.width, self.message.height), (1600, 900))
+        self.assertEqual(self.message.preview_url, default_storage.url(variants['preview_jpeg']))
+
+    def test_deleting_the_message_removes_its_variants(self):
+        media.process(self.message)
+        self.assertTrue(os.path.isdir(self.variant_dir()))
+        with mock.patch.object(media, 'schedule') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.message.delete()
+        self.assertFalse(os.path.exists(self.variant_dir()))
+        # Nothing is queued for the deleted message
+        schedule.assert_not_called()
+
+    def test_delete_variants_without_any_is_a_no_op(self):
+        media.delete_variants(self.message.id)
+        self.assertFalse(os.path.exists(self.variant_dir()))
+
+    def test_task_skips_deleted_messages(self):
+        message_id = self.message.id
+        DirectMessage.objects.filter(pk=message_id).delete()
+        process_message_media(message_id)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, media.variant_dir(message_id))))
+
+    def test_waveform_peaks(self):
+        self.assertEqual(media.waveform([0, 5, -10, 2], bars=2), [50, 100])
+        self.assertEqual(media.waveform([]), [])
+
+
+class VoiceProcessingTests(MediaTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.message = DirectMessage.objects.create(
+            conversation=self.conversation, sender=self.alice, voice_duration=9,
+            file=ContentFile(b'webm voice note', name='voice_1.webm'), file_type='voice', file_name='voice_1.webm',
+        )
+        self.calls = []
+
+    def fake_ffmpeg(self, args, **kwargs):
+        """Decodes to 2.5 s of PCM rising in loudness, and encodes to fixed bytes"""
+        self.calls.append(args)
+        if args[-1] == 'pipe:1':
+            samples = array('h', [i // 10 for i in range(int(media.WAVEFORM_RATE * 2.5))])
+            if sys.byteorder == 'big':
+                samples.byteswap()
+            return subprocess.CompletedProcess(args, 0, stdout=samples.tobytes(), stderr=b'')
+        with open(args[-1], 'wb') as encoded:
+            encoded.write(b'aac voice note')
+        return subprocess.CompletedProcess(args, 0, stdout=b'', stderr=b'')
+
+    def test_voice_is_measured_and_reencoded(self):
+        with mock.patch.object(media, 'find_ffmpeg', return_value='ffmpeg'), \
+                mock.patch.object(media.subprocess, 'run', side_effect=self.fake_ffmpeg):
+            variants = media.process(self.message)
+
+        self.assertEqual(set(variants), {'voice'})
+        with default_storage.open(variants['voice']) as f:
+            self.assertEqual(f.read(), b'aac voice note')
+        self.assertEqual(len(self.calls), 2)
+        self.message.refresh_from_db()
+        # The measured duration replaces the one the client sent
+        self.assertEqual(self.message.voice_duration, 2)
+        self.assertEqual(len(self.message.waveform), media.WAVEFORM_BARS)
+        self.assertEqual(self.message.waveform[-1], 100)
+        self.assertLess(self.message.waveform[0], self.message.waveform[-1])
+        self.assertEqual(self.message.variants, variants)
+
+    def test_without_ffmpeg_the_client_values_stay(self):
+        with mock.patch.object(media, 'find_ffmpeg', return_value=None):
+            self.assertEqual(media.process(self.message), {})
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.voice_duration, self.message.variants), (9, {}))
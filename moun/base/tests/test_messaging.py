@@ -0,0 +1,133 @@
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+
+from base import routing
+from base.models import DirectMessage
+
+from .helpers import make_conversation, make_user
+
+application = URLRouter(routing.websocket_urlpatterns)
+
+
+class CreateOnceTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.conversation = make_conversation(self.alice, self.bob)
+
+    def create(self, sender, client_id, body='hi'):
+        return DirectMessage.objects.create_once(
+            client_id=client_id, conversation=self.conversation, sender=sender, body=body
+        )
+
+    def test_repeated_client_id_returns_the_original(self):
+        first, created = self.create(self.alice, 'c1', 'hello')
+        self.assertTrue(created)
+        again, created = self.create(self.alice, 'c1', 'hello again')
+        self.assertFalse(created)
+        self.assertEqual(again.id, first.id)
+        self.assertEqual(again.body, 'hello')
+        self.assertEqual(DirectMessage.objects.count(), 1)
+
+    def test_client_ids_are_scoped_to_the_sender(self):
+        self.create(self.alice, 'c1')
+        _, created = self.create(self.bob, 'c1')
+        self.assertTrue(created)
+
+    def test_without_client_id_every_call_creates(self):
+        self.create(self.alice, None)
+        self.create(self.alice, '')
+        self.assertEqual(DirectMessage.objects.count(), 2)
+
+    def test_retry_does_not_count_twice(self):
+        self.create(self.alice, 'c1')
+        self.create(self.alice, 'c1')
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.unread_messages_count, 1)
+
+
+class ChatSocketTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.conversation = make_conversation(self.alice, self.bob)
+
+    async def connect(self, user, path):
+        communicator = WebsocketCommunicator(application, path)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def open_chat(self, user):
+        return await self.connect(user, f'/ws/chat/{self.conversation.id}/')
+
+    async def test_send_is_acknowledged_once_and_broadcast_once(self):
+        alice, bob = await self.open_chat(self.alice), await self.open_chat(self.bob)
+        frame = {'type': 'send_message', 'client_id': 'c1', 'body': ' hello '}
+
+        await alice.send_json_to(frame)
+        ack = await alice.receive_json_from()
+        self.assertEqual((ack['type'], ack['duplicate'], ack['message']['body']), ('ack', False, 'hello'))
+        self.assertEqual((await bob.receive_json_from())['message']['id'], ack['message']['id'])
+        # The sender's own socket is in the chat group too
+        self.assertEqual((await alice.receive_json_from())['type'], 'new_message')
+
+        await alice.send_json_to(frame)
+        again = await alice.receive_json_from()
+        self.assertEqual((again['duplicate'], again['message']['id']), (True, ack['message']['id']))
+        self.assertTrue(await bob.receive_nothing())
+        self.assertEqual(await DirectMessage.objects.acount(), 1)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_invalid_frames_get_errors(self):
+        alice = await self.open_chat(self.alice)
+        await alice.send_json_to({'type': 'send_message', 'client_id': '', 'body': 'x'})
+        self.assertEqual((await alice.receive_json_from())['error'], 'Invalid client_id')
+        await alice.send_json_to({'type': 'send_message', 'client_id': 'c1', 'body': '  '})
+        self.assertEqual((await alice.receive_json_from())['error'], 'Message body is required')
+        await alice.disconnect()
+
+    async def test_outsider_cannot_connect(self):
+        communicator = WebsocketCommunicator(application, f'/ws/chat/{self.conversation.id}/')
+        communicator.scope['user'] = await make_user_async('mallory')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_removed_participant_cannot_keep_posting(self):
+        bob = await self.open_chat(self.bob)
+        await remove_participant(self.conversation, self.bob)
+        await bob.send_json_to({'type': 'send_message', 'client_id': 'c1', 'body': 'still here?'})
+        error = await bob.receive_json_from()
+        self.assertEqual(error['error'], 'You do not have access to this conversation')
+        self.assertEqual((await bob.receive_output())['type'], 'websocket.close')
+        self.assertEqual(await DirectMessage.objects.acount(), 0)
+
+    async def test_members_added_after_connect_are_notified(self):
+        alice = await self.open_chat(self.alice)
+        carol = await make_user_async('carol')
+        await add_participant(self.conversation, carol)
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        await layer.group_add(f'user_{carol.id}', channel)
+
+        await alice.send_json_to({'type': 'send_message', 'client_id': 'c1', 'body': 'welcome'})
+        await alice.receive_json_from()
+        self.assertEqual(await layer.receive(channel), {'type': 'new_message', 'delta': 1})
+        await alice.disconnect()
+
+
+async def make_user_async(username):
+    from asgiref.sync import sync_to_async
+    return await sync_to_async(make_user)(username)
+
+
+async def add_participant(conversation, user):
+    await conversation.participants.aadd(user)
+
+
+async def remove_participant(conversation, user):
+    await conversation.participants.aremove(user)
@@ -0,0 +1,73 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TransactionTestCase
+
+from base import consumers, routing
+from base.models import User
+
+from .helpers import make_conversation, make_user, send
+
+application = URLRouter(routing.websocket_urlpatterns)
+
+
+class UnreadCountSocketTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.conversation = make_conversation(self.alice, self.bob)
+
+    async def connect(self, user, unread=0):
+        communicator = WebsocketCommunicator(application, '/ws/notifications/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(await self.next_frame(communicator), {'type': 'unread_count', 'count': unread})
+        self.assertEqual((await self.next_frame(communicator))['type'], 'presence_snapshot')
+        return communicator
+
+    async def next_frame(self, communicator):
+        return await communicator.receive_json_from(timeout=2)
+
+    async def notify(self, user, event, times=1):
+        for _ in range(times):
+            await get_channel_layer().group_send(f'user_{user.id}', event)
+
+    async def set_unread(self, user, count):
+        await User.objects.filter(id=user.id).aupdate(unread_messages_count=count)
+
+    async def test_burst_is_pushed_as_one_frame_without_a_query(self):
+        bob = await self.connect(self.bob)
+        # Not read back: the deltas are trusted until the resync interval passes
+        await self.set_unread(self.bob, 40)
+        await self.notify(self.bob, {'type': 'new_message'}, times=5)
+        self.assertEqual(await self.next_frame(bob), {'type': 'unread_count', 'count': 5})
+        self.assertTrue(await bob.receive_nothing(consumers.UNREAD_PUSH_DELAY * 2))
+        await bob.disconnect()
+
+    async def test_changes_that_cancel_out_send_nothing(self):
+        bob = await self.connect(self.bob)
+        await self.notify(self.bob, {'type': 'new_message'})
+        await self.notify(self.bob, {'type': 'unread_changed', 'delta': -1})
+        self.assertTrue(await bob.receive_nothing(consumers.UNREAD_PUSH_DELAY * 3))
+        await bob.disconnect()
+
+    async def test_reading_the_conversation_pushes_zero(self):
+        for _ in range(2):
+            await sync_to_async(send)(self.conversation, self.alice)
+        bob = await self.connect(self.bob, unread=2)
+        await sync_to_async(self.conversation.direct_messages.mark_read_for)(self.bob)
+        self.assertEqual(await self.next_frame(bob), {'type': 'unread_count', 'count': 0})
+        await bob.disconnect()
+
+    async def test_count_is_reread_after_the_resync_interval(self):
+        bob = await self.connect(self.bob)
+        await self.set_unread(self.bob, 40)
+        with mock.patch.object(consumers, 'UNREAD_RESYNC_INTERVAL', 0):
+            await self.notify(self.bob, {'type': 'new_message'})
+            self.assertEqual(await self.next_frame(bob), {'type': 'unread_count', 'count': 40})
+        await bob.disconnect()
@@ -0,0 +1,160 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from base.models import DirectMessage, Message, Room
+from base.pagination import decode_cursor, encode_cursor, page_after, page_before
+
+from .helpers import make_conversation, make_user, plain_static, send
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.conversation = make_conversation(self.alice, self.bob)
+        now = timezone.now()
+        self.messages = []
+        for i in range(7):
+            message = send(self.conversation, self.alice, f'm{i}')
+            # Pairs share a timestamp so the id has to break ties
+            DirectMessage.objects.filter(pk=message.pk).update(created=now + timedelta(seconds=i // 2))
+            self.messages.append(DirectMessage.objects.get(pk=message.pk))
+        self.queryset = self.conversation.direct_messages.all()
+
+    def ids(self, rows):
+        return [row.id for row in rows]
+
+    def test_cursor_round_trip(self):
+        message = self.messages[3]
+        self.assertEqual(decode_cursor(encode_cursor(message)), (message.created, message.id))
+
+    def test_malformed_cursor_is_ignored(self):
+        for cursor in ('', 'abc', '12', '1_x', None, '99999999999999999999_1', '-99999999999999999999_1',
+                       '1_99999999999999999999'):
+            self.assertIsNone(decode_cursor(cursor))
+        rows, _ = page_before(self.queryset, cursor='nonsense', limit=3)
+        self.assertEqual(self.ids(rows), self.ids(self.messages[:-4:-1]))
+
+    def test_page_before_walks_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = page_before(self.queryset, cursor=cursor, limit=3)
+            seen += self.ids(rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.ids(reversed(self.messages)))
+
+    def test_last_page_has_no_cursor(self):
+        rows, cursor = page_before(self.queryset, limit=7)
+        self.assertEqual(len(rows), 7)
+        self.assertIsNone(cursor)
+
+    def test_page_after_returns_newer_rows_oldest_first(self):
+        rows, cursor = page_after(self.queryset, cursor=encode_cursor(self.messages[2]), limit=3)
+        self.assertEqual(self.ids(rows), self.ids(self.messages[3:6]))
+        self.assertEqual(cursor, encode_cursor(self.messages[5]))
+
+    def test_page_after_echoes_cursor_when_nothing_is_new(self):
+        cursor = encode_cursor(self.messages[-1])
+        self.assertEqual(page_after(self.queryset, cursor=cursor), ([], cursor))
+
+
+class ConversationMessagesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.conversation = make_conversation(self.alice, self.bob)
+        self.messages = [send(self.conversation, self.alice, f'm{i}') for i in range(5)]
+        self.url = reverse('conversation-messages', args=[self.conversation.id])
+
+    def test_older_page_oldest_first(self):
+        self.client.force_login(self.bob)
+        response = self.client.get(self.url, {'before': encode_cursor(self.messages[3])})
+        data = response.json()
+        self.assertEqual([m['id'] for m in data['messages']], [m.id for m in self.messages[:3]])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_outsider_is_refused(self):
+        self.client.force_login(make_user('mallory'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+@plain_static
+@mock.patch('base.views.ROOM_PAGE_SIZE', 3)
+class RoomMessagesTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.room = Room.objects.create(host=self.alice, name='room')
+        self.messages = [Message.objects.create(user=self.alice, room=self.room, body=f'm{i}') for i in range(5)]
+        self.url = reverse('room-messages', args=[self.room.id])
+        self.client.force_login(self.alice)
+
+    def bodies(self, html):
+        return sorted((html.index(m.body), m.body) for m in self.messages if m.body in html)
+
+    def test_newer_pages_until_caught_up(self):
+        data = self.client.get(self.url, {'after': encode_cursor(self.messages[0])}).json()
+        self.assertEqual([body for _, body in self.bodies(data['html'])], ['m3', 'm2', 'm1'])
+        self.assertTrue(data['has_more'])
+        self.assertEqual(data['next_cursor'], encode_cursor(self.messages[3]))
+
+        data = self.client.get(self.url, {'after': data['next_cursor']}).json()
+        self.assertEqual([body for _, body in self.bodies(data['html'])], ['m4'])
+        self.assertFalse(data['has_more'])
+        data = self.client.get(self.url, {'after': data['next_cursor']}).json()
+        self.assertEqual((self.bodies(data['html']), data['has_more']), ([], False))
+        self.assertEqual(data['next_cursor'], encode_cursor(self.messages[4]))
+
+    def test_older_page(self):
+        data = self.client.get(self.url, {'before': encode_cursor(self.messages[4])}).json()
+        self.assertEqual([body for _, body in self.bodies(data['html'])], ['m3', 'm2', 'm1'])
+        self.assertEqual(data['next_cursor'], encode_cursor(self.messages[1]))
+        self.assertNotIn('has_more', data)
+
+    def test_xhr_post_returns_the_message(self):
+        bob = make_user('bob')
+        self.client.force_login(bob)
+        url = reverse('room', args=[self.room.id])
+        response = self.client.post(url, {'body': 'hello'}, headers={'X-Requested-With': 'XMLHttpRequest'})
+        message = Message.objects.get(body='hello')
+        self.assertEqual(response.json(), {'success': True, 'id': message.id})
+        self.assertEqual((message.user, message.room), (bob, self.room))
+        self.assertIn(bob, self.room.participants.all())
+        self.assertRedirects(self.client.post(url, {'body': 'again'}), url, fetch_redirect_response=False)
+
+
+@plain_static
+class ActivityStreamTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        room = Room.objects.create(host=self.alice, name='room')
+        self.messages = [Message.objects.create(user=self.alice, room=room, body=f'm{i}') for i in range(5)]
+
+    def test_api_pages_newest_first(self):
+        data = self.client.get('/api/activity/', {'limit': 2}).json()
+        self.assertEqual([m['body'] for m in data['results']], ['m4', 'm3'])
+        data = self.client.get('/api/activity/', {'limit': 2, 'before': data['next_cursor']}).json()
+        self.assertEqual([m['body'] for m in data['results']], ['m2', 'm1'])
+
+    def test_api_ignores_out_of_range_cursor(self):
+        response = self.client.get('/api/activity/', {'limit': 2, 'before': '99999999999999999999_1'})
+        self.assertEqual([m['body'] for m in response.json()['results']], ['m4', 'm3'])
+
+    def test_api_limit_is_clamped(self):
+        for limit in ('0', '-3', 'x'):
+            response = self.client.get('/api/activity/', {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.json()['results'])
+
+    def test_feed_fragment_continues_from_cursor(self):
+        self.client.force_login(self.alice)
+        cursor = encode_cursor(self.messages[2])
+        with self.assertNumQueries(3):  # session, user, one page with authors and rooms
+            data = self.client.get(reverse('activity-feed'), {'before': cursor}).json()
+        self.assertIn('m1', data['html'])
+        self.assertNotIn('m2', data['html'])
+        self.assertIsNone(data['next_cursor'])
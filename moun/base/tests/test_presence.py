@@ -0,0 +1,192 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from base import routing
+from base.models import Follow, User
+from base.presence import ConnectionRegistry, PresenceBuffer, is_online, mutual_presence
+
+from .helpers import make_user
+
+application = URLRouter(routing.websocket_urlpatterns)
+
+
+class PresenceBufferTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        User.objects.update(last_activity=timezone.now() - timedelta(hours=1))
+        self.buffer = PresenceBuffer(throttle=30, flush_interval=15, flush_threshold=2)
+
+    def last_activity(self, user):
+        return User.objects.values_list('last_activity', flat=True).get(pk=user.pk)
+
+    def test_heartbeats_are_coalesced_until_the_threshold(self):
+        before = self.last_activity(self.alice)
+        self.assertTrue(self.buffer.record(self.alice.id, now=1000))
+        self.assertTrue(self.buffer.record(self.alice.id, now=1001))
+        self.assertEqual(self.last_activity(self.alice), before)
+        self.assertEqual(self.buffer.last_seen(self.alice.id).timestamp(), 1001)
+
+        with self.assertNumQueries(1):
+            self.buffer.record(self.bob.id, now=1002)
+        self.assertEqual(self.last_activity(self.alice).timestamp(), 1001)
+        self.assertEqual(self.last_activity(self.bob).timestamp(), 1002)
+        self.assertIsNone(self.buffer.last_seen(self.alice.id))
+
+    def test_written_users_are_throttled(self):
+        now = int(time.time())
+        self.buffer.record(self.alice.id, now=now)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertFalse(self.buffer.record(self.alice.id, now=now + 10))
+        self.assertTrue(self.buffer.record(self.alice.id, now=now + 31))
+
+    def test_flushes_once_the_interval_passed(self):
+        with mock.patch('base.presence.time.monotonic', return_value=time.monotonic() + 16):
+            self.buffer.record(self.alice.id, now=1000)
+        self.assertEqual(self.last_activity(self.alice).timestamp(), 1000)
+
+    def test_forget(self):
+        now = int(time.time())
+        self.buffer.record(self.alice.id, now=now)
+        self.buffer.forget(self.alice.id)
+        self.assertIsNone(self.buffer.last_seen(self.alice.id))
+        self.assertEqual(self.buffer.flush(), 0)
+        self.buffer.record(self.alice.id, now=now)
+        self.buffer.flush()
+        self.buffer.forget(self.alice.id)
+        self.assertTrue(self.buffer.record(self.alice.id, now=now + 1))
+
+    def test_disabled_buffer_keeps_nothing(self):
+        self.buffer.enabled = False
+        self.assertFalse(self.buffer.record(self.alice.id))
+        self.assertIsNone(self.buffer.last_seen(self.alice.id))
+        self.assertIsNone(self.buffer._flusher)
+
+    def test_failed_flush_is_retried(self):
+        now = int(time.time())
+        self.buffer.record(self.alice.id, now=now)
+        with mock.patch.object(User.objects, 'bulk_update', side_effect=DatabaseError), \
+                self.assertLogs('base.presence', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        # Still pending, and no longer throttled
+        self.assertEqual(self.buffer.last_seen(self.alice.id).timestamp(), now)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.last_activity(self.alice).timestamp(), now)
+
+
+class ConnectionRegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Two workers sharing one cache
+        self.one, self.two = ConnectionRegistry(timeout=60), ConnectionRegistry(timeout=60)
+
+    def test_transitions_across_workers(self):
+        self.assertTrue(self.one.connect(1))
+        self.assertFalse(self.two.connect(1))
+        self.assertFalse(self.one.disconnect(1))
+        self.assertTrue(self.two.is_connected(1))
+        self.assertTrue(self.two.disconnect(1))
+        self.assertFalse(self.one.is_connected(1))
+        self.assertTrue(self.one.connect(1))
+
+    def test_expired_count(self):
+        self.one.connect(1)
+        cache.delete(ConnectionRegistry.KEY.format(1))
+        self.assertFalse(self.two.is_connected(1))
+        self.assertTrue(self.two.disconnect(1))
+        self.assertTrue(self.two.connect(1))
+
+    def test_heartbeats_extend_the_count(self):
+        self.one.connect(1)
+        with mock.patch.object(cache, 'touch') as touch:
+            self.two.touch(1)
+        touch.assert_called_once_with(ConnectionRegistry.KEY.format(1), 60)
+
+    def test_connected(self):
+        self.one.connect(1)
+        self.two.connect(3)
+        self.two.connect(2)
+        self.two.disconnect(2)
+        self.assertEqual(self.one.connected([1, 2, 3, 4]), {1, 3})
+
+
+class MutualPresenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sockets_on_any_worker_count(self):
+        user, online, offline = make_user('ada'), make_user('bea'), make_user('cy')
+        with self.captureOnCommitCallbacks(execute=True):
+            for other in (online, offline):
+                Follow.objects.create(follower=user, followed=other)
+                Follow.objects.create(follower=other, followed=user)
+        # Neither has sent a heartbeat lately
+        User.objects.filter(id__in=[online.id, offline.id]).update(last_activity=timezone.now() - timedelta(hours=1))
+        ConnectionRegistry().connect(online.id)
+        presence = {entry['user_id']: entry['is_online'] for entry in mutual_presence(user)}
+        self.assertEqual(presence, {online.id: True, offline.id: False})
+
+
+class LogoutTests(TestCase):
+    def test_logout_marks_the_user_offline_and_keeps_counts(self):
+        cache.clear()
+        alice, bob = make_user('alice'), make_user('bob')
+        self.client.force_login(alice)
+        request_user = User.objects.get(pk=alice.pk)
+        Follow.objects.create(follower=bob, followed=alice)
+        with mock.patch('django.contrib.auth.get_user', return_value=request_user):
+            self.assertRedirects(self.client.get(reverse('logout')), reverse('login'), fetch_redirect_response=False)
+        alice.refresh_from_db()
+        self.assertFalse(is_online(alice))
+        self.assertEqual(alice.follower_count, 1)
+
+
+class PresenceSocketTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob, self.carol = make_user('alice'), make_user('bob'), make_user('carol')
+        Follow.objects.create(follower=self.alice, followed=self.bob)
+        Follow.objects.create(follower=self.bob, followed=self.alice)
+        # Carol follows Alice without being followed back
+        Follow.objects.create(follower=self.carol, followed=self.alice)
+        User.objects.update(last_activity=timezone.now() - timedelta(hours=1))
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(application, '/ws/notifications/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'unread_count')
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot['type'], 'presence_snapshot')
+        return communicator, {entry['user_id']: entry['is_online'] for entry in snapshot['users']}
+
+    async def test_mutuals_see_the_first_connect_and_the_last_disconnect(self):
+        bob, snapshot = await self.connect(self.bob)
+        self.assertEqual(snapshot, {self.alice.id: False})
+        carol, snapshot = await self.connect(self.carol)
+        self.assertEqual(snapshot, {})
+
+        alice, snapshot = await self.connect(self.alice)
+        self.assertEqual(snapshot, {self.bob.id: True})
+        online = {'type': 'presence', 'user_id': self.alice.id, 'is_online': True}
+        self.assertEqual(await bob.receive_json_from(), online)
+
+        # A second tab changes nothing for anyone
+        second_tab, _ = await self.connect(self.alice)
+        await second_tab.disconnect()
+        self.assertTrue(await bob.receive_nothing(0.2))
+
+        await alice.disconnect()
+        self.assertEqual(await bob.receive_json_from(), {**online, 'is_online': False})
+        self.assertTrue(await carol.receive_nothing(0.2))
+        await bob.disconnect()
+        await carol.disconnect()
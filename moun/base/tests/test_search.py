@@ -0,0 +1,102 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from base import search
+from base.models import Message, Room, Topic
+
+from .helpers import make_user, plain_static
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        if not search.fts_enabled():
+            self.skipTest('needs SQLite with FTS5')
+        self.host = make_user('host')
+        self.python = Topic.objects.create(name='Python')
+        self.cooking = Topic.objects.create(name='Cooking')
+
+    def room(self, name, description='', topic=None):
+        return Room.objects.create(host=self.host, name=name, description=description, topic=topic or self.cooking)
+
+    def names(self, queryset):
+        return [obj.name for obj in queryset]
+
+    def test_title_match_ranks_above_body_match(self):
+        self.room('Weekend plans', 'we talk about django every week')
+        self.room('Django girls')
+        self.assertEqual(self.names(search.search_rooms(Room.objects.all(), 'django')), ['Django girls', 'Weekend plans'])
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.room('Async django internals', topic=self.python)
+        self.room('Async cooking')
+        self.assertEqual(self.names(search.search_rooms(Room.objects.all(), 'asy djan')), ['Async django internals'])
+        # The topic name is part of a room's document
+        self.assertEqual(self.names(search.search_rooms(Room.objects.all(), 'pyth')), ['Async django internals'])
+
+    def test_no_match_is_empty(self):
+        self.room('Django girls')
+        self.assertFalse(search.search_rooms(Room.objects.all(), 'zzqq').exists())
+
+    def test_empty_query_returns_everything(self):
+        self.room('Django girls')
+        self.assertEqual(search.search_rooms(Room.objects.all(), '').count(), 1)
+
+    def test_query_without_words_keeps_substring_match(self):
+        self.room('Hello!!!')
+        self.room('Hello')
+        self.assertEqual(self.names(search.search_rooms(Room.objects.all(), '!!!')), ['Hello!!!'])
+        self.assertFalse(search.search_topics(Topic.objects.all(), '???').exists())
+
+    def test_results_are_limited_and_counted_in_sql(self):
+        Topic.objects.bulk_create([Topic(name=f'bulk topic {i}') for i in range(30)])
+        search.rebuild()
+        topics = search.search_topics(Topic.objects.all(), 'bulk')
+        self.assertEqual(topics.count(), 30)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(topics[:10]), 10)
+
+    def test_usable_as_subquery(self):
+        room = self.room('Django girls', topic=self.python)
+        Message.objects.create(user=self.host, room=room, body='hello')
+        messages = Message.objects.filter(room__topic__in=search.search_topics(Topic.objects.all(), 'python'))
+        self.assertEqual([m.body for m in messages], ['hello'])
+
+    def test_index_follows_edits_and_deletes(self):
+        room = self.room('Old name')
+        room.name = 'New name'
+        room.save()
+        self.assertFalse(search.search_rooms(Room.objects.all(), 'old').exists())
+        self.assertTrue(search.search_rooms(Room.objects.all(), 'new').exists())
+
+        self.cooking.name = 'Baking'
+        self.cooking.save()
+        self.assertTrue(search.search_rooms(Room.objects.all(), 'baking').exists())
+
+        room.delete()
+        self.assertFalse(search.search_rooms(Room.objects.all(), 'new').exists())
+
+    def test_message_search(self):
+        room = self.room('Django girls')
+        Message.objects.create(user=self.host, room=room, body='migrations are great')
+        Message.objects.create(user=self.host, room=room, body='templates')
+        found = search.search_messages(Message.objects.all(), 'migr')
+        self.assertEqual([m.body for m in found], ['migrations are great'])
+
+    def test_activity_api_search(self):
+        room = self.room('Django girls')
+        for body in ('migrations are great', 'templates', 'squashing migrations'):
+            Message.objects.create(user=self.host, room=room, body=body)
+        data = self.client.get('/api/activity/', {'q': 'migrations', 'limit': 1}).json()
+        self.assertEqual([m['body'] for m in data['results']], ['squashing migrations'])
+        data = self.client.get('/api/activity/', {'q': 'migrations', 'before': data['next_cursor']}).json()
+        self.assertEqual([m['body'] for m in data['results']], ['migrations are great'])
+        self.assertIsNone(data['next_cursor'])
+
+    @plain_static
+    def test_home_page_search(self):
+        self.room('Django girls', topic=self.python)
+        self.room('Soup')
+        response = self.client.get(reverse('home'), {'q': 'djan'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['room_count'], 1)
+        self.assertEqual(self.names(response.context['rooms']), ['Django girls'])
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from base.service_worker import ServiceWorkerScript
+
+from .helpers import plain_static
+
+
+@plain_static
+class ServiceWorkerTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = os.path.join(root, 'service-worker.js')
+        self.write(b'self.addEventListener("fetch", () => {});\n', mtime=1_000_000_000)
+        patcher = mock.patch('base.views.worker_script', ServiceWorkerScript(self.path))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, source, mtime):
+        with open(self.path, 'wb') as f:
+            f.write(source)
+        os.utime(self.path, ns=(mtime, mtime))
+
+    def test_script_has_a_strong_etag(self):
+        response = self.client.get(reverse('service-worker'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/javascript')
+        self.assertEqual(response['Service-Worker-Allowed'], '/')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertTrue(response['ETag'].startswith('"'))
+        body = response.content.decode()
+        self.assertTrue(body.startswith('const PRECACHE = {"version": '))
+        self.assertTrue(body.endswith('self.addEventListener("fetch", () => {});\n'))
+
+    def test_unchanged_script_is_not_modified(self):
+        etag = self.client.get(reverse('service-worker'))['ETag']
+        response = self.client.get(reverse('service-worker'), headers={'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+    def test_changed_source_is_rebuilt(self):
+        first = self.client.get(reverse('service-worker'))
+        version = self.client.get(reverse('service-worker-version')).json()['version']
+        self.write(b'self.skipWaiting();\n', mtime=2_000_000_000)
+
+        response = self.client.get(reverse('service-worker'), headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertTrue(response.content.endswith(b'self.skipWaiting();\n'))
+        new_version = self.client.get(reverse('service-worker-version')).json()['version']
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(response['ETag'].strip('"')[:16], new_version)
+
+    def test_version(self):
+        response = self.client.get(reverse('service-worker-version'))
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = self.client.get(reverse('service-worker'))['ETag']
+        self.assertEqual(response.json(), {'version': etag.strip('"')[:16]})
+
+    def test_missing_source(self):
+        os.remove(self.path)
+        self.assertEqual(self.client.get(reverse('service-worker')).status_code, 404)
+        response = self.client.get(reverse('service-worker-version'))
+        self.assertEqual((response.status_code, response.json()), (404, {'error': 'Service worker not found'}))
@@ -0,0 +1,140 @@
+import hashlib
+import os
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from base.models import DirectMessage
+
+from .helpers import MediaTestMixin, make_user
+
+
+async def read(response):
+    return b''.join([chunk async for chunk in response.streaming_content])
+
+
+class MediaServingTests(MediaTestMixin, TestCase):
+    media_settings = {'MEDIA_SENDFILE': None}
+
+    def setUp(self):
+        super().setUp()
+        self.content = bytes(range(256)) * 4
+        with self.captureOnCommitCallbacks(execute=True):
+            self.message, _ = DirectMessage.objects.create_once(
+                conversation=self.conversation, sender=self.alice,
+                file=ContentFile(self.content, name='clip.mp4'), file_type='document', file_name='clip.mp4',
+            )
+        self.url = self.message.file.url
+        self.etag = f'"{hashlib.sha256(self.content).hexdigest()}"'
+        self.client.force_login(self.bob)
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        body = async_to_sync(read)(response) if response.streaming else response.content
+        return response, body
+
+    def test_full_response(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+
+    def test_ranges(self):
+        cases = {
+            'bytes=0-99': (0, 99),
+            'bytes=1000-': (1000, 1023),
+            'bytes=-24': (1000, 1023),
+            'bytes=1000-5000': (1000, 1023),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header=header):
+                response, body = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(body, self.content[start:end + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1024')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=1024-', 'bytes=-0'):
+            with self.subTest(header=header):
+                response, _ = self.get(Range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_unsupported_ranges_get_the_whole_file(self):
+        for header in ('bytes=0-1,5-9', 'bytes=9-2', 'items=0-1'):
+            with self.subTest(header=header):
+                response, body = self.get(Range=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(body, self.content)
+
+    def test_if_range(self):
+        response, _ = self.get(Range='bytes=0-9', **{'If-Range': self.etag})
+        self.assertEqual(response.status_code, 206)
+        response, body = self.get(Range='bytes=0-9', **{'If-Range': '"stale"'})
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    def test_conditional_get(self):
+        response, body = self.get(**{'If-None-Match': self.etag})
+        self.assertEqual((response.status_code, body), (304, b''))
+        response, _ = self.get(**{'If-None-Match': '"other"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_head_has_no_body(self):
+        response = self.client.head(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+
+    def test_only_participants_can_read(self):
+        self.client.force_login(make_user('mallory'))
+        self.assertEqual(self.get()[0].status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.get()[0].status_code, 404)
+
+    def test_new_participant_can_read_after_commit(self):
+        carol = make_user('carol')
+        self.client.force_login(carol)
+        self.assertEqual(self.get()[0].status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.add(carol)
+        self.assertEqual(self.get()[0].status_code, 200)
+
+    def test_missing_and_traversal_paths_are_404(self):
+        for url in ('/images/blobs/00/00/missing.bin', '/images/../settings.py', '/images/blobs/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url)[0].status_code, 404)
+
+    def test_public_files_revalidate_and_use_a_content_hash(self):
+        with open(os.path.join(self.media_root, 'logo.txt'), 'wb') as f:
+            f.write(b'logo')
+        response, body = self.get('/images/logo.txt')
+        self.assertEqual(body, b'logo')
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(b"logo").hexdigest()}"')
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_transfer_offload(self):
+        response, body = self.get()
+        self.assertEqual(body, b'')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.message.file.name)
+
+    def test_post_is_refused(self):
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+class MediaLayoutTests(SimpleTestCase):
+    def test_media_is_not_a_static_file(self):
+        media_root = Path(settings.MEDIA_ROOT).resolve()
+        for static_dir in settings.STATICFILES_DIRS:
+            static_dir = Path(static_dir).resolve()
+            self.assertFalse(media_root.is_relative_to(static_dir) or static_dir.is_relative_to(media_root))
+        self.assertIsNotNone(finders.find('images/avatar.svg'))
+        self.assertIsNone(finders.find('images/chat_media/IMG_1123.jpeg'))
+        self.assertTrue((media_root / 'chat_media/IMG_1123.jpeg').exists())
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import sqlite_cache
+from base.follow_graph import VERSION_KEY, FollowGraph
+from base.presence import ConnectionRegistry
+from base.sqlite_cache import SQLiteCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = os.path.join(root, 'channels.sqlite3')
+        self.cache = self.worker()
+
+    def worker(self, **params):
+        """A cache on the shared database, standing in for a worker process"""
+        return SQLiteCache(self.path, params)
+
+    def in_parallel(self, function, workers=4, repeat=50):
+        caches = [self.worker() for _ in range(workers)]
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def run(cache):
+            barrier.wait()
+            results.extend(function(cache) for _ in range(repeat))
+
+        threads = [threading.Thread(target=run, args=(cache,)) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_get_set_delete(self):
+        self.cache.set('a', {'ids': [1, 2]})
+        self.assertEqual(self.worker().get('a'), {'ids': [1, 2]})
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.cache.get('missing', 0), 0)
+        self.assertTrue(self.cache.delete('a'))
+        self.assertFalse(self.cache.delete('a'))
+        self.assertFalse(self.cache.has_key('a'))
+
+    def test_get_many(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.assertEqual(self.cache.get_many([]), {})
+
+    def test_add(self):
+        self.assertTrue(self.cache.add('a', 1))
+        self.assertFalse(self.worker().add('a', 2))
+        self.assertEqual(self.cache.get('a'), 1)
+
+    def test_expiry(self):
+        with mock.patch('base.sqlite_cache.time.time', return_value=1000):
+            self.cache.set('a', 1, 10)
+            self.cache.set('b', 1, None)
+        with mock.patch('base.sqlite_cache.time.time', return_value=1011):
+            self.assertIsNone(self.cache.get('a'))
+            self.assertEqual(self.cache.get_many(['a', 'b']), {'b': 1})
+            self.assertFalse(self.cache.touch('a'))
+            with self.assertRaises(ValueError):
+                self.cache.incr('a')
+            # An expired entry does not block add
+            self.assertTrue(self.cache.add('a', 2, 10))
+            self.assertEqual(self.cache.get('a'), 2)
+
+    def test_touch(self):
+        with mock.patch('base.sqlite_cache.time.time', return_value=1000):
+            self.cache.set('a', 1, 10)
+            self.assertTrue(self.cache.touch('a', 60))
+        with mock.patch('base.sqlite_cache.time.time', return_value=1050):
+            self.assertEqual(self.cache.get('a'), 1)
+
+    def test_incr_and_decr(self):
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.incr('a'), 2)
+        self.assertEqual(self.worker().decr('a', 3), -1)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_concurrent_incr_is_not_lost(self):
+        self.cache.set('a', 0)
+        results = self.in_parallel(lambda cache: cache.incr('a'))
+        self.assertEqual(self.cache.get('a'), 200)
+        self.assertEqual(sorted(results), list(range(1, 201)))
+
+    def test_concurrent_add_has_one_winner(self):
+        results = self.in_parallel(lambda cache: cache.add('a', 1), repeat=1)
+        self.assertEqual(sorted(results), [False, False, False, True])
+
+    def test_cull(self):
+        cache = self.worker(OPTIONS={'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2})
+        with mock.patch('base.sqlite_cache.time.time', return_value=1000):
+            for n in range(6):
+                cache.set(f'k{n}', n, 100 + n)
+            cache.set('forever', 0, None)
+        with mock.patch.object(sqlite_cache, 'CULL_INTERVAL', 0), \
+                mock.patch('base.sqlite_cache.time.time', return_value=1101.5):
+            # k0 and k1 expired; of the six left, the three expiring soonest go
+            cache.set('new', 0, 100)
+            self.assertEqual(
+                cache.get_many(['k2', 'k3', 'k4', 'k5', 'forever', 'new']), {'k5': 5, 'forever': 0, 'new': 0}
+            )
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.worker().clear()
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_socket_counts_across_workers(self):
+        # Connections are per thread, so each thread locks like its own process
+        with mock.patch('base.presence.cache', self.cache):
+            registry = ConnectionRegistry(timeout=60)
+            results = self.in_parallel(lambda cache: (registry.connect(1), registry.disconnect(1)), repeat=25)
+            # Every socket that came also left, so the user ends offline
+            self.assertFalse(ConnectionRegistry().is_connected(1))
+        self.assertEqual([came for came, _ in results].count(True), [left for _, left in results].count(True))
+
+    def test_follow_graph_versions(self):
+        with mock.patch('base.follow_graph.cache', self.cache):
+            self.cache.set(VERSION_KEY.format(1), 0)
+            self.in_parallel(lambda cache: FollowGraph().invalidate(1), repeat=10)
+            self.assertEqual(self.cache.get(VERSION_KEY.format(1)), 40)
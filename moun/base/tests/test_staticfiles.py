@@ -0,0 +1,110 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from base.staticfiles import StaticFilesApp, accepted_encodings, compress
+
+CSS = b'body { color: teal; }\n' * 100
+
+
+class StaticFilesAppTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.write('styles/style.0123456789ab.css', CSS)
+        self.write('styles/style.css', CSS)
+        self.write('images/logo.png', b'\x89PNG tiny')
+        self.write('staticfiles.json', json.dumps({'paths': {'styles/style.css': 'styles/style.0123456789ab.css'}}).encode())
+        compress(os.path.join(self.root, 'styles/style.0123456789ab.css'))
+        # A stand-in for the .br sibling when the brotli package is missing
+        if not os.path.exists(os.path.join(self.root, 'styles/style.0123456789ab.css.br')):
+            self.write('styles/style.0123456789ab.css.br', b'brotli bytes')
+
+        with override_settings(STATIC_ROOT=self.root, STATIC_URL='static/'):
+            self.app = StaticFilesApp(self.fallback)
+        self.fallback_calls = []
+
+    def write(self, name, data):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    async def fallback(self, scope, receive, send):
+        self.fallback_calls.append(scope['path'])
+
+    async def request(self, path, method='GET', **headers):
+        scope = {
+            'type': 'http', 'method': method, 'path': path,
+            'headers': [(k.replace('_', '-').lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, None, send)
+        if not sent:
+            return None, {}, b''
+        return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body']
+
+    async def test_negotiates_the_smallest_accepted_encoding(self):
+        path = '/static/styles/style.0123456789ab.css'
+        status, headers, body = await self.request(path, accept_encoding='gzip, br')
+        self.assertEqual((status, headers[b'content-encoding']), (200, b'br'))
+        status, headers, body = await self.request(path, accept_encoding='gzip, br;q=0')
+        self.assertEqual(headers[b'content-encoding'], b'gzip')
+        self.assertEqual(gzip.decompress(body), CSS)
+        status, headers, body = await self.request(path, accept_encoding='identity')
+        self.assertNotIn(b'content-encoding', headers)
+        self.assertEqual(body, CSS)
+        self.assertEqual(headers[b'vary'], b'Accept-Encoding')
+        self.assertEqual(headers[b'content-type'], b'text/css')
+
+    async def test_hashed_names_are_immutable(self):
+        _, headers, _ = await self.request('/static/styles/style.0123456789ab.css')
+        self.assertIn(b'immutable', headers[b'cache-control'])
+        _, headers, _ = await self.request('/static/styles/style.css')
+        self.assertEqual(headers[b'cache-control'], b'public, no-cache')
+
+    async def test_etag_per_variant_and_304(self):
+        path = '/static/styles/style.0123456789ab.css'
+        _, gzip_headers, _ = await self.request(path, accept_encoding='gzip')
+        _, plain_headers, _ = await self.request(path)
+        self.assertNotEqual(gzip_headers[b'etag'], plain_headers[b'etag'])
+        status, headers, body = await self.request(path, accept_encoding='gzip', if_none_match=gzip_headers[b'etag'].decode())
+        self.assertEqual((status, body), (304, b''))
+        self.assertNotIn(b'content-length', headers)
+        status, _, _ = await self.request(path, if_none_match=gzip_headers[b'etag'].decode())
+        self.assertEqual(status, 200)
+
+    async def test_head_and_other_methods(self):
+        status, headers, body = await self.request('/static/images/logo.png', method='HEAD')
+        self.assertEqual((status, headers[b'content-length'], body), (200, b'9', b''))
+        self.assertNotIn(b'vary', headers)
+        status, headers, _ = await self.request('/static/images/logo.png', method='POST')
+        self.assertEqual((status, headers[b'allow']), (405, b'GET, HEAD'))
+
+    async def test_unknown_paths_fall_through(self):
+        for path in ('/static/missing.css', '/static/staticfiles.json', '/static/styles/style.css.gz', '/inbox/'):
+            self.assertIsNone((await self.request(path))[0])
+        self.assertEqual(len(self.fallback_calls), 4)
+
+
+class CompressTests(SimpleTestCase):
+    def test_small_and_binary_files_are_left_alone(self):
+        with tempfile.TemporaryDirectory() as root:
+            small, image = os.path.join(root, 'a.css'), os.path.join(root, 'a.png')
+            for path, data in ((small, b'a{}'), (image, b'\x00' * 4096)):
+                with open(path, 'wb') as f:
+                    f.write(data)
+                compress(path)
+            self.assertEqual(sorted(os.listdir(root)), ['a.css', 'a.png'])
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip, deflate, br;q=1.0'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(accepted_encodings('br;q=0, gzip;q=bad, *'), {'*'})
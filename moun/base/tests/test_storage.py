@@ -0,0 +1,146 @@
+import hashlib
+import os
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from base import storage
+from base.models import Blob, DirectMessage
+
+from .helpers import MediaTestMixin, make_conversation, make_user
+
+
+class BlobTestCase(MediaTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+    def send_file(self, content=b'same bytes', name='a.txt', sender=None, **fields):
+        message, _ = DirectMessage.objects.create_once(
+            conversation=self.conversation, sender=sender or self.alice,
+            file=ContentFile(content, name=name), file_type='document', file_name=name, **fields
+        )
+        return message
+
+    def delete(self, message):
+        with self.captureOnCommitCallbacks(execute=True):
+            message.delete()
+
+    def path(self, name):
+        return os.path.join(self.media_root, name)
+
+    def refs(self, name):
+        return Blob.objects.filter(name=name).values_list('ref_count', flat=True).first()
+
+
+class BlobStorageTests(BlobTestCase):
+    def test_identical_content_is_stored_once(self):
+        first, second = self.send_file(name='a.txt'), self.send_file(name='b.TXT')
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(first.file.name, storage.blob_name(digest, '.txt'))
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(self.refs(first.file.name), 2)
+
+    def test_last_release_deletes_the_file(self):
+        first, second = self.send_file(), self.send_file()
+        name = first.file.name
+        self.delete(first)
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(os.path.exists(self.path(name)))
+        self.delete(second)
+        self.assertIsNone(self.refs(name))
+        self.assertFalse(os.path.exists(self.path(name)))
+
+    def test_saving_known_content_rewrites_a_missing_file(self):
+        name = self.send_file().file.name
+        os.remove(self.path(name))
+        self.send_file()
+        self.assertTrue(os.path.exists(self.path(name)))
+        self.assertEqual(self.refs(name), 2)
+
+    def test_release_after_a_new_reference_keeps_the_file(self):
+        first = self.send_file()
+        name = first.file.name
+        # The release of the old reference only commits after a new one was saved
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+            self.send_file()
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(os.path.exists(self.path(name)))
+
+    def test_failed_insert_leaves_no_file_without_a_row(self):
+        kept = self.send_file(b'original', client_id='c1')
+        retry = self.send_file(b'different bytes', client_id='c1')
+        self.assertEqual(retry.id, kept.id)
+        orphan = storage.blob_name(hashlib.sha256(b'different bytes').hexdigest(), '.txt')
+        self.assertFalse(os.path.exists(self.path(orphan)))
+        self.assertIsNone(self.refs(orphan))
+        # Resending the same content keeps the stored blob
+        self.send_file(b'original', client_id='c1')
+        self.assertTrue(os.path.exists(self.path(kept.file.name)))
+        self.assertEqual(self.refs(kept.file.name), 1)
+
+    def test_avatar_changes_move_references(self):
+        first = ContentFile(b'avatar one', name='me.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.avatar = first
+            self.alice.save()
+        old = self.alice.avatar.name
+        self.assertEqual(self.refs(old), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.avatar = ContentFile(b'avatar two', name='me.png')
+            self.alice.save()
+        self.assertIsNone(self.refs(old))
+        self.assertFalse(os.path.exists(self.path(old)))
+        self.assertEqual(self.refs(self.alice.avatar.name), 1)
+
+    def test_purge_removes_files_without_rows(self):
+        kept = self.send_file()
+        stray = storage.blob_name('f' * 64, '.bin')
+        os.makedirs(os.path.dirname(self.path(stray)), exist_ok=True)
+        with open(self.path(stray), 'wb') as f:
+            f.write(b'stray')
+        os.utime(self.path(stray), (0, 0))
+        call_command('purge_orphan_blobs', stdout=StringIO())
+        self.assertFalse(os.path.exists(self.path(stray)))
+        self.assertTrue(os.path.exists(self.path(kept.file.name)))
+
+    def test_purge_spares_recent_files(self):
+        stray = storage.blob_name('e' * 64, '.bin')
+        os.makedirs(os.path.dirname(self.path(stray)), exist_ok=True)
+        open(self.path(stray), 'wb').close()
+        call_command('purge_orphan_blobs', stdout=StringIO())
+        self.assertTrue(os.path.exists(self.path(stray)))
+
+
+class SkipUploadTests(BlobTestCase):
+    def open_upload(self, user, content):
+        self.client.force_login(user)
+        conversation = make_conversation(user, self.bob)
+        response = self.client.post(
+            reverse('create-upload', args=[conversation.id]),
+            {'file_name': 'copy.txt', 'file_size': len(content), 'sha256': hashlib.sha256(content).hexdigest()},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_known_content_is_attached_without_upload(self):
+        self.send_file(b'shared bytes')
+        data = self.open_upload(self.bob, b'shared bytes')
+        self.assertTrue(data['complete'])
+        self.assertEqual(self.refs(DirectMessage.objects.last().file.name), 2)
+
+    def test_hash_of_unreadable_content_needs_an_upload(self):
+        self.send_file(b'private bytes')
+        data = self.open_upload(make_user('mallory'), b'private bytes')
+        self.assertFalse(data['complete'])
+        self.assertIsNotNone(data['upload_id'])
+
+    def test_find_ignores_unreferenced_blobs(self):
+        message = self.send_file(b'gone soon')
+        digest = hashlib.sha256(b'gone soon').hexdigest()
+        self.assertIsNotNone(storage.find(digest, self.bob))
+        Blob.objects.filter(name=message.file.name).update(ref_count=0)
+        self.assertIsNone(storage.find(digest, self.bob))
@@ -0,0 +1,86 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from base.models import DirectMessage, User
+
+from .helpers import make_conversation, make_user, send
+
+
+def unread(user):
+    return User.objects.values_list('unread_messages_count', flat=True).get(pk=user.pk)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob, self.carol = make_user('alice'), make_user('bob'), make_user('carol')
+        self.conversation = make_conversation(self.alice, self.bob, self.carol)
+
+    def test_message_counts_for_every_recipient_but_the_sender(self):
+        send(self.conversation, self.alice)
+        send(self.conversation, self.alice)
+        self.assertEqual((unread(self.alice), unread(self.bob), unread(self.carol)), (0, 2, 2))
+
+    def test_mark_read_for_releases_the_reader_once(self):
+        for _ in range(3):
+            send(self.conversation, self.alice)
+        updated = self.conversation.direct_messages.mark_read_for(self.bob)
+        self.assertEqual(updated, 3)
+        self.assertEqual(unread(self.bob), 0)
+        self.assertEqual(self.conversation.direct_messages.mark_read_for(self.bob), 0)
+
+    def test_deleting_unread_message_releases_it(self):
+        message = send(self.conversation, self.alice)
+        message.delete()
+        self.assertEqual((unread(self.bob), unread(self.carol)), (0, 0))
+
+    def test_deleting_the_conversation_releases_its_unread_messages(self):
+        send(self.conversation, self.alice)
+        send(self.conversation, self.bob)
+        cache.clear()  # members are loaded while the cascade runs
+        with mock.patch('base.messaging.push_unread_delta') as push:
+            self.conversation.delete()
+        self.assertEqual((unread(self.alice), unread(self.bob), unread(self.carol)), (0, 0, 0))
+        self.assertCountEqual(
+            [(set(call.args[0]), call.args[1]) for call in push.call_args_list],
+            [({self.bob.id, self.carol.id}, -1), ({self.alice.id, self.carol.id}, -1)],
+        )
+
+    def test_deleting_read_message_changes_nothing(self):
+        send(self.conversation, self.alice)
+        message = send(self.conversation, self.alice)
+        DirectMessage.objects.filter(pk=message.pk).update(is_read=True)
+        DirectMessage.objects.get(pk=message.pk).delete()
+        self.assertEqual(unread(self.bob), 2)
+
+    def test_saving_a_loaded_user_keeps_newer_counts(self):
+        bob = User.objects.get(pk=self.bob.pk)
+        send(self.conversation, self.alice)
+        bob.bio = 'updated'
+        bob.save()
+        self.assertEqual(unread(self.bob), 1)
+        self.assertEqual(User.objects.get(pk=self.bob.pk).bio, 'updated')
+
+    def test_counter_never_goes_negative(self):
+        self.bob.adjust_unread_messages_count(-5)
+        self.assertEqual(unread(self.bob), 0)
+        self.assertEqual(self.bob.unread_messages_count, 0)
+
+    def test_reconcile_recomputes_from_messages(self):
+        send(self.conversation, self.alice)
+        send(self.conversation, self.bob)
+        User.objects.update(unread_messages_count=7)
+        call_command('reconcile_unread_counts', stdout=StringIO())
+        self.assertEqual((unread(self.alice), unread(self.bob), unread(self.carol)), (1, 1, 2))
+
+    def test_api_reads_the_counter(self):
+        send(self.conversation, self.alice)
+        self.client.force_login(self.bob)
+        with self.assertNumQueries(2):  # session and user
+            response = self.client.get(reverse('api-unread-count'))
+        self.assertEqual(response.json(), {'count': 1})
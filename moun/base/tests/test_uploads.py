@@ -0,0 +1,170 @@
+import hashlib
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from base.models import DirectMessage, UploadSession
+from base.uploads import sniff_file_type
+
+from .helpers import MediaTestMixin, make_user
+
+
+def ftyp(brand):
+    return b'\x00\x00\x00\x20ftyp' + brand + b'\x00\x00\x02\x00isomiso2mp41'
+
+
+WEBM = b'\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01'
+
+
+class SniffFileTypeTests(SimpleTestCase):
+    def test_mp4_container(self):
+        cases = [
+            # Safari and other MP4 recorders name their files voice_<ts>.m4a
+            (b'isom', 'voice_1700000000000.m4a', 'voice'),
+            (b'mp42', 'voice_1700000000000.m4a', 'voice'),
+            (b'iso5', 'voice_1700000000000.m4a', 'voice'),
+            (b'M4A ', 'voice_1700000000000.m4a', 'voice'),
+            (b'M4A ', 'song.mp4', 'voice'),
+            (b'M4B ', 'book.bin', 'voice'),
+            (b'isom', 'memo.M4A', 'voice'),
+            (b'isom', 'clip.mp4', 'video'),
+            (b'mp42', 'clip.mov', 'video'),
+            (b'qt  ', 'clip.mov', 'video'),
+            (b'isom', '', 'video'),
+            (b'heic', 'photo.heic', 'image'),
+            (b'avif', 'voice_1.avif', 'image'),
+        ]
+        for brand, name, expected in cases:
+            with self.subTest(brand=brand, name=name):
+                self.assertEqual(sniff_file_type(ftyp(brand), name), expected)
+
+    def test_webm_container(self):
+        self.assertEqual(sniff_file_type(WEBM, 'voice_1700000000000.webm'), 'voice')
+        self.assertEqual(sniff_file_type(WEBM, 'Voice_1.webm'), 'voice')
+        self.assertEqual(sniff_file_type(WEBM, 'clip.webm'), 'video')
+        self.assertEqual(sniff_file_type(WEBM, ''), 'video')
+
+    def test_other_audio(self):
+        for head in (b'OggS\x00\x02', b'ID3\x04\x00', b'fLaC\x00', b'\xff\xfb\x90\x00', b'RIFF\x00\x00\x00\x00WAVEfmt '):
+            with self.subTest(head=head):
+                self.assertEqual(sniff_file_type(head, 'voice_1.ogg'), 'voice')
+                self.assertEqual(sniff_file_type(head, 'anything.bin'), 'voice')
+
+    def test_images_and_fallbacks(self):
+        self.assertEqual(sniff_file_type(b'\x89PNG\r\n\x1a\n\x00', 'voice_1.png'), 'image')
+        self.assertEqual(sniff_file_type(b'\xff\xd8\xff\xe0', 'a.jpg'), 'image')
+        self.assertEqual(sniff_file_type(b'RIFF\x00\x00\x00\x00WEBPVP8 ', 'a.webp'), 'image')
+        self.assertEqual(sniff_file_type(b'RIFF\x00\x00\x00\x00AVI LIST', 'a.avi'), 'video')
+        self.assertEqual(sniff_file_type(b'%PDF-1.7', 'voice_1.pdf'), 'document')
+        self.assertEqual(sniff_file_type(b'', 'voice_1.m4a'), 'document')
+
+
+class ChunkedUploadTests(MediaTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.alice)
+        self.data = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 40
+
+    def open(self, **fields):
+        response = self.client.post(
+            reverse('create-upload', args=[self.conversation.id]),
+            {'file_name': 'photo.png', 'file_size': len(self.data), **fields},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put(self, upload_id, offset, chunk, checksum=None):
+        return self.client.put(
+            reverse('upload-chunk', args=[upload_id]),
+            chunk,
+            content_type='application/octet-stream',
+            headers={
+                'Upload-Offset': str(offset),
+                'Upload-Checksum': f'sha256 {checksum or hashlib.sha256(chunk).hexdigest()}',
+            },
+        )
+
+    def test_upload_in_chunks_creates_one_message(self):
+        upload_id = self.open()['upload_id']
+        first = self.put(upload_id, 0, self.data[:4000])
+        self.assertEqual(first.json()['offset'], 4000)
+        last = self.put(upload_id, 4000, self.data[4000:])
+        data = last.json()
+        self.assertTrue(data['complete'])
+        self.assertEqual(data['message']['file_type'], 'image')
+
+        message = DirectMessage.objects.get()
+        with message.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(UploadSession.objects.get().message_id, message.id)
+
+    def test_wrong_offset_is_a_conflict_carrying_the_resume_point(self):
+        upload_id = self.open()['upload_id']
+        self.put(upload_id, 0, self.data[:4000])
+        for offset in (0, 3000, 5000):
+            response = self.put(upload_id, offset, self.data[offset:offset + 100])
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['offset'], 4000)
+        self.assertEqual(self.client.get(reverse('upload-chunk', args=[upload_id])).json()['offset'], 4000)
+
+    def test_bad_checksum_discards_the_chunk(self):
+        upload_id = self.open()['upload_id']
+        response = self.put(upload_id, 0, self.data[:4000], checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+        self.assertEqual(self.put(upload_id, 0, self.data[:4000]).status_code, 200)
+
+    def test_malformed_checksum_and_oversized_chunk(self):
+        upload_id = self.open()['upload_id']
+        response = self.client.put(
+            reverse('upload-chunk', args=[upload_id]), b'x', content_type='application/octet-stream',
+            headers={'Upload-Offset': '0', 'Upload-Checksum': 'md5 abc'},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.put(upload_id, 0, self.data + b'extra').status_code, 400)
+
+    def test_completed_upload_rejects_more_chunks(self):
+        upload_id = self.open()['upload_id']
+        self.put(upload_id, 0, self.data)
+        self.assertEqual(self.put(upload_id, 0, self.data).status_code, 409)
+        self.assertEqual(DirectMessage.objects.count(), 1)
+
+    def test_failed_completion_is_retried(self):
+        upload_id = self.open()['upload_id']
+        with mock.patch('base.views.complete_upload', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.put(upload_id, 0, self.data)
+        self.assertFalse(DirectMessage.objects.exists())
+
+        # The client resends its last chunk
+        data = self.put(upload_id, 0, self.data).json()
+        self.assertTrue(data['complete'])
+        message = DirectMessage.objects.get()
+        self.assertEqual(data['message']['id'], message.id)
+        status = self.client.get(reverse('upload-chunk', args=[upload_id])).json()
+        self.assertEqual((status['complete'], status['message']['id']), (True, message.id))
+
+    def test_status_completes_a_stored_upload(self):
+        upload_id = self.open()['upload_id']
+        with mock.patch('base.views.complete_upload', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.put(upload_id, 0, self.data)
+        data = self.client.get(reverse('upload-chunk', args=[upload_id])).json()
+        self.assertTrue(data['complete'])
+        self.assertEqual(data['message']['id'], DirectMessage.objects.get().id)
+
+    def test_only_the_uploader_sees_the_session(self):
+        upload_id = self.open()['upload_id']
+        self.client.force_login(self.bob)
+        self.assertEqual(self.put(upload_id, 0, self.data).status_code, 404)
+
+    def test_outsider_cannot_open_a_session(self):
+        self.client.force_login(make_user('mallory'))
+        response = self.client.post(
+            reverse('create-upload', args=[self.conversation.id]),
+            {'file_name': 'a.png', 'file_size': 10}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,167 @@
+"""
+Resumable chunked uploads for chat media.
+
+A client opens an UploadSession, then PUTs the file in order, one chunk per
+request, each with its offset and a SHA-256 checksum. Chunks are streamed
+onto a staging file, so no request holds more than a small buffer in memory,
+and an interrupted upload resumes from the session's `bytes_received`. Once
+the last byte arrives the staging file is saved into storage as a
+DirectMessage. The file type is sniffed from the first chunk's magic bytes.
+
+A client that sends the file's SHA-256 when opening the session skips the
+upload entirely if that content is already stored (see ``base.storage``).
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files import File
+
+from .membership import participant_ids
+from .messaging import send_direct_message
+from .storage import content_storage
+
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024  # 100MB, same as the multipart send
+CHUNK_SIZE = 2 * 1024 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+SNIFF_BYTES = 64
+READ_BLOCK = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_file_type(head, file_name=''):
+    """
+    Map the leading bytes of a file to a DirectMessage file_type.
+
+    MP4 and WebM/Matroska carry both recorded voice notes and video. Browsers
+    recording MP4 audio write generic brands such as ``isom`` or ``mp42``
+    rather than ``M4A``, so the ``voice_`` name prefix the recorder uses (or
+    an .m4a name) decides between them.
+    """
+    name = (file_name or '').lower()
+    if head.startswith((b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'BM')):
+        return 'image'
+    if head[:4] == b'RIFF':
+        return {b'WEBP': 'image', b'WAVE': 'voice', b'AVI ': 'video'}.get(head[8:12], 'document')
+    if head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand in (b'heic', b'heix', b'mif1', b'avif'):
+            return 'image'
+        if brand in (b'M4A ', b'M4B ') or name.startswith('voice_') or name.endswith(('.m4a', '.m4b')):
+            return 'voice'
+        return 'video'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'voice' if name.startswith('voice_') else 'video'
+    if head.startswith((b'OggS', b'ID3', b'fLaC')) or head[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2', b'\xff\xf1', b'\xff\xf9'):
+        return 'voice'
+    return 'document'
+
+
+def staging_path(session):
+    root = Path(getattr(settings, 'CHAT_UPLOAD_STAGING_DIR', settings.BASE_DIR / 'upload_staging'))
+    root.mkdir(parents=True, exist_ok=True)
+    return root / f'{session.id}.part'
+
+
+def parse_checksum(header):
+    """``"sha256 <hex digest>"`` -> hex digest"""
+    algorithm, _, digest = (header or '').strip().partition(' ')
+    if algorithm.lower() != 'sha256' or len(digest) != 64:
+        raise UploadError('Upload-Checksum must be "sha256 <hex digest>"')
+    return digest.lower()
+
+
+def write_chunk(session, offset, stream, length, checksum):
+    """
+    Append `length` bytes read from `stream` at `offset`.
+
+    The offset must equal the bytes received so far; a client that lost a
+    response gets a 409 carrying the offset to resume from. A chunk whose
+    SHA-256 does not match `checksum` is discarded.
+    """
+    from .models import UploadSession
+
+    if session.message_id:
+        raise UploadError('Upload is already complete', status=409)
+    if offset != session.bytes_received:
+        raise UploadError('Offset does not match the bytes received', status=409)
+    if not 0 < length <= MAX_CHUNK_SIZE or offset + length > session.file_size:
+        raise UploadError('Invalid chunk length')
+
+    digest = hashlib.sha256()
+    head = b''
+    path = staging_path(session)
+    with open(path, 'r+b' if path.exists() else 'wb') as part:
+        part.seek(offset)
+        part.truncate()
+        remaining = length
+        while remaining:
+            block = stream.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            if offset == 0 and len(head) < SNIFF_BYTES:
+                head += block[:SNIFF_BYTES - len(head)]
+            digest.update(block)
+            part.write(block)
+            remaining -= len(block)
+        if remaining or digest.hexdigest() != checksum:
+            part.seek(offset)
+            part.truncate()
+            raise UploadError('Chunk is incomplete or its checksum does not match')
+
+    fields = {'bytes_received': offset + length}
+    if offset == 0:
+        fields['file_type'] = sniff_file_type(head, session.file_name)
+    # Conditional on the offset so that a racing duplicate cannot advance it twice
+    if not UploadSession.objects.filter(pk=session.pk, bytes_received=offset).update(**fields):
+        raise UploadError('Offset does not match the bytes received', status=409)
+    for field, value in fields.items():
+        setattr(session, field, value)
+
+
+def complete(session):
+    """Turn a fully received upload into a DirectMessage and return its payload"""
+    path = staging_path(session)
+    with open(path, 'rb') as part:
+        message_data, _ = async_to_sync(send_direct_message)(
+            session.conversation_id,
+            session.uploader,
+            participant_ids(session.conversation_id) - {session.uploader_id},
+            # The session id makes a retried completion return the same message
+            client_id=f'upload:{session.id}',
+            reply_to_id=session.reply_to_id,
+            body=session.body or '',
+            file=File(part, name=session.file_name),
+            file_type=session.file_type or 'document',
+            file_name=session.file_name,
+            file_size=session.file_size,
+            voice_duration=session.voice_duration,
+        )
+    session.message_id = message_data['id']
+    session.save(update_fields=['message', 'updated'])
+    os.remove(path)
+    return message_data
+
+
+def send_stored_blob(conversation_id, sender, blob, file_name, **fields):
+    """Create a message for content the server already stores, skipping the upload"""
+    with content_storage.open(blob.name) as stored:
+        head = stored.read(SNIFF_BYTES)
+    message_data, _ = async_to_sync(send_direct_message)(
+        conversation_id,
+        sender,
+        participant_ids(conversation_id) - {sender.id},
+        file=blob.name,
+        file_type=sniff_file_type(head, file_name),
+        file_name=file_name,
+        file_size=blob.size,
+        **fields
+    )
+    return message_data
@@ -13,6 +13,7 @@ urlpatterns = [
 
     path('', views.home, name='home'),
     path('room/<str:pk>/', views.room, name='room'),
+    path('room/<str:pk>/messages/', views.room_messages, name='room-messages'),
     path('profile/<str:pk>/', views.userProfile, name='user-profile'),
 
 
@@ -33,20 +34,26 @@ urlpatterns = [
     path('get_follow_data/<int:pk>/', views.get_follow_data, name='get_follow_data'),    
 
     path('activity/', views.activityPage, name='activity'),
+    path('activity/feed/', views.activity_feed, name='activity-feed'),
 
     # Direct Messaging URLs
     path('inbox/', views.inbox, name='inbox'),
     path('conversation/<str:pk>/', views.conversation_detail, name='conversation'),
+    path('conversation/<str:pk>/messages/', views.conversation_messages, name='conversation-messages'),
+    path('conversation/<str:pk>/uploads/', views.create_upload, name='create-upload'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload-chunk'),
     path('start-conversation/<str:user_pk>/', views.start_conversation, name='start-conversation'),
     
     # API endpoint for polling unread messages
     path('api/unread-count/', views.api_unread_count, name='api-unread-count'),
+    path('api/ping/', views.ping, name='api-ping'),
 
     # Offline page
     path('offline/', views.offline_page, name='offline'),
     
     # Service Worker (must be at root for full site control)
     path('service-worker.js', views.service_worker, name='service-worker'),
+    path('service-worker/version/', views.service_worker_version, name='service-worker-version'),
 
 
     
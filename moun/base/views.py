@@ -1,18 +1,39 @@
+import json
+
+from asgiref.sync import async_to_sync
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.http import HttpResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth import authenticate, login, logout
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
-from django.conf import settings
-from .models import Room, Topic, Message, User, Follow, Conversation, DirectMessage
+from .models import Room, Topic, Message, User, Follow, Conversation, DirectMessage, UploadSession
+from .follow_graph import follow_graph
+from .membership import is_participant, participant_ids
+from .messaging import send_direct_message
 from .forms import RoomForm, UserForm, MyUserCreationForm
+from .pagination import encode_cursor, page_after, page_before
+from .presence import mark_offline, mutual_presence
+from .search import search_rooms, search_topics
+from .service_worker import worker_script
+from .uploads import (
+    CHUNK_SIZE, MAX_CHUNK_SIZE, MAX_UPLOAD_SIZE, SNIFF_BYTES, UploadError,
+    complete as complete_upload, parse_checksum, send_stored_blob, sniff_file_type, write_chunk,
+)
+from .storage import find as find_blob
 from django.views.decorators.http import require_http_methods
+from django.utils.cache import get_conditional_response
 # Create your views here.
 
+CONVERSATION_PAGE_SIZE = 50
+ROOM_PAGE_SIZE = 50
+ACTIVITY_PAGE_SIZE = 30
+ACTIVITY_SIDEBAR_SIZE = 10
+
 # rooms =[
 #     {'id':1, 'name':'Chanm 16'},
 #     {'id':2, 'name':'Politik'},
@@ -46,37 +67,20 @@ def loginPage(request):
 
 
 def check_user_status(request):
-    users_status = []
-    
-    # Get mutual followers (users who follow each other)
-    if request.user.is_authenticated:
-        # Get IDs of users who follow the current user
-        follower_ids = set(Follow.objects.filter(followed=request.user).values_list('follower_id', flat=True))
-        # Get IDs of users whom the current user follows
-        following_ids = set(Follow.objects.filter(follower=request.user).values_list('followed_id', flat=True))
-        # Find mutual followers (intersection)
-        mutual_follow_ids = follower_ids.intersection(following_ids)
-        # Only check status for mutual followers
-        users_to_check = User.objects.filter(id__in=mutual_follow_ids)
-    else:
-        # If not authenticated, return empty list
-        users_to_check = User.objects.none()
-    
-    for user in users_to_check:
-        last_activity = user.last_activity.timestamp() if user.last_activity else None
-        if last_activity:
-            is_online = timezone.now().timestamp() - last_activity < 80
-        else:
-            is_online = False
-        user_status = {'user_id': user.id, 'is_online': is_online}
-        users_status.append(user_status)
-    return JsonResponse(users_status, safe=False)
+    """Polling fallback for clients without a NotificationConsumer socket"""
+    if not request.user.is_authenticated:
+        return JsonResponse([], safe=False)
+    return JsonResponse(mutual_presence(request.user), safe=False)
+
+
+def ping(request):
+    """Lightweight health check for the offline banner"""
+    return HttpResponse(status=204)
 
 def lougoutUser(request):
-    # Clear last_activity to show user as offline immediately
+    # Show the user as offline immediately
     if request.user.is_authenticated:
-        request.user.last_activity = None
-        request.user.save()
+        mark_offline(request.user)
     logout(request)
     return redirect('login')
 
@@ -100,14 +104,13 @@ def registerPage(request):
 
 def home(request):
     q = request.GET.get('q') if request.GET.get('q') != None else ''
-    rooms = Room.objects.filter(
-        Q(topic__name__icontains=q) |
-        Q(name__icontains=q) |
-        Q(description__icontains=q)
-        )
-    topics = Topic.objects.all()[0:5]
+    rooms = search_rooms(Room.objects.for_feed(request.user), q)
+    topics = Topic.objects.all()[0:5]  # most popular, see Topic.Meta.ordering
     room_count = rooms.count()
-    room_messages = Message.objects.filter(Q(room__topic__name__icontains=q))
+    room_messages, _ = page_before(
+        Message.objects.for_activity().filter(room__topic__in=search_topics(Topic.objects.all(), q)),
+        limit=ACTIVITY_SIDEBAR_SIZE,
+    )
     context = {
         'rooms': rooms,
         'topics': topics,
@@ -118,9 +121,8 @@ def home(request):
 
 @login_required(login_url='login')
 def room(request, pk):
-    room = Room.objects.get(id=pk)
-    room_messages = room.message_set.all()
-    participants = room.participants.all()
+    room = Room.objects.select_related('host', 'topic').get(id=pk)
+    participants = list(room.participants.all())
 
     if request.method == 'POST': 
         message = Message.objects.create(
@@ -129,23 +131,55 @@ def room(request, pk):
             body = request.POST.get('body')
         )
         room.participants.add(request.user)
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'success': True, 'id': message.id})
         return redirect('room', pk = room.id)
 
-
+    room_messages, older_cursor = page_before(
+        room.message_set.select_related('user'),
+        limit=ROOM_PAGE_SIZE,
+    )
     context =  {
         'room': room,
         'room_messages': room_messages,
         'participants': participants,
+        'older_cursor': older_cursor,
+        'newest_cursor': encode_cursor(room_messages[0]) if room_messages else None,
         }
     return render(request, 'base/room.html', context)
 
+
+@login_required(login_url='login')
+def room_messages(request, pk):
+    """
+    Rendered threads for a room, newest first: `?after=<cursor>` returns what
+    was posted since the client's newest message, a page at a time with
+    `has_more` set while newer pages remain, `?before=<cursor>` the next
+    older page.
+    """
+    room = get_object_or_404(Room, id=pk)
+    messages_qs = room.message_set.select_related('user')
+    data = {}
+    if 'after' in request.GET:
+        page, next_cursor = page_after(messages_qs, cursor=request.GET.get('after'), limit=ROOM_PAGE_SIZE + 1)
+        data['has_more'] = len(page) > ROOM_PAGE_SIZE
+        if data['has_more']:
+            page = page[:ROOM_PAGE_SIZE]
+            next_cursor = encode_cursor(page[-1])
+        page.reverse()
+    else:
+        page, next_cursor = page_before(messages_qs, cursor=request.GET.get('before'), limit=ROOM_PAGE_SIZE)
+    data['html'] = render_to_string('base/room_messages_component.html', {'room_messages': page}, request=request)
+    data['next_cursor'] = next_cursor
+    return JsonResponse(data)
+
 def userProfile(request, pk):
     if not request.user.is_authenticated:
         return redirect('login')
     
     user = User.objects.get(id=pk)
-    rooms = user.room_set.all()
-    room_messages = user.message_set.all()
+    rooms = user.room_set.for_feed(request.user)
+    room_messages, _ = page_before(user.message_set.for_activity(), limit=ACTIVITY_SIDEBAR_SIZE)
     topics = Topic.objects.all()
     is_following = request.user.is_following(user)
     context ={
@@ -239,14 +273,16 @@ def updateUser(request):
     if request.method == 'POST':
         form = UserForm(request.POST, request.FILES, instance = user)
         if form.is_valid():
-            form.save()
+            # The avatar is stored and its blob reference counted together
+            with transaction.atomic():
+                form.save()
             return redirect('user-profile', pk=user.id)
     return render(request, 'base/update-user.html', {'form': form, 'user': user})
       
 
 def topicsPage(request):
     q = request.GET.get('q') if request.GET.get('q') != None else ''
-    topics = Topic.objects.filter(name__icontains=q)
+    topics = search_topics(Topic.objects.all(), q)
     return render(request,
                   'base/topics.html',
                    {'topics': topics},
@@ -254,8 +290,20 @@ def topicsPage(request):
 
 @login_required(login_url='login')
 def activityPage(request):
-    room_messages = Message.objects.all()
-    return render(request, 'base/activity.html', {'room_messages': room_messages})
+    room_messages, next_cursor = page_before(Message.objects.for_activity(), limit=ACTIVITY_PAGE_SIZE)
+    return render(request, 'base/activity.html', {'room_messages': room_messages, 'next_cursor': next_cursor})
+
+
+@login_required(login_url='login')
+def activity_feed(request):
+    """Infinite-scroll fragment: the activity page after the `before` cursor"""
+    room_messages, next_cursor = page_before(
+        Message.objects.for_activity(),
+        cursor=request.GET.get('before'),
+        limit=ACTIVITY_PAGE_SIZE,
+    )
+    html = render_to_string('base/activity_feed_component.html', {'room_messages': room_messages}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
 
 @login_required(login_url='login')
 def follow_user(request, pk):
@@ -267,30 +315,27 @@ def follow_user(request, pk):
         return JsonResponse({'error': 'A user cannot follow themselves.'}, status=400)
 
     # Check if the current user is following the user_to_follow
-    is_following = Follow.objects.filter(follower=current_user, followed=user_to_follow).exists()
+    is_following = follow_graph.is_following(current_user.id, user_to_follow.id)
 
     if request.method == 'POST':
-        if is_following:
-            # If the current user is already following the user, unfollow
-            Follow.objects.filter(follower=current_user, followed=user_to_follow).delete()
-            is_following = False
-        else:
-            # If the current user is not following the user, follow
-            Follow.objects.create(follower=current_user, followed=user_to_follow)
-            is_following = True
+        # The toggle is decided by the database rather than the cached graph,
+        # which can lag behind a follow made through another worker. Follow
+        # signals update counters and the mutual flag in the same transaction
+        with transaction.atomic():
+            unfollowed, _ = Follow.objects.filter(follower=current_user, followed=user_to_follow).delete()
+            if not unfollowed:
+                # A concurrent follow of the same pair is found instead of duplicated
+                Follow.objects.get_or_create(follower=current_user, followed=user_to_follow)
+            is_following = not unfollowed
+        user_to_follow.refresh_from_db(fields=['follower_count'])
 
-    # Get the number of followers of the user_to_follow
-    followers = Follow.objects.filter(followed=user_to_follow)
-    num_followers = followers.count()
-
-    return JsonResponse({user_to_follow.id: {'num_followers': num_followers, 'is_following': is_following}})
+    return JsonResponse({user_to_follow.id: {'num_followers': user_to_follow.follower_count, 'is_following': is_following}})
 
 
 @login_required(login_url='login')
 def get_follow_data(request, pk):
     user = User.objects.get(id=pk)
-    num_followers = Follow.objects.filter(followed=user).count()
-    is_following = Follow.objects.filter(follower=request.user, followed=user).exists()
+    num_followers = user.follower_count
 
     # Create a dictionary that includes only the fields you want to include in the response
     user_data = {
@@ -320,14 +365,14 @@ def leave_room(request, room_id):
 @login_required
 def inbox(request):
     """View all conversations for the logged-in user"""
-    conversations = request.user.conversations.all()
+    conversations = Conversation.objects.for_inbox(request.user)
     
     # Annotate with unread count and online status
     conversations_data = []
     for conv in conversations:
-        other_user = conv.get_other_participant(request.user)
-        last_msg = conv.last_message()
-        unread_count = conv.direct_messages.filter(is_read=False).exclude(sender=request.user).count()
+        other_user = conv.other_participants[0] if conv.other_participants else None
+        if other_user is None:
+            continue
         
         # Check if user is online (active within last 5 minutes)
         is_online = False
@@ -338,8 +383,8 @@ def inbox(request):
         conversations_data.append({
             'conversation': conv,
             'other_user': other_user,
-            'last_message': last_msg,
-            'unread_count': unread_count,
+            'last_message': conv.last_message,
+            'unread_count': conv.unread_count,
             'is_online': is_online
         })
     
@@ -353,12 +398,12 @@ def conversation_detail(request, pk):
     conversation = get_object_or_404(Conversation, id=pk)
     
     # Ensure the user is a participant
-    if request.user not in conversation.participants.all():
+    if not is_participant(conversation.id, request.user.id):
         messages.error(request, 'You do not have access to this conversation')
         return redirect('inbox')
     
     # Mark messages as read
-    conversation.direct_messages.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+    conversation.direct_messages.mark_read_for(request.user)
     
     # Handle message sending
     if request.method == 'POST':
@@ -378,94 +423,34 @@ def conversation_detail(request, pk):
             content_type = file.content_type if hasattr(file, 'content_type') else ''
             
             # File size limit: 100MB
-            MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB in bytes
-            if file_size > MAX_FILE_SIZE:
+            if file_size > MAX_UPLOAD_SIZE:
                 return JsonResponse({
                     'success': False,
                     'error': 'File size exceeds 100MB limit'
                 }, status=400)
             
-            # Check by file extension and content type
-            if file_name.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')) or content_type.startswith('image/'):
-                file_type = 'image'
-            elif file_name.endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm')) and not ('audio' in content_type or 'voice_' in file_name):
-                file_type = 'video'
-            elif file_name.endswith(('.mp3', '.wav', '.ogg', '.m4a', '.webm', '.aac', '.flac')) or content_type.startswith('audio/') or 'voice_' in file_name:
-                file_type = 'voice'
-            elif file_name.endswith(('.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.zip', '.rar', '.7z')):
-                file_type = 'document'
-            else:
-                # Default to document for unknown types
-                file_type = 'document'
+            # Detect the type from the file's magic bytes rather than its name
+            file_type = sniff_file_type(file.read(SNIFF_BYTES), file_name)
+            file.seek(0)
             
             print(f"[File Upload] File: {file_name_original}, Type: {content_type}, Detected: {file_type}, Size: {file_size} bytes")
         
         # Ensure either body or file is provided
         if body or file:
-            reply_to = None
-            if reply_to_id:
-                try:
-                    reply_to = DirectMessage.objects.get(id=reply_to_id, conversation=conversation)
-                except DirectMessage.DoesNotExist:
-                    pass
-            
-            message = DirectMessage.objects.create(
-                conversation=conversation,
-                sender=request.user,
+            # Store and fan out on the event loop in a single hop; the payload
+            # is built once and shared by both group sends and this response
+            message_data, _ = async_to_sync(send_direct_message)(
+                conversation.id,
+                request.user,
+                participant_ids(conversation.id) - {request.user.id},
+                client_id=request.POST.get('client_id', '')[:64] or None,
+                reply_to_id=reply_to_id,
                 body=body,
                 file=file,
                 file_type=file_type,
                 file_name=file_name_original,
                 file_size=file_size,
                 voice_duration=int(voice_duration) if voice_duration else None,
-                reply_to=reply_to
-            )
-            
-            # Send WebSocket notification to the recipient (for unread count)
-            from channels.layers import get_channel_layer
-            from asgiref.sync import async_to_sync
-            
-            other_user = conversation.get_other_participant(request.user)
-            channel_layer = get_channel_layer()
-            
-            # Send to recipient's notification channel (for message icon)
-            async_to_sync(channel_layer.group_send)(
-                f'user_{other_user.id}',
-                {
-                    'type': 'new_message',
-                }
-            )
-            
-            # Send to chat room (for real-time conversation updates)
-            message_data = {
-                'id': message.id,
-                'body': message.body,
-                'file_url': message.file.url if message.file else None,
-                'file_type': message.file_type,
-                'file_name': message.file_name,
-                'file_size': message.file_size,
-                'voice_duration': message.voice_duration,
-                'sender_id': message.sender.id,
-                'sender_username': message.sender.username,
-                'sender_avatar': message.sender.avatar.url if message.sender.avatar else None,
-                'created': message.created.strftime('%b %d, %I:%M %p'),
-                'reply_to': None
-            }
-            
-            if message.reply_to:
-                message_data['reply_to'] = {
-                    'id': message.reply_to.id,
-                    'body': message.reply_to.body,
-                    'file_type': message.reply_to.file_type,
-                    'sender_username': message.reply_to.sender.username
-                }
-            
-            async_to_sync(channel_layer.group_send)(
-                f'chat_{conversation.id}',
-                {
-                    'type': 'chat_message',
-                    'message': message_data
-                }
             )
             
             # Always return JSON for POST requests (modern approach)
@@ -477,17 +462,140 @@ def conversation_detail(request, pk):
             # Fallback for non-AJAX requests (direct form submission)
             return redirect('conversation', pk=pk)
     
-    messages_list = conversation.direct_messages.all()
+    page, older_cursor = page_before(
+        conversation.direct_messages.select_related('sender', 'reply_to__sender'),
+        limit=CONVERSATION_PAGE_SIZE,
+    )
+    messages_list = page[::-1]
     other_user = conversation.get_other_participant(request.user)
     
     context = {
         'conversation': conversation,
         'messages': messages_list,
-        'other_user': other_user
+        'other_user': other_user,
+        'older_cursor': older_cursor,
     }
     return render(request, 'base/conversation.html', context)
 
 
+@login_required
+def conversation_messages(request, pk):
+    """JSON page of messages older than the `before` cursor, oldest first"""
+    conversation = get_object_or_404(Conversation, id=pk)
+    if not is_participant(conversation.id, request.user.id):
+        return JsonResponse({'error': 'You do not have access to this conversation'}, status=403)
+    
+    page, older_cursor = page_before(
+        conversation.direct_messages.select_related('sender', 'reply_to__sender'),
+        cursor=request.GET.get('before'),
+        limit=CONVERSATION_PAGE_SIZE,
+    )
+    return JsonResponse({
+        'messages': [message.to_payload() for message in reversed(page)],
+        'next_cursor': older_cursor,
+    })
+
+
+@login_required
+@require_http_methods(['POST'])
+def create_upload(request, pk):
+    """
+    Open a resumable upload for a media message in a conversation. When the
+    optional `sha256` matches stored content the user can already read, the
+    message is created at once and no upload is needed.
+    """
+    conversation = get_object_or_404(Conversation, id=pk)
+    if not is_participant(conversation.id, request.user.id):
+        return JsonResponse({'error': 'You do not have access to this conversation'}, status=403)
+    
+    try:
+        data = json.loads(request.body)
+        file_name = str(data['file_name'])[:255]
+        file_size = int(data['file_size'])
+        voice_duration = int(data['voice_duration']) if data.get('voice_duration') else None
+        reply_to_id = int(data['reply_to_id']) if data.get('reply_to_id') else None
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'file_name and file_size are required'}, status=400)
+    if not file_name or not 0 < file_size <= MAX_UPLOAD_SIZE:
+        return JsonResponse({'error': 'File size exceeds 100MB limit'}, status=400)
+    
+    # Content the user can already read is attached without uploading it again
+    blob = find_blob(data.get('sha256'), request.user) if data.get('sha256') else None
+    if blob is not None and blob.size == file_size:
+        try:
+            message = send_stored_blob(
+                conversation.id,
+                request.user,
+                blob,
+                file_name,
+                client_id=str(data.get('client_id') or '')[:64] or None,
+                reply_to_id=reply_to_id,
+                body=data.get('body') or '',
+                voice_duration=voice_duration,
+            )
+        except FileNotFoundError:
+            pass  # released since it was found; upload it after all
+        else:
+            return JsonResponse({'upload_id': None, 'complete': True, 'message': message}, status=201)
+    
+    reply_to = conversation.direct_messages.filter(id=reply_to_id).first() if reply_to_id else None
+    
+    session = UploadSession.objects.create(
+        conversation=conversation,
+        uploader=request.user,
+        file_name=file_name,
+        file_size=file_size,
+        body=data.get('body') or '',
+        reply_to=reply_to,
+        voice_duration=voice_duration,
+    )
+    return JsonResponse({
+        'upload_id': str(session.id),
+        'complete': False,
+        'offset': 0,
+        'chunk_size': CHUNK_SIZE,
+        'max_chunk_size': MAX_CHUNK_SIZE,
+    }, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def upload_chunk(request, upload_id):
+    """
+    GET reports how far an upload got so the client can resume; PUT appends
+    the request body at the `Upload-Offset` header after checking it against
+    `Upload-Checksum: sha256 <hex digest>`. The response to the last chunk
+    carries the created message. If creating it failed after the last chunk
+    was stored, the next GET or PUT creates it instead.
+    """
+    session = get_object_or_404(UploadSession.objects.select_related('uploader'), id=upload_id, uploader=request.user)
+    
+    if request.method == 'PUT' and not (session.is_complete and not session.message_id):
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset and Content-Length are required'}, status=400)
+        try:
+            write_chunk(session, offset, request, length, parse_checksum(request.headers.get('Upload-Checksum')))
+        except UploadError as e:
+            return JsonResponse({'error': str(e), 'offset': session.bytes_received}, status=e.status)
+
+    if session.is_complete and not session.message_id:
+        # The upload's client_id makes a retried completion return the same message
+        return JsonResponse({'offset': session.bytes_received, 'complete': True, 'message': complete_upload(session)})
+    
+    message = None
+    if session.message_id:
+        message = DirectMessage.objects.select_related('sender', 'reply_to__sender').get(id=session.message_id).to_payload()
+    return JsonResponse({
+        'offset': session.bytes_received,
+        'file_size': session.file_size,
+        'complete': session.message_id is not None,
+        'message': message,
+    })
+
+
 @login_required
 def start_conversation(request, user_pk):
     """Start a new conversation with a user or redirect to existing one"""
@@ -496,31 +604,14 @@ def start_conversation(request, user_pk):
     if other_user == request.user:
         return JsonResponse({'error': 'You cannot message yourself'}, status=400)
     
-    # Check if the other user is following the current user
-    is_followed_by_receiver = Follow.objects.filter(follower=other_user, followed=request.user).exists()
-    
-    # Check if the current user is following the other user
-    is_following_receiver = Follow.objects.filter(follower=request.user, followed=other_user).exists()
-    
-    if not is_followed_by_receiver:
-        return JsonResponse({'error': f'{other_user.username} must follow you before you can send them a message'}, status=403)
-    
-    if not is_following_receiver:
+    # Messaging requires a mutual follow, answered from the cached follow graph
+    if not follow_graph.is_mutual(request.user.id, other_user.id):
+        if not follow_graph.is_following(other_user.id, request.user.id):
+            return JsonResponse({'error': f'{other_user.username} must follow you before you can send them a message'}, status=403)
         return JsonResponse({'error': f'You must follow {other_user.username} before you can send them a message'}, status=403)
     
-    # Check if conversation already exists
-    existing_conv = Conversation.objects.filter(
-        participants=request.user
-    ).filter(
-        participants=other_user
-    ).first()
-    
-    if existing_conv:
-        return JsonResponse({'success': True, 'redirect': f'/conversation/{existing_conv.id}/'})
-    
-    # Create new conversation
-    conversation = Conversation.objects.create()
-    conversation.participants.add(request.user, other_user)
+    # Existing thread or a new one, found through the canonical user pair
+    conversation, _ = Conversation.objects.get_or_create_direct(request.user, other_user)
     
     return JsonResponse({'success': True, 'redirect': f'/conversation/{conversation.id}/'})
 
@@ -528,12 +619,7 @@ def start_conversation(request, user_pk):
 @login_required
 def api_unread_count(request):
     """API endpoint for polling unread message count"""
-    unread_count = DirectMessage.objects.filter(
-        conversation__participants=request.user,
-        is_read=False
-    ).exclude(sender=request.user).count()
-    
-    return JsonResponse({'count': unread_count})
+    return JsonResponse({'count': request.user.unread_messages_count})
 
 
 def offline_page(request):
@@ -542,22 +628,29 @@ def offline_page(request):
 
 
 def service_worker(request):
-    """Serve service worker from root path"""
-    from django.http import HttpResponse
-    import os
-    
-    sw_path = os.path.join(settings.BASE_DIR, 'static', 'js', 'service-worker.js')
-    
+    """Serve service worker from root path, from memory with a strong ETag"""
     try:
-        with open(sw_path, 'r', encoding='utf-8') as f:
-            sw_content = f.read()
-        
-        response = HttpResponse(sw_content, content_type='application/javascript')
-        response['Service-Worker-Allowed'] = '/'
-        response['Cache-Control'] = 'no-cache'
-        return response
+        script = worker_script.get()
     except FileNotFoundError:
         return HttpResponse('Service worker not found', status=404)
+    
+    response = HttpResponse(script.body, content_type='application/javascript')
+    response['Service-Worker-Allowed'] = '/'
+    response['Cache-Control'] = 'no-cache'
+    response['ETag'] = script.etag
+    return get_conditional_response(request, etag=script.etag, response=response)
+
+
+def service_worker_version(request):
+    """Version of the current service worker, for cheap update checks"""
+    try:
+        script = worker_script.get()
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Service worker not found'}, status=404)
+    
+    response = JsonResponse({'version': script.version})
+    response['Cache-Control'] = 'no-cache'
+    return response
 
 
 def desktopLanding(request):
@@ -13,6 +13,7 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 from base import routing
+from base.staticfiles import StaticFilesApp
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moun.settings')
 
@@ -20,7 +21,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moun.settings')
 django_asgi_app = get_asgi_application()
 
 application = ProtocolTypeRouter({
-    "http": django_asgi_app,
+    # Collected static files are answered before Django's middleware runs
+    "http": StaticFilesApp(django_asgi_app),
     "websocket": AllowedHostsOriginValidator(
         AuthMiddlewareStack(
             URLRouter(
@@ -10,8 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
-from datetime import timedelta
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -76,12 +76,8 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = 'base.User'
 
-CELERY_BEAT_SCHEDULE = {
-    'check_user_status_every_8_minutes': {
-        'task': 'base.tasks.check_user_status_task',
-        'schedule': timedelta(minutes=1),
-    },
-}
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_BEAT_SCHEDULE = {}
 
 
 MIDDLEWARE = [
@@ -100,6 +96,16 @@ MIDDLEWARE = [
     # 'base.middleware.MobileOnlyMiddleware',  # <-- Redirect desktop users to landing page (DISABLED FOR DEBUGGING)
 ]
 
+# Presence: ActiveUserMiddleware buffers heartbeats and writes last_activity in batches
+PRESENCE_WRITE_THROTTLE = 30   # seconds between last_activity writes for one user
+PRESENCE_FLUSH_INTERVAL = 15   # seconds between bulk flushes
+PRESENCE_FLUSH_THRESHOLD = 200 # flush early once this many users are pending
+PRESENCE_ONLINE_WINDOW = 80    # seconds since the last heartbeat a user still counts as online
+
+# Users whose follow adjacency each worker keeps in memory (see base.follow_graph)
+FOLLOW_GRAPH_MAX_USERS = 10000
+FOLLOW_GRAPH_TTL = 30  # seconds before a cached user is reloaded even without a version change
+
 ROOT_URLCONF = 'moun.urls'
 
 TEMPLATES = [
@@ -125,10 +131,63 @@ WSGI_APPLICATION = 'moun.wsgi.application'
 ASGI_APPLICATION = 'moun.asgi.application'
 
 # Channels Layer (in-memory for development)
+# The in-memory layer only reaches sockets of the same process; run more than
+# one daphne worker with CHANNEL_LAYER=sqlite (one host, see base.channel_layer)
+# or CHANNEL_LAYER=redis (needs channels_redis). Chat events older than
+# `expiry` seconds are dropped rather than delivered late, and a socket that
+# falls `capacity` events behind stops receiving until it catches up.
+# Each option brings the cache its workers share, see CACHES below.
+CHANNEL_LAYER = os.environ.get('CHANNEL_LAYER', 'memory')
+CHANNEL_LAYER_PATH = os.environ.get('CHANNEL_LAYER_PATH', str(BASE_DIR / 'channels.sqlite3'))
+CHANNEL_LAYER_TUNING = {
+    'capacity': 200,
+    'expiry': 30,
+    'group_expiry': 86400,
+}
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
-    }
+        'memory': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+        'sqlite': {
+            'BACKEND': 'base.channel_layer.SQLiteChannelLayer',
+            'CONFIG': {
+                'path': CHANNEL_LAYER_PATH,
+                'poll_interval': 1.0,
+                **CHANNEL_LAYER_TUNING,
+            },
+        },
+        'redis': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [os.environ.get('CHANNEL_REDIS_URL', 'redis://localhost:6379/1')],
+                **CHANNEL_LAYER_TUNING,
+            },
+        },
+    }[CHANNEL_LAYER]
+}
+
+# Conversation members, media owners, follow-graph versions and open socket
+# counts live in the cache, so every worker must see the same one, and the
+# counters need an atomic add/incr across processes: the in-memory layer
+# keeps the per-process cache, the multi-worker layers come with a cache in
+# the channel layer's SQLite database (base.sqlite_cache) or the Redis
+# server. FileBasedCache does not fit, its add and incr are not atomic.
+CACHES = {
+    'default': {
+        'memory': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'sqlite': {
+            'BACKEND': 'base.sqlite_cache.SQLiteCache',
+            'LOCATION': CHANNEL_LAYER_PATH,
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+        'redis': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/2'),
+        },
+    }[CHANNEL_LAYER]
 }
 
 
@@ -184,8 +243,25 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static'
 ]
 
-MEDIA_ROOT = BASE_DIR / 'static/images'
-#STATIC_ROOT =
+# Outside STATICFILES_DIRS: uploads are only served through base.serving,
+# which checks that the requester may see them
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Filled by `manage.py build_static` and served by base.staticfiles.StaticFilesApp
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'base.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+
+# Partial files of resumable chat uploads (see base.uploads)
+CHAT_UPLOAD_STAGING_DIR = BASE_DIR / 'upload_staging'
+
+# Hand media transfers to the front server after authorization (see base.serving):
+# None, 'x-sendfile' (Apache, lighttpd) or 'x-accel-redirect' (nginx)
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
 
 # PWA Configuration
 # Ensure service worker and manifest are served with correct MIME types
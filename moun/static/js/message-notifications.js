@@ -8,6 +8,9 @@ class MessageNotifications {
         this.maxReconnectAttempts = 3;
         this.pollingInterval = null;
         this.usingPolling = false;
+        this.heartbeatInterval = null;
+        this.heartbeatDelay = 30000;
+        this.onlineUsers = new Set();
         
         this.connect();
     }
@@ -34,6 +37,8 @@ class MessageNotifications {
                     clearInterval(this.pollingInterval);
                     this.pollingInterval = null;
                 }
+                
+                this.startHeartbeat();
             };
             
             this.socket.onmessage = (event) => {
@@ -42,10 +47,23 @@ class MessageNotifications {
                 
                 if (data.type === 'unread_count') {
                     this.updateMessageIcon(data.count);
+                } else if (data.type === 'presence_snapshot') {
+                    this.onlineUsers = new Set(
+                        data.users.filter(user => user.is_online).map(user => user.user_id)
+                    );
+                    this.applyPresence();
+                } else if (data.type === 'presence') {
+                    if (data.is_online) {
+                        this.onlineUsers.add(data.user_id);
+                    } else {
+                        this.onlineUsers.delete(data.user_id);
+                    }
+                    this.applyPresence();
                 }
             };
             
             this.socket.onclose = (event) => {
+                this.stopHeartbeat();
                 console.error('[MessageNotifications] ❌ WebSocket closed!');
                 console.error('  Code:', event.code);
                 console.error('  Reason:', event.reason || 'No reason provided');
@@ -90,13 +108,60 @@ class MessageNotifications {
         
         // Initial check
         this.checkUnreadCount();
+        this.checkPresence();
         
-        // Poll every 5 seconds
+        // Poll every 5 seconds (presence every 30 seconds)
+        let ticks = 0;
         this.pollingInterval = setInterval(() => {
             this.checkUnreadCount();
+            if (++ticks % 6 === 0) {
+                this.checkPresence();
+            }
         }, 5000);
     }
 
+    startHeartbeat() {
+        this.stopHeartbeat();
+        this.heartbeatInterval = setInterval(() => {
+            if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+                this.socket.send(JSON.stringify({ type: 'heartbeat' }));
+            }
+        }, this.heartbeatDelay);
+    }
+
+    stopHeartbeat() {
+        if (this.heartbeatInterval) {
+            clearInterval(this.heartbeatInterval);
+            this.heartbeatInterval = null;
+        }
+    }
+
+    async checkPresence() {
+        try {
+            const response = await fetch('/check_user_status/', {
+                credentials: 'same-origin'
+            });
+            
+            if (response.ok) {
+                const data = await response.json();
+                this.onlineUsers = new Set(
+                    data.filter(user => user.is_online).map(user => user.user_id)
+                );
+                this.applyPresence();
+            }
+        } catch (error) {
+            console.error('[MessageNotifications] Presence polling error:', error);
+        }
+    }
+
+    applyPresence() {
+        // Avatars are tagged with either data-user-id or data-avatar-for
+        document.querySelectorAll('[data-user-id], [data-avatar-for]').forEach(avatar => {
+            const userId = parseInt(avatar.dataset.userId || avatar.dataset.avatarFor, 10);
+            avatar.classList.toggle('active', this.onlineUsers.has(userId));
+        });
+    }
+
     async checkUnreadCount() {
         try {
             const response = await fetch('/api/unread-count/', {
@@ -189,6 +254,7 @@ class MessageNotifications {
     }
 
     disconnect() {
+        this.stopHeartbeat();
         if (this.socket) {
             this.socket.close();
             this.socket = null;
@@ -199,7 +199,7 @@ class NetworkMonitor {
     async checkServerStatus() {
         try {
             // Try to fetch a lightweight endpoint
-            const response = await fetch('/check_user_status/', {
+            const response = await fetch('/api/ping/', {
                 method: 'GET',
                 cache: 'no-store'
             });
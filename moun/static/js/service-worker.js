@@ -1,5 +1,8 @@
+// PRECACHE ({version, critical, additional}) is prepended by views.service_worker
+// from the static files manifest, so the asset URLs are the content-hashed ones
+// and a deploy that changes any of them installs a fresh static cache.
 const CACHE_NAME = 'together-pwa-v7';
-const STATIC_CACHE = 'together-static-v7';
+const STATIC_CACHE = `together-static-${PRECACHE.version}`;
 const DYNAMIC_CACHE = 'together-dynamic-v7';
 const API_CACHE = 'together-api-v7';
 
@@ -15,26 +18,11 @@ let serverState = {
 const CRITICAL_ASSETS = [
   '/',
   '/offline/',
-  '/static/styles/style.css',
-  '/static/styles/pwa-install.css',
-  '/static/js/script.js',
-  '/static/js/offline-storage.js',
-  '/static/js/offline-integration.js',
-  '/static/js/pwa-install-prompt.js',
-  '/static/manifest.json',
-  '/static/images/avatar.svg',
-  '/static/images/logo.png',
+  ...PRECACHE.critical,
 ];
 
 // Additional assets to cache (non-critical)
-const ADDITIONAL_ASSETS = [
-  '/static/images/icons/android/android-launchericon-48-48.png',
-  '/static/images/icons/android/android-launchericon-72-72.png',
-  '/static/images/icons/android/android-launchericon-96-96.png',
-  '/static/images/icons/android/android-launchericon-144-144.png',
-  '/static/images/icons/android/android-launchericon-192-192.png',
-  '/static/images/icons/android/android-launchericon-512-512.png',
-];
+const ADDITIONAL_ASSETS = PRECACHE.additional;
 
 // Maximum number of items to cache per cache type
 const CACHE_LIMITS = {